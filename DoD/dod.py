@@ -27,6 +27,7 @@ class DoD:
 
     def __init__(self, network, store_client, csv_separator=","):
         self.aurum_api = API(network=network, store_client=store_client)
+        self.network = network
         self.paths_cache = dict()
         dpu.configure_csv_separator(csv_separator)
 
@@ -247,10 +248,15 @@ class DoD:
                 yield materialized_virtual_schema, attrs_to_project, view_metadata
                 continue  # to go to the next group
 
-            # Pre-check
-            # TODO: with a connected components index we can pre-filter many of those groups without checking
+            # Pre-check: tables in different connected components of the PKFK table graph never join
             #group_with_all_relations, join_path_groups = self.joinable(candidate_group, cache_unjoinable_pairs)
             max_hops = max_hops
+            if not self.network.table_reachability(Relation.PKFK).connected_all(candidate_group):
+                if 'unjoinable_candidate_group' not in perf_stats:
+                    perf_stats['unjoinable_candidate_group'] = 0
+                perf_stats['unjoinable_candidate_group'] += 1
+                print("Group: " + str(candidate_group) + " is Non-Joinable")
+                continue
             # We find the different join graphs that would join the candidate_group
             st_joinable = time.time()
             join_graphs = self.joinable(candidate_group, cache_unjoinable_pairs, max_hops=max_hops)
@@ -383,19 +389,30 @@ class DoD:
         paths_per_pair = defaultdict(list)
 
         table_combinations = [el for el in itertools.combinations(group_tables, 2)]
+        reachability = self.network.table_reachability(Relation.PKFK)
 
         for table1, table2 in tqdm(table_combinations):
             # Check if tables are already known to be unjoinable
             if (table1, table2) in cache_unjoinable_pairs.keys() or (table2, table1) in cache_unjoinable_pairs.keys():
                 continue  # FIXME FIXME FIXME
-            t1 = self.aurum_api.make_drs(table1)
-            t2 = self.aurum_api.make_drs(table2)
-            t1.set_table_mode()
-            t2.set_table_mode()
+            # Tables that are not within max_hops joins of each other are rejected without searching paths
+            if not reachability.reachable(table1, table2, max_hops):
+                cache_unjoinable_pairs[(table1, table2)] += 1
+                cache_unjoinable_pairs[(table2, table1)] += 1
+                continue
             # Check cache first, if not in cache then do the search
             # drs = self.are_paths_in_cache(table1, table2)
             paths = self.are_paths_in_cache(table1, table2)  # list of lists
             if paths is None:
+                # paths precomputed with the model
+                paths = reachability.get_paths(table1, table2, max_hops)
+                if paths is not None:
+                    self.place_paths_in_cache(table1, table2, paths)
+            if paths is None:
+                t1 = self.aurum_api.make_drs(table1)
+                t2 = self.aurum_api.make_drs(table2)
+                t1.set_table_mode()
+                t2.set_table_mode()
                 print("Finding paths between " + str(table1) + " and " + str(table2))
                 print("max hops: " + str(max_hops))
                 s = time.time()
@@ -18,9 +18,17 @@ from api.annotation import MRS
 
 class Algebra:
 
-    def __init__(self, network, store_client):
+    def __init__(self, network, store_client, lazy_provenance=False):
+        """
+        :param network: the FieldNetwork
+        :param store_client: the StoreHandler
+        :param lazy_provenance: if True, the DRSs built by this API, and the
+        ones it gets from the network, record their provenance and only build
+        its graph when it is read, e.g., by why, how, paths or ranking
+        """
         self._network = network
         self._store_client = store_client
+        self._lazy_provenance = lazy_provenance
         self.helper = Helper(network=network, store_client=store_client)
 
     """
@@ -43,7 +51,8 @@ class Algebra:
             keywords=kw, elasticfieldname=kw_type, max_hits=max_results)
 
         # materialize generator
-        drs = DRS([x for x in hits], Operation(OP.KW_LOOKUP, params=[kw]))
+        drs = DRS([x for x in hits], Operation(OP.KW_LOOKUP, params=[kw]),
+                  lazy_provenance=self._lazy_provenance)
         return drs
 
     def exact_search(self, kw: str, kw_type: KWType, max_results=10):
@@ -55,7 +64,8 @@ class Algebra:
             keywords=kw, elasticfieldname=kw_type, max_hits=max_results)
 
         # materialize generator
-        drs = DRS([x for x in hits], Operation(OP.KW_LOOKUP, params=[kw]))
+        drs = DRS([x for x in hits], Operation(OP.KW_LOOKUP, params=[kw]),
+                  lazy_provenance=self._lazy_provenance)
         return drs
 
     def search_content(self, kw: str, max_results=10) -> DRS:
@@ -75,17 +85,23 @@ class Algebra:
 
     def __neighbor_search(self,
                         input_data,
-                        relation: Relation):
+                        relation: Relation,
+                        top_k=None,
+                        min_score=None):
         """
         Given an nid, node, hit or DRS, finds neighbors with specified
         relation.
         :param nid, node tuple, Hit, or DRS:
+        :param top_k: if given, keeps the top_k neighbors with the highest
+        scores of each input field
+        :param min_score: if given, keeps the neighbors with a score of at
+        least min_score. Neither applies to relations from metadata
         """
         # convert whatever input to a DRS
         i_drs = self._general_to_drs(input_data)
 
         # prepare an output DRS
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self._lazy_provenance)
         o_drs = o_drs.absorb_provenance(i_drs)
 
         # get all of the table Hits in a DRS, if necessary.
@@ -94,25 +110,30 @@ class Algebra:
 
         # Check neighbors
         if not relation.from_metadata():
-            for h in i_drs:
-                hits_drs = self._network.neighbors_id(h, relation)
-                o_drs = o_drs.absorb(hits_drs)
+            hits_drs = self._network.neighbors_ids(i_drs, relation, top_k=top_k, min_score=min_score,
+                                                   lazy_provenance=self._lazy_provenance)
+            o_drs = o_drs.absorb(hits_drs)
         else:
             md_relation = self._relation_to_mdrelation(relation)
+            hits_drss = []
             for h in i_drs:
                 neighbors = self.md_search(h, md_relation)
-                hits_drs = self._network.md_neighbors_id(h, neighbors, relation)
-                o_drs = o_drs.absorb(hits_drs)
+                hits_drss.append(self._network.md_neighbors_id(
+                    h, neighbors, relation, lazy_provenance=self._lazy_provenance))
+            o_drs = o_drs.absorb_many(hits_drss)
         return o_drs
 
-    def content_similar_to(self, general_input):
-        return self.__neighbor_search(input_data=general_input, relation=Relation.CONTENT_SIM)
+    def content_similar_to(self, general_input, top_k=None, min_score=None):
+        return self.__neighbor_search(input_data=general_input, relation=Relation.CONTENT_SIM,
+                                      top_k=top_k, min_score=min_score)
 
-    def schema_similar_to(self, general_input):
-        return self.__neighbor_search(input_data=general_input, relation=Relation.SCHEMA_SIM)
+    def schema_similar_to(self, general_input, top_k=None, min_score=None):
+        return self.__neighbor_search(input_data=general_input, relation=Relation.SCHEMA_SIM,
+                                      top_k=top_k, min_score=min_score)
 
-    def pkfk_of(self, general_input):
-        return self.__neighbor_search(input_data=general_input, relation=Relation.PKFK)
+    def pkfk_of(self, general_input, top_k=None, min_score=None):
+        return self.__neighbor_search(input_data=general_input, relation=Relation.PKFK,
+                                      top_k=top_k, min_score=min_score)
 
     """
     TC API
@@ -138,50 +159,59 @@ class Algebra:
         self._assert_same_mode(drs_a, drs_b)
 
         # absorb the provenance of both a and b
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self._lazy_provenance)
         o_drs.absorb_provenance(drs_a)
         if drs_b != drs_a:
             o_drs.absorb_provenance(drs_b)
 
+        res_drss = []
         for h1, h2 in itertools.product(drs_a, drs_b):
 
             # there are different network operations for table and field mode
             res_drs = None
             if drs_a.mode == DRSMode.FIELDS:
                 res_drs = self._network.find_path_hit(
-                    h1, h2, relation, max_hops=max_hops)
+                    h1, h2, relation, max_hops=max_hops,
+                    lazy_provenance=self._lazy_provenance)
             else:
                 res_drs = self._network.find_path_table(
-                    h1, h2, relation, self, max_hops=max_hops, lean_search=lean_search)
+                    h1, h2, relation, self, max_hops=max_hops, lean_search=lean_search,
+                    lazy_provenance=self._lazy_provenance)
+
+            res_drss.append(res_drs)
 
-            o_drs = o_drs.absorb(res_drs)
+        o_drs = o_drs.absorb_many(res_drss)
 
         return o_drs
 
-    def __traverse(self, a: DRS, primitive, max_hops=2) -> DRS:
+    def __traverse(self, a: DRS, primitive, max_hops=2, max_results=None,
+                   workers=None, use_processes=False) -> DRS:
         """
         Conduct a breadth first search of nodes matching a primitive, starting
-        with an initial DRS.
+        with an initial DRS. Only the nodes found on a hop are expanded on the
+        next one.
         :param a: a nid, node, tuple, or DRS
         :param primitive: The element to search
         :max_hops: maximum number of rounds on the graph
+        :param max_results: if given, the search stops once this many nodes
+        are found
+        :param workers: if more than 1, large fringes are expanded by this
+        many threads, or processes if use_processes
         """
         a = self._general_to_drs(a)
 
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self._lazy_provenance)
 
         if a.mode == DRSMode.TABLE:
             raise ValueError(
                 'input mode DRSMode.TABLE not supported')
 
-        fringe = a
         o_drs.absorb_provenance(a)
-        while max_hops > 0:
-            max_hops = max_hops - 1
-            for h in fringe:
-                hits_drs = self._network.neighbors_id(h, primitive)
-                o_drs = self.union(o_drs, hits_drs)
-            fringe = o_drs  # grow the initial input
+        hits_drs = self._network.traverse(
+            a, primitive, max_hops, max_results=max_results,
+            workers=workers, use_processes=use_processes,
+            lazy_provenance=self._lazy_provenance)
+        o_drs = o_drs.absorb(hits_drs)
         return o_drs
 
     """
@@ -249,7 +279,7 @@ class Algebra:
                 general_input = [
                     self._general_to_drs(x) for x in general_input]
 
-                combined_drs = DRS([], Operation(OP.NONE))
+                combined_drs = DRS([], Operation(OP.NONE), lazy_provenance=self._lazy_provenance)
                 for drs in general_input:
                     combined_drs = self.union(combined_drs, drs)
                 general_input = combined_drs
@@ -278,7 +308,8 @@ class Algebra:
         # TODO: migrated from old ddapi as there's no good swap
         table = hit.source_name
         hits = self._network.get_hits_from_table(table)
-        drs = DRS([x for x in hits], Operation(OP.TABLE, params=[hit]))
+        drs = DRS([x for x in hits], Operation(OP.TABLE, params=[hit]),
+                  lazy_provenance=self._lazy_provenance)
         return drs
 
     def _general_to_drs(self, general_input) -> DRS:
@@ -295,7 +326,8 @@ class Algebra:
             return general_input
 
         if general_input is None:
-            general_input = DRS(data=[], operation=Operation(OP.NONE))
+            general_input = DRS(data=[], operation=Operation(OP.NONE),
+                                lazy_provenance=self._lazy_provenance)
 
         # Test for ints or strings that represent integers
         if self._represents_int(general_input):
@@ -304,7 +336,8 @@ class Algebra:
         # Test for strings that represent tables
         if isinstance(general_input, str):
             hits = self._network.get_hits_from_table(general_input)
-            general_input = DRS([x for x in hits], Operation(OP.ORIGIN))
+            general_input = DRS([x for x in hits], Operation(OP.ORIGIN),
+                                lazy_provenance=self._lazy_provenance)
 
         # Test for tuples that are not Hits
         if (isinstance(general_input, tuple) and
@@ -333,7 +366,6 @@ class Algebra:
         :param nid: int or string
         :return: DRS
         """
-        nid = str(nid)
         score = 0.0
         nid, db, source, field = self._network.get_info_for([nid])[0]
         hit = Hit(nid, db, source, field, score)
@@ -363,10 +395,12 @@ class Algebra:
         if table_mode:
             table = hit.source_name
             hits = self._network.get_hits_from_table(table)
-            drs = DRS([x for x in hits], Operation(OP.TABLE, params=[hit]))
+            drs = DRS([x for x in hits], Operation(OP.TABLE, params=[hit]),
+                      lazy_provenance=self._lazy_provenance)
             drs.set_table_mode()
         else:
-            drs = DRS([hit], Operation(OP.ORIGIN))
+            drs = DRS([hit], Operation(OP.ORIGIN),
+                      lazy_provenance=self._lazy_provenance)
 
         return drs
 
@@ -374,9 +408,9 @@ class Algebra:
         drs = self._general_to_drs(general_input)
 
         drs.set_fields_mode()
-        for h in drs:
-            fields_table = self._hit_to_drs(h, table_mode=True)
-            drs = drs.absorb(fields_table)
+        # collect the tables first, absorbing while iterating over drs would restart the iteration
+        fields_tables = [self._hit_to_drs(h, table_mode=True) for h in drs]
+        drs = drs.absorb_many(fields_tables)
 
         return drs
 
@@ -4,6 +4,7 @@ from collections import defaultdict
 from collections import OrderedDict
 from enum import Enum
 import binascii
+import itertools
 import networkx as nx
 import time
 import numpy as np
@@ -18,17 +19,42 @@ BaseHit = namedtuple(
     'Hit', 'nid, db_name, source_name, field_name, score', verbose=False)
 
 
+def nid_key(nid):
+    """
+    Field ids are int64 numbers, e.g., the crc32 of compute_field_id, but the store and users may
+    give them as strings
+    :param nid: a field id, as an int or a string
+    :return: the int form of nid, or nid itself if it is a string that is not an integer in canonical form
+    """
+    if type(nid) is int:
+        return nid
+    if isinstance(nid, str):
+        try:
+            key = int(nid)
+        except ValueError:
+            return nid
+        return key if str(key) == nid else nid
+    return int(nid)
+
+
 class Hit(BaseHit):
 
+    def __new__(cls, nid, db_name, source_name, field_name, score):
+        if type(nid) is not int:
+            nid = nid_key(nid)
+        return tuple.__new__(cls, (nid, db_name, source_name, field_name, score))
+
     def __hash__(self):
-        hsh = int(self.nid)
-        return hsh
+        return hash(self.nid)
 
     def __eq__(self, other):
         target_type = type(other)
         if target_type == int:
             if self.nid == other:
                 return True
+        elif target_type == str:
+            if self.nid == nid_key(other):
+                return True
         elif target_type == Hit:
             if self.nid == other.nid:
                 return True
@@ -134,81 +160,405 @@ class DRSMode(Enum):
     TABLE = 1
 
 
+def _annotate_edges(graph, labels, nodes):
+    for el in nodes:
+        if el not in graph:
+            continue
+        for src, tar in graph.in_edges(el):
+            edge_data = graph[src][tar]
+            for e in edge_data:  # we iterate over each edge
+                for label in labels:
+                    edge_data[e][label] = 1
+
+
+def _leaf_and_head(graph, node):
+    """
+    :return: (is leaf, is head) of node. Predecessors that are also successors do not count, and a node
+    without predecessors or successors is neither
+    """
+    suc = graph.succ[node]
+    pre = [p for p in graph.pred[node] if p not in suc]
+    if len(pre) == 0 and len(suc) == 0:
+        return False, False
+    return len(pre) == 0, len(suc) == 0
+
+
+def _is_own_origin(graph, leaf):
+    """
+    :return: True if a leaf in a cycle counts among the leafs with a path to it. A leaf only reaches
+    itself back through a self loop or one of its successors, and the path search that why() was
+    answered with does not follow paths with more edges than the graph has nodes - 1
+    """
+    return len(graph) > (1 if leaf in graph.succ[leaf] else 2)
+
+
+def _log_entries(log):
+    """
+    :return: the entries of log, oldest first. Nodes and edges added before anything else are grouped
+    in one ('block', nodes, edges) entry, as they compose like one graph
+    """
+    entries = []
+    while log is not None:
+        log, entry = log
+        entries.append(entry)
+    entries.reverse()
+    start = 0
+    while start < len(entries) and entries[start][0] == 'add':
+        start += 1
+    if start > 0:
+        block = ('block', [n for e in entries[:start] for n in e[1]], [e for e in entries[:start] for e in e[2]])
+        entries = [block] + entries[start:]
+    return entries
+
+
+def _inlines(entry):
+    """
+    :return: True if entry merges a log that only composes graphs, without annotations. Composing is
+    associative, so the entries of such a log can take the place of the merge
+    """
+    if entry[0] != 'merge' or not isinstance(entry[1], tuple) or len(entry[2]) > 0:
+        return False
+    return all(e[0] != 'add' and (e[0] != 'merge' or len(e[2]) == 0) for e in _log_entries(entry[1]))
+
+
+def _expanded_entries(log):
+    """
+    :return: iterator of the entries of log, where the merges of logs that only compose graphs are
+    replaced by the entries of these logs, without recursion, as unions of unions nest them deeply
+    """
+    stack = [iter(_log_entries(log))]
+    while len(stack) > 0:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+        elif _inlines(entry):
+            stack.append(iter(_log_entries(entry[1])))
+        else:
+            yield entry
+
+
+def _build_graph(log):
+    """
+    Builds the provenance graph recorded in log. The logs that it merges and can not be inlined are
+    built first, each once even if it is merged several times
+    """
+    if log is None:
+        return nx.MultiDiGraph()
+    built = dict()  # id of a log -> (log, its graph)
+    pending = [(log, False)]
+    while len(pending) > 0:
+        current, ready = pending.pop()
+        if id(current) in built:
+            continue
+        if ready:
+            built[id(current)] = (current, _compose_entries(_expanded_entries(current), built))
+            continue
+        pending.append((current, True))
+        for entry in _expanded_entries(current):
+            if entry[0] == 'merge' and isinstance(entry[1], tuple) and id(entry[1]) not in built:
+                pending.append((entry[1], False))
+    return built[id(log)][1]
+
+
+def _compose_entries(entries, built):
+    """
+    Builds the graph of the entries of a log, with the graphs of the logs it merges in built.
+    The result is the graph that composing the graphs one after the other gives, i.e.,
+    nx.compose(graph, other) for each merge: the same nodes in the same order, with the Hit of the
+    latest graph for each one, and the same successors in the same order with the same edges. But
+    each graph is only added, not copied, once
+    """
+    graph = nx.MultiDiGraph()  # all the edges, in the order composing adds them
+    composed = []  # nodes of the graphs composed on top of the previous ones
+    added = []  # nodes added in place
+    for entry in entries:
+        kind = entry[0]
+        if kind == 'add' or kind == 'block':
+            _, nodes, edges = entry
+            (added if kind == 'add' else composed).append(nodes)
+            graph.add_nodes_from(nodes)
+            graph.add_edges_from(edges)
+            continue
+        other = entry[1]
+        if other is None:
+            continue
+        if isinstance(other, tuple):
+            other = built[id(other)][1]
+        composed.append(other.nodes())
+        graph.add_nodes_from(other.nodes_iter())
+        graph.add_edges_from(other.edges_iter(keys=True, data=True))
+        if kind == 'merge':
+            _annotate_edges(graph, entry[2], entry[3])
+    # composing puts the nodes of the newer graph first, and nodes added in place go last
+    order = OrderedDict()
+    for nodes in itertools.chain(reversed(composed), added):
+        for node in nodes:
+            if node not in order:
+                order[node] = node
+    result = nx.MultiDiGraph()
+    result.add_nodes_from(order.keys())
+    result.add_edges_from((u, v, key, data) for u in order.keys()
+                          for v, keys in graph.succ[u].items() for key, data in keys.items())
+    return result
+
+
 class Provenance:
     """
     Nodes are Hit (only). Origin nodes are given a special Hit object too.
+    A lazy Provenance only records the operations that build the graph, and builds it the first time
+    it is read. The log is a chain of immutable (previous log, entry) pairs, so merging provenance
+    refers to the log of the other side instead of copying it.
     """
 
-    def __init__(self, data, operation):
-        self._p_graph = nx.MultiDiGraph()
+    def __init__(self, data, operation, lazy=False):
+        self._lazy = lazy
+        self._p_graph = None if lazy else nx.MultiDiGraph()
+        self._log = None
+        # True once the log of another Provenance refers to _p_graph, which then must not change
+        self._shared = False
+        # (is leaf, is head) of each node of the graph, in the order of the graph, and the lists of leafs
+        # and heads from it. Kept up to date as edges are added to a built graph
+        self._leafs_heads_index = None
+        self._cached_leafs_and_heads = (None, None)
         op = operation.op
         params = operation.params
         self.populate_provenance(data, op, params)
-        # cache for leafs and heads
-        self._cached_leafs_and_heads = (None, None)
 
-    def prov_graph(self):
-        self.invalidate_leafs_heads_cache()  # for safety invalidate cache
+    def is_lazy(self):
+        return self._lazy
+
+    def _graph(self):
+        """
+        :return: the provenance graph, built from the log the first time it is needed
+        """
+        if self._p_graph is None:
+            self._p_graph = _build_graph(self._log)
+            self._log = None
         return self._p_graph
 
+    def _own_graph(self):
+        """
+        :return: the provenance graph, copied first if the log of another Provenance refers to it
+        """
+        if self._shared:
+            self._p_graph = nx.compose(nx.MultiDiGraph(), self._graph())
+            self._shared = False
+        return self._graph()
+
+    def prov_graph(self):
+        self.invalidate_leafs_heads_cache()  # the caller may change the graph
+        return self._own_graph()
+
     def swap_p_graph(self, new):
         self.invalidate_leafs_heads_cache()  # for safety invalidate cache
         self._p_graph = new
+        self._log = None
+        self._shared = False
+
+    def snapshot(self):
+        """
+        :return: the log or the graph of this provenance, which later changes to it do not alter
+        """
+        if self._p_graph is None:
+            return self._log
+        self._shared = True
+        return self._p_graph
+
+    def _record(self, entry):
+        if self._p_graph is not None:
+            # already built, the log goes on from the graph
+            self._log = (None, ('graph', self.snapshot()))
+            self._p_graph = None
+        self._log = (self._log, entry)
+        self.invalidate_leafs_heads_cache()
 
     def populate_provenance(self, data, op, params):
         if op == OP.NONE:
             # This is a carrier DRS, skip
             return
         elif op == OP.ORIGIN:
-            for element in data:
-                self._p_graph.add_node(element)
+            self.add_edges(data, [])
         # We check operations that come with parameters
         elif op == OP.SCHNAME_LOOKUP or op == OP.ENTITY_LOOKUP or op == OP.KW_LOOKUP:
             global global_origin_id
             hit = Hit(global_origin_id, params[0], params[0], params[0], -1)
             global_origin_id += 1
-            self._p_graph.add_node(hit)
-            for element in data:  # now we connect the new node to data with the op
-                self._p_graph.add_node(element)
-                self._p_graph.add_edge(hit, element, op)
+            # now we connect the new node to data with the op
+            self.add_edges([hit] + list(data), [(hit, element, op, dict()) for element in data])
         else:  # This all come with a Hit parameter
             hit = params[0]  # get the hit that comes with the op otherwise
-            self._p_graph.add_node(hit)  # we add the param
-            for element in data:  # now we connect the new node to data with the op
-                self._p_graph.add_node(element)
-                self._p_graph.add_edge(hit, element, op)
-                self.invalidate_leafs_heads_cache()
+            # we add the param and connect it to data with the op
+            self.add_edges([hit] + list(data), [(hit, element, op, dict()) for element in data])
+
+    def add_edges(self, nodes, edges):
+        """
+        Adds nodes and edges to the provenance graph
+        :param nodes: list of Hit
+        :param edges: list of (Hit, Hit, op, dict of edge data)
+        """
+        if self._p_graph is None:
+            self._record(('add', nodes, edges))
+        else:
+            graph = self._own_graph()
+            graph.add_nodes_from(nodes)
+            graph.add_edges_from(edges)
+            self._update_leafs_heads(graph, nodes, edges)
+
+    def merge(self, other, labels=(), annotated=()):
+        """
+        Merges the provenance graph of other into this one
+        :param other: a Provenance
+        :param labels: labels set to 1 in the data of the edges into the annotated nodes
+        :param annotated: nodes whose incoming edges get the labels
+        """
+        self._record(('merge', other.snapshot(), labels, annotated))
+
+    def _leafs_heads(self):
+        """
+        :return: the index with (is leaf, is head) of each node, computed once for a built graph
+        """
+        if self._leafs_heads_index is None:
+            graph = self._graph()
+            self._leafs_heads_index = OrderedDict((node, _leaf_and_head(graph, node))
+                                                  for node in graph.nodes_iter())
+        return self._leafs_heads_index
+
+    def _update_leafs_heads(self, graph, nodes, edges):
+        """
+        Updates the index of leafs and heads after nodes and edges were added to graph. Only those nodes
+        and the ends of those edges can change
+        """
+        index = self._leafs_heads_index
+        if index is None:
+            return
+        touched = OrderedDict.fromkeys(nodes)
+        for edge in edges:
+            touched[edge[0]] = None
+            touched[edge[1]] = None
+        leafs, heads = self._cached_leafs_and_heads
+        for node in touched:
+            status = _leaf_and_head(graph, node)
+            previous = index.get(node)
+            if status == previous:
+                continue
+            index[node] = status
+            if previous is not None:
+                # a node changed, the lists are filtered again from the index when read
+                leafs, heads = None, None
+            elif leafs is not None:
+                # new nodes go last in the graph, and so in the lists
+                if status[0]:
+                    leafs.append(node)
+                if status[1]:
+                    heads.append(node)
+        self._cached_leafs_and_heads = (leafs, heads)
 
     def get_leafs_and_heads(self):
-        # Compute leafs and heads
-        if self._cached_leafs_and_heads[0] is not None and self._cached_leafs_and_heads[1] is not None:
-            return self._cached_leafs_and_heads[0], self._cached_leafs_and_heads[1]
-        leafs = []
-        heads = []
-        for node in self._p_graph.nodes():
-            pre = self._p_graph.predecessors(node)
-            suc = self._p_graph.successors(node)
-            no_cycles = set(pre) - set(suc)
-            pre = list(no_cycles)
-            if len(pre) == 0 and len(suc) == 0:
-                # FIXME
-                continue  # this should not happen anyway, what does it mean?
-            if len(pre) == 0:
-                leafs.append(node)
-            if len(suc) == 0:
-                heads.append(node)
-        #self._cached_leafs_and_heads = (leafs, heads)
-        return leafs, heads
+        if self._cached_leafs_and_heads[0] is None or self._cached_leafs_and_heads[1] is None:
+            index = self._leafs_heads()
+            leafs = [node for node, (is_leaf, _) in index.items() if is_leaf]
+            heads = [node for node, (_, is_head) in index.items() if is_head]
+            self._cached_leafs_and_heads = (leafs, heads)
+        return self._cached_leafs_and_heads
 
     def invalidate_leafs_heads_cache(self):
+        self._leafs_heads_index = None
         self._cached_leafs_and_heads = (None, None)
 
+    def compute_ancestors_of(self, a: Hit):
+        """
+        :return: set of the nodes with a path to a, which includes a only if it is in a cycle
+        """
+        graph = self._graph()
+        ancestors = set()
+        pending = [a]
+        while len(pending) > 0:
+            for p in graph.pred[pending.pop()]:
+                if p not in ancestors:
+                    ancestors.add(p)
+                    pending.append(p)
+        return ancestors
+
+    def compute_origins_of(self, a: Hit):
+        """
+        :return: list of the leafs with a path to a, found walking back from a instead of trying
+        every leaf
+        """
+        graph = self._graph()
+        if a not in graph:
+            return []
+        index = self._leafs_heads()
+        origins = [node for node in self.compute_ancestors_of(a) if index[node][0]]
+        if a in origins and not _is_own_origin(graph, a):
+            origins.remove(a)
+        return origins
+
+    def compute_certainty_and_coverage(self, elements):
+        """
+        Scores elements in one pass over the provenance graph in topological order. The certainty of a
+        node is its score plus the highest certainty among its predecessors, i.e., the sum of the scores
+        along the best path from an origin. Its coverage is the set of leafs with a path to it. Cycles
+        are collapsed first: their nodes share the leafs that reach any of them, and the edges within
+        a cycle are not followed for certainty
+        :param elements: Hits to score
+        :return: (leafs, dict of element -> (certainty, coverage)) where coverage is a bitarray with
+        the positions of the leafs set
+        """
+        graph = self._graph()
+        leafs, _ = self.get_leafs_and_heads()
+        leaf_position = {leaf: i for i, leaf in enumerate(leafs)}
+        condensed = nx.condensation(graph)
+        component_of = condensed.graph['mapping']
+        # the Hits of the nodes, as the edges may hold other Hits with the same id
+        members = defaultdict(list)
+        for node in graph.nodes_iter():
+            members[component_of[node]].append(node)
+        upstream = dict()  # node -> highest certainty among its predecessors, None if none
+        certainty = dict()  # node -> certainty
+        reached_from = dict()  # component -> leafs with a path to its nodes from outside
+        leaving = dict()  # component -> leafs with a path out of it
+        for c in nx.topological_sort(condensed):
+            reached = bitarray(len(leafs))
+            reached.setall(False)
+            for d in condensed.pred[c]:
+                reached |= leaving[d]
+            leaving[c] = reached.copy()
+            for node in members[c]:
+                if node in leaf_position:
+                    leaving[c][leaf_position[node]] = True
+                best = None
+                for p in graph.pred[node]:
+                    if component_of[p] != c and (best is None or certainty[p] > best):
+                        best = certainty[p]
+                upstream[node] = best
+                certainty[node] = float(node.score) if best is None else float(node.score) + best
+            cyclic = len(members[c]) > 1 or any(node in graph.succ[node] for node in members[c])
+            # in a cycle, every node has a path to the others
+            reached_from[c] = leaving[c] if cyclic else reached
+        scores = dict()
+        for el in elements:
+            if el not in graph:
+                coverage = bitarray(len(leafs))
+                coverage.setall(False)
+                scores[el] = (float(el.score), coverage)
+                continue
+            coverage = reached_from[component_of[el]].copy()
+            if el in leaf_position and not _is_own_origin(graph, el):
+                coverage[leaf_position[el]] = False
+            best = upstream[el]
+            scores[el] = (float(el.score) if best is None else float(el.score) + best, coverage)
+        return leafs, scores
+
     def compute_paths_from_origin_to(self, a: Hit, leafs=None, heads=None):
         if leafs is None and heads is None:
             leafs, heads = self.get_leafs_and_heads()
+        if a in self._graph():
+            # only the leafs with a path to a have paths to look for
+            ancestors = self.compute_ancestors_of(a)
+            leafs = [l for l in leafs if l in ancestors]
         all_paths = []
         for l in leafs:
-            paths = nx.all_simple_paths(self._p_graph, l, a)
+            paths = nx.all_simple_paths(self._graph(), l, a)
             all_paths.extend(paths)
         return all_paths
 
@@ -233,20 +583,20 @@ class Provenance:
         all_paths = []
         if a in leafs:
             for h in heads:
-                paths = nx.all_simple_paths(self._p_graph, a, h)
+                paths = nx.all_simple_paths(self._graph(), a, h)
                 all_paths.extend(paths)
         elif a in heads:
             for l in leafs:
-                paths = nx.all_simple_paths(self._p_graph, l, a)
+                paths = nx.all_simple_paths(self._graph(), l, a)
                 all_paths.extend(paths)
         else:
             upstreams = []
             for l in leafs:
-                paths = nx.all_simple_paths(self._p_graph, l, a)
+                paths = nx.all_simple_paths(self._graph(), l, a)
                 upstreams.extend(paths)
             downstreams = []
             for h in heads:
-                paths = nx.all_simple_paths(self._p_graph, a, h)
+                paths = nx.all_simple_paths(self._graph(), a, h)
                 downstreams.extend(paths)
 
             if len(downstreams) > len(upstreams):
@@ -284,7 +634,7 @@ class Provenance:
                 pair = p[idx::slice_range(idx)]
                 src, trg = pair
                 explanation = explanation + get_name_from_hit(src) + " -> "
-                edge_info = self._p_graph[src][trg]
+                edge_info = self._graph()[src][trg]
                 explanation = explanation + get_string_from_edge_info(edge_info) + " -> " \
                     + get_name_from_hit(trg) + '\n'
         return explanation
@@ -296,10 +646,16 @@ class DRS:
         CERTAINTY = 0
         COVERAGE = 1
 
-    def __init__(self, data, operation, lean_drs=False):
+    def __init__(self, data, operation, lean_drs=False, lazy_provenance=False):
+        """
+        :param data: list of Hit
+        :param operation: the Operation that produced data
+        :param lean_drs: if True, no provenance is kept
+        :param lazy_provenance: if True, the provenance graph is only built when it is read
+        """
         self._data = data
         if not lean_drs:
-            self._provenance = Provenance(data, operation)
+            self._provenance = Provenance(data, operation, lazy=lazy_provenance)
         self._table_view = []
         self._idx = 0
         self._idx_table = 0
@@ -310,6 +666,8 @@ class DRS:
         self._ranking_criteria = None
         self._chosen_rank = []
         self._origin_values_coverage = dict()
+        # (data, its length, set of data) to look up elements of data
+        self._data_members = None
 
     def __iter__(self):
         return self
@@ -390,9 +748,27 @@ class DRS:
     def size(self):
         return len(self.data)
 
+    def _contains(self, a):
+        """
+        :return: True if a is in data. Hits are looked up in a set of data, built again if data changes
+        """
+        if type(a) is not Hit:
+            return a in self._data  # ids compare equal to Hits but do not hash like them
+        members = self._data_members
+        if members is None or members[0] is not self._data or members[1] != len(self._data):
+            members = (self._data, len(self._data), set(self._data))
+            self._data_members = members
+        return a in members[2]
+
     def get_provenance(self):
         return self._provenance
 
+    def is_lazy_provenance(self, *others):
+        """
+        :return: True if the provenance of self, or of any of others, is lazy
+        """
+        return any(hasattr(d, '_provenance') and d._provenance.is_lazy() for d in (self,) + others)
+
     """
     Provenance functions
     """
@@ -416,49 +792,19 @@ class DRS:
         :param drs:
         :return:
         """
-        def annotate_union_edges(label):
-            # Find nodes that intersect (those that will contain add_edges)
-            my_data = set(self.data)
-            merging_data = set(drs.data)
-            disjoint = my_data.intersection(
-                merging_data)  # where a union is created
-            # Now find the incoming edges to these nodes in each of the drs's
-            node_and_edges = []
-            for el in disjoint:
-                input_edges1 = self._provenance.prov_graph().in_edges(el, data=True)
-                input_edges2 = drs._provenance.prov_graph().in_edges(el, data=True)
-                node_and_edges.append((input_edges1, input_edges2))
-            # Now locate the nodes in the merged prov graph and annotate edges
-            # with AND
-            for input1, input2 in node_and_edges:
-                for src1, tar1, dic1 in input1:
-                    # this is the edge information
-                    edge_data = merge[src1][tar1]
-                    for e in edge_data:  # we iterate over each edge
-                        # we assign the new metadata as data assigned to the
-                        # edge
-                        edge_data[e][label] = 1
-                for src2, tar2, dic2 in input2:
-                    edge_data = merge[src2][tar2]
-                    for e in edge_data:
-                        edge_data[e][label] = 1
-
         # Reset ranking
         self._ranked = False
-        # Get prov graph of merging
-        prov_graph_of_merging = drs.get_provenance().prov_graph()
-        # Compose into my prov graph
-        merge = nx.compose(self._provenance.prov_graph(),
-                           prov_graph_of_merging)
-
+        labels = []
         if annotate_and_edges:
-            annotate_union_edges('AND')
-
+            labels.append('AND')
         if annotate_or_edges:
-            annotate_union_edges('OR')
-
-        # Rewrite my prov graph to the new merged one and return
-        self._provenance.swap_p_graph(merge)
+            labels.append('OR')
+        # Find nodes that intersect (those that will contain add_edges), whose
+        # incoming edges are annotated with the labels
+        annotated = []
+        if len(labels) > 0:
+            annotated = set(self.data).intersection(set(drs.data))
+        self._provenance.merge(drs.get_provenance(), labels, annotated)
         return self
 
     def absorb(self, drs):
@@ -478,6 +824,27 @@ class DRS:
         self.absorb_provenance(drs)
         return self
 
+    def absorb_many(self, drss):
+        """
+        Merge all the input DRS into self, as absorbing them one after the other does, but with a single
+        union of the data. Loops collect their DRS and absorb them at the end with this
+        :param drss: iterable of DRS
+        :return:
+        """
+        drss = list(drss)
+        # Reset ranking
+        self._ranked = False
+        # Set union merge data, the Hit of the latest DRS wins as with absorb
+        new_data = set()
+        for drs in reversed(drss):
+            new_data.update(drs.data)
+        new_data.update(self.data)
+        self.set_data(list(new_data))
+        # Merge provenance, only recorded until the graph is read
+        for drs in drss:
+            self._provenance.merge(drs.get_provenance())
+        return self
+
     """
     Set operations
     """
@@ -485,7 +852,7 @@ class DRS:
     def intersection(self, drs):
         # Reset ranking
         self._ranked = False
-        result = DRS([], Operation(OP.NONE))
+        result = DRS([], Operation(OP.NONE), lazy_provenance=self.is_lazy_provenance(drs))
         new_data = []
         # FIXME: There are more efficient ways of doing this
         if drs.mode == DRSMode.TABLE:
@@ -514,7 +881,7 @@ class DRS:
     def union(self, drs):
         # Reset ranking
         self._ranked = False
-        result = DRS([], Operation(OP.NONE))
+        result = DRS([], Operation(OP.NONE), lazy_provenance=self.is_lazy_provenance(drs))
         merging_data = set(drs.data)
         my_data = set(self.data)
         new_data = merging_data.union(my_data)
@@ -531,7 +898,7 @@ class DRS:
     def set_difference(self, drs):
         # Reset ranking
         self._ranked = False
-        result = DRS([], Operation(OP.NONE))
+        result = DRS([], Operation(OP.NONE), lazy_provenance=self.is_lazy_provenance(drs))
         merging_data = set(drs.data)
         my_data = set(self.data)
         new_data = my_data - merging_data
@@ -600,16 +967,12 @@ class DRS:
         :return:
         """
         # Make sure a is in data
-        if a not in self.data:
+        if not self._contains(a):
             print("The result does not exist")
             return
 
-        # Calculate paths from a to leafs, in reverse order and return the
-        # leafs.
-        paths = self._provenance.compute_paths_from_origin_to(a)
-        origins = set()
-        for p in paths:
-            origins.add(p[0])
+        # Walk back from a to the leafs, and return them
+        origins = set(self._provenance.compute_origins_of(a))
         return list(origins)
 
     def how_id(self, a: int) -> [Hit]:
@@ -631,7 +994,7 @@ class DRS:
         :return:
         """
         # Make sure a is in data
-        if a not in self.data:
+        if not self._contains(a):
             print("The result does not exist")
             return
 
@@ -648,91 +1011,28 @@ class DRS:
     Ranking functions
     """
 
-    def _compute_certainty_scores(self, aggr_strategy=None):
+    def compute_ranking_scores(self):
         """
+        Computes the certainty and coverage scores of the data in one pass over the provenance graph.
         FIXME: scores being part of nodes instead of edges mean we cannot implement the
-        best aggregation method. Only one temporal one that works ok in practice.
-        :param aggregation:
+        best aggregation method. The certainty of an element is the sum of the scores along its best
+        path from an origin
         :return:
         """
-
-        def decide_path(pg, ns, nodes_already_visited):
-            """
-            Given n score_paths, it chooses one according to an aggregation strategy
-            :param pg:
-            :return:
-            """
-            if aggr_strategy is None:
-                max_score = 0
-                for n in ns:
-                    nodes_already_visited.add(n)
-                    score = get_score_continuous_path(pg, n, nodes_already_visited)
-                    if score > max_score:
-                        max_score = score
-            # FIXME: plug in here the logic for the other aggr strategies
-            return score
-
-        def get_score_continuous_path(pg, src, nodes_already_visited):
-            """
-            Traverse graph from src forming a score path
-            :param pg:
-            :param src:
-            :return:
-            """
-            current_score = float(src.score)
-            ns = [x for x in pg.neighbors(src) if x not in nodes_already_visited]  # skip already visited nodes
-            #ns = [x for x in pg.neighbors(src)]
-            if len(ns) == 1:
-                nodes_already_visited.add(ns[0])
-                current_score = current_score + get_score_continuous_path(pg, ns[0], nodes_already_visited)
-            elif len(ns) > 1:
-                current_score = current_score + decide_path(pg, ns, nodes_already_visited)
-            # Last option: when there are no neighbors, we simply return
-            # current_store
-            return current_score
-
-        # We reverse the provenance graph
-        pg = self._provenance.prov_graph().reverse()
-        nodes_already_visited = set()
-        # Compute recursively the certainty score for every result
-        for el in self.data:
-            if el not in nodes_already_visited:
-                score = get_score_continuous_path(pg, el, nodes_already_visited)
-                self._rank_data[el]['certainty_score'] = score
-
-    def _compute_coverage_scores(self):
+        st = time.time()
+        leafs, scores = self._provenance.compute_certainty_and_coverage(self.data)
+        # Assign index to original values
+        for i, origin in enumerate(leafs):
+            self._origin_values_coverage[origin] = i
         # Get total number of ORIGIN elements FIXME: (not KW, etc)
-        (leafs, _) = self._provenance.get_leafs_and_heads()
         total_number = len(leafs)
-
-        i = 0
-        for origin in leafs:
-            # Assign index to original values
-            self._origin_values_coverage[origin] = i
-            i += 1
-
         for el in self.data:
-            # initialize coverage set to False
-            coverage_set = bitarray(len(leafs))
-            coverage_set.setall(False)
-            # Get covered elements
-            elements = self.why(el)
-            for element_covered in elements:
-                idx = self._origin_values_coverage[element_covered]
-                coverage_set[idx] = True
-            coverage = float(len(elements)) / float(total_number)
+            certainty, coverage_set = scores[el]
+            self._rank_data[el]['certainty_score'] = certainty
+            coverage = float(coverage_set.count()) / float(total_number)
             self._rank_data[el]['coverage_score'] = (coverage, coverage_set)
-
-    def compute_ranking_scores(self):
-
-        st = time.time()
-        self._compute_certainty_scores()
-        et = time.time()
-        print("Time to compute certainty scores: " + str(et - st))
-        st = time.time()
-        self._compute_coverage_scores()
         et = time.time()
-        print("Time to compute coverage scores: " + str(et - st))
+        print("Time to compute ranking scores: " + str(et - st))
 
         self._ranked = True
 
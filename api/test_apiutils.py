@@ -1,8 +1,12 @@
+import random
 import unittest
+
+import networkx as nx
 from api.apiutils import DRS
 from api.apiutils import Operation
 from api.apiutils import OP
 from api.apiutils import Hit
+from api.apiutils import nid_key
 from ddapi import API
 
 
@@ -150,6 +154,28 @@ class TestApiutils(unittest.TestCase):
 
         self.assertTrue((lu - lm) == 0)
 
+    def test_absorb_many(self):
+        print(self._testMethodName)
+
+        h0 = Hit(10, "dba", "table_c", "v", -1)
+        drss = []
+        for i in range(5):
+            hits = [Hit(i * 2 + j, "dba", "table_a", str(i * 2 + j), i) for j in range(3)]
+            drss.append(DRS(hits, Operation(OP.CONTENT_SIM, params=[h0])))
+
+        one_by_one = DRS([h0], Operation(OP.ORIGIN))
+        for drs in drss:
+            one_by_one = one_by_one.absorb(drs)
+        at_once = DRS([h0], Operation(OP.ORIGIN)).absorb_many(drss)
+
+        # the Hit of the latest DRS wins, e.g., the score of 2 is the one of drss[1]
+        self.assertEqual(sorted(one_by_one.data), sorted(at_once.data))
+        self.assertEqual(1, [h for h in at_once.data if h.nid == 2][0].score)
+        one_by_one_graph = one_by_one.get_provenance().prov_graph()
+        at_once_graph = at_once.get_provenance().prov_graph()
+        self.assertEqual(one_by_one_graph.nodes(), at_once_graph.nodes())
+        self.assertEqual(one_by_one_graph.edges(keys=True, data=True), at_once_graph.edges(keys=True, data=True))
+
     def test_intersection(self):
         print(self._testMethodName)
 
@@ -270,6 +296,151 @@ class TestApiutils(unittest.TestCase):
 
         self.assertTrue(ld == 4)
 
+    def build_provenance(self, lazy):
+        h0 = Hit(10, "dba", "table_c", "v", -1)
+        h1 = Hit(0, "dba", "table_a", "a", 0.5)
+        h2 = Hit(1, "dba", "table_a", "b", 0.25)
+        h3 = Hit(2, "dba", "table_b", "c", 1)
+        h6 = Hit(16, "dba", "table_d", "a", 0.75)
+        h7 = Hit(17, "dba", "table_d", "b", 0.5)
+        origin = DRS([h0], Operation(OP.ORIGIN), lazy_provenance=lazy)
+        drs1 = DRS([h1, h2, h3], Operation(OP.CONTENT_SIM, params=[h0]), lazy_provenance=lazy)
+        drs1.absorb_provenance(origin)
+        drs2 = DRS([h6, h7, h3], Operation(OP.SCHEMA_SIM, params=[h2]))
+        drs3 = DRS([h3], Operation(OP.PKFK, params=[h7]), lazy_provenance=lazy)
+        drs = DRS([], Operation(OP.NONE), lazy_provenance=lazy)
+        drs = drs.absorb(drs1).absorb(drs2)
+        drs = drs.union(drs3).intersection(drs2)
+        # changes to the absorbed DRSs after the fact do not alter drs
+        drs2.absorb(DRS([h1], Operation(OP.PKFK, params=[h6])))
+        drs2.get_provenance().prov_graph().add_edge(h0, h6, OP.PKFK)
+        return drs
+
+    def test_lazy_provenance(self):
+        print(self._testMethodName)
+
+        eager = self.build_provenance(False)
+        lazy = self.build_provenance(True)
+        self.assertFalse(eager.is_lazy_provenance())
+        self.assertTrue(lazy.is_lazy_provenance())
+        self.assertIsNone(lazy.get_provenance()._p_graph)
+
+        self.assertEqual(eager.data, lazy.data)
+        eager_graph = eager.get_provenance().prov_graph()
+        lazy_graph = lazy.get_provenance().prov_graph()
+        self.assertEqual([tuple(n) for n in eager_graph.nodes()], [tuple(n) for n in lazy_graph.nodes()])
+        self.assertEqual(eager_graph.edges(keys=True, data=True), lazy_graph.edges(keys=True, data=True))
+        self.assertEqual(eager.paths(), lazy.paths())
+        for el in eager.data:
+            self.assertEqual(eager.why(el), lazy.why(el))
+        self.assertEqual(eager.rank_certainty()._chosen_rank, lazy.rank_certainty()._chosen_rank)
+
+        # the built graph is kept, and later operations are recorded on top of it
+        lazy.absorb(DRS([Hit(20, "dba", "table_e", "e", 1)], Operation(OP.PKFK, params=[lazy.data[0]])))
+        self.assertIsNone(lazy.get_provenance()._p_graph)
+        self.assertEqual(len(eager_graph.edges()) + 1, len(lazy.get_provenance().prov_graph().edges()))
+
+    def test_shared_provenance(self):
+        print(self._testMethodName)
+
+        h0 = Hit(0, "dba", "table_a", "a", -1)
+        o_drs = DRS([h0], Operation(OP.ORIGIN))
+        for i in range(1, 1500):
+            hits_drs = DRS([Hit(i, "dba", "table_b", str(i), 0.5)], Operation(OP.PKFK, params=[h0]))
+            o_drs = o_drs.union(hits_drs)
+        # merges refer to the merged provenance, the graph is built when read
+        self.assertIsNone(o_drs.get_provenance()._p_graph)
+        prov_graph = o_drs.get_provenance().prov_graph()
+        self.assertEqual(1500, len(prov_graph.nodes()))
+        self.assertEqual([h0, Hit(1499, "dba", "table_b", "1499", 0.5)], prov_graph.nodes()[:2])
+        self.assertEqual([h0], o_drs.why(Hit(7, "dba", "table_b", "7", 0.5)))
+
+    def test_leafs_and_heads(self):
+        print(self._testMethodName)
+
+        rnd = random.Random(0)
+        hits = [Hit(i, "dba", "table_a", str(i), 0.5) for i in range(30)]
+        drs = DRS(hits[:3], Operation(OP.ORIGIN))
+        provenance = drs.get_provenance()
+        provenance.get_leafs_and_heads()
+        for _ in range(40):
+            src = rnd.choice(hits)
+            tgts = rnd.sample(hits, 2)
+            provenance.add_edges([src] + tgts, [(src, tgt, OP.PKFK, dict()) for tgt in tgts])
+            # the index is updated with the new edges instead of dropped
+            self.assertIsNotNone(provenance._leafs_heads_index)
+            leafs, heads = [list(x) for x in provenance.get_leafs_and_heads()]
+            provenance.invalidate_leafs_heads_cache()
+            self.assertEqual((leafs, heads), provenance.get_leafs_and_heads())
+
+        graph = provenance._graph()
+        drs.set_data(graph.nodes())
+        for el in drs.data:
+            origins = set(p[0] for l in leafs for p in nx.all_simple_paths(graph, l, el))
+            self.assertEqual(origins, set(drs.why(el)))
+
+        # a swapped graph gets its own leafs and heads
+        new_graph = nx.MultiDiGraph()
+        new_graph.add_edge(hits[0], hits[1], OP.PKFK)
+        provenance.swap_p_graph(new_graph)
+        self.assertEqual(([hits[0]], [hits[1]]), provenance.get_leafs_and_heads())
+        self.assertEqual([hits[0]], drs.why(hits[1]))
+
+    def test_ranking(self):
+        print(self._testMethodName)
+
+        o1 = Hit(0, "dba", "table_a", "a", 1.0)
+        o2 = Hit(1, "dba", "table_a", "b", 0.5)
+        a = Hit(2, "dba", "table_b", "a", 0.5)
+        b = Hit(3, "dba", "table_b", "b", 0.25)
+        c = Hit(4, "dba", "table_c", "c", 1.0)
+        drs = DRS([a, b], Operation(OP.CONTENT_SIM, params=[o1]))
+        drs = drs.union(DRS([b], Operation(OP.PKFK, params=[o2])))
+        drs = drs.union(DRS([c], Operation(OP.PKFK, params=[b])))
+
+        # the certainty of an element follows its best path from an origin, whatever the order of data
+        drs.rank_certainty()
+        self.assertEqual([(c, 2.25), (a, 1.5), (b, 1.25)], drs._chosen_rank)
+        drs.set_data([b, a, c])
+        drs.rank_certainty()
+        self.assertEqual([(c, 2.25), (a, 1.5), (b, 1.25)], drs._chosen_rank)
+        drs.rank_coverage()
+        self.assertEqual([b, c, a], drs.data)
+        self.assertEqual(0.5, drs._rank_data[a]['coverage_score'][0])
+        self.assertEqual({o1, o2}, set(drs._origin_values_coverage))
+        for el in drs.data:
+            coverage_set = drs._rank_data[el]['coverage_score'][1]
+            self.assertEqual(set(drs.why(el)), set(o for o, i in drs._origin_values_coverage.items() if coverage_set[i]))
+
+        # layers where every node follows every node of the previous layer have 4^15 paths
+        layer = [Hit(i, "dba", "table_d", str(i), 0.25 * (i % 4)) for i in range(4)]
+        drs = DRS(layer, Operation(OP.ORIGIN))
+        for l in range(1, 16):
+            next_layer = [Hit(l * 4 + i, "dba", "table_d", str(l * 4 + i), 0.25 * i) for i in range(4)]
+            for h in layer:
+                drs = drs.union(DRS(next_layer, Operation(OP.PKFK, params=[h])))
+            layer = next_layer
+        drs.set_data(layer)
+        drs.rank_certainty()
+        self.assertEqual((layer[3], 15 * 0.75 + 0.75), drs._chosen_rank[0])
+        self.assertEqual(1.0, drs._rank_data[layer[0]]['coverage_score'][0])
+
+    def test_nid_key(self):
+        print(self._testMethodName)
+
+        self.assertEqual(3141592653, nid_key("3141592653"))
+        self.assertEqual(7, nid_key(7))
+        for nid in ["007", "+7", " 7", "abc"]:
+            self.assertEqual(nid, nid_key(nid))
+
+        h1 = Hit("12", "dba", "table_a", "a", -1)
+        h2 = Hit(12, "dba", "table_a", "a", -1)
+        self.assertEqual(12, h1.nid)
+        self.assertEqual(h1, h2)
+        self.assertEqual(h1, "12")
+        self.assertEqual(hash(h1), hash(h2))
+        self.assertEqual(1, len({h1, h2}))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -255,14 +255,17 @@ class AurumCLI(AurumWrapper):
         with open(self._make_ds_path(soure_name)) as f:
             print(f.read())
 
-    def explore_model(self, model_name):
+    def explore_model(self, model_name, create_reporting=False):
         """
         Initiates an interactive IPython session to run discovery queries.
+        The model is opened lazily and loaded in the background while the session starts.
 
         :param model_name:
+        :param create_reporting: compute the statistics of the model before starting the session
         :return:
         """
-        api, reporting = init_system(self._make_model_path(model_name).__str__() + '/', create_reporting=True)
+        api, reporting = init_system(self._make_model_path(model_name).__str__() + '/',
+                                     create_reporting=create_reporting, warm=True)
         IPython.embed()
 
 
@@ -0,0 +1,87 @@
+from knowledgerepr import fieldnetwork
+from knowledgerepr.fieldnetwork import FieldNetwork
+from api.apiutils import Relation
+import numpy as np
+
+import gc
+import random
+import time
+import tracemalloc
+
+
+"""
+Compares the networkx and CSR backends of FieldNetwork: memory used by the graph and latency of
+neighbors_id queries
+"""
+
+
+def generate_network(num_nodes, num_edges_per_relation, relations, seed=0):
+    """
+    Random network with string ids, as built from a store
+    """
+    rnd = random.Random(seed)
+    fn = FieldNetwork()
+    fn.init_meta_schema((str(i), "syndb", "synt" + str(i // 10), "synf" + str(i), 100, rnd.randint(1, 100), "T")
+                        for i in range(num_nodes))
+    for relation in relations:
+        for _ in range(num_edges_per_relation):
+            fn.add_relation(str(rnd.randrange(num_nodes)), str(rnd.randrange(num_nodes)), relation, rnd.random())
+    return fn
+
+
+def graph_memory(build):
+    """
+    :return: (result of build(), MB allocated by build and still alive afterwards)
+    """
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    result = build()
+    gc.collect()
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, (end - start) / 1024 / 1024
+
+
+def neighbor_query_times(network, nids, relations):
+    times = []
+    for nid in nids:
+        for relation in relations:
+            s = time.time()
+            network.neighbors_id(nid, relation)
+            e = time.time()
+            times.append(e - s)
+    return times
+
+
+def get_percentiles(l):
+    nq = np.array(l)
+    return np.percentile(nq, 5), np.percentile(nq, 50), np.percentile(nq, 95)
+
+
+def experiment_backends(sizes=(10000, 100000, 1000000), queries=1000):
+    relations = [Relation.SCHEMA_SIM, Relation.CONTENT_SIM, Relation.PKFK]
+    perf_results = dict()
+    for size in sizes:
+        # The fields (id_info and table_ids) are shared by both backends: the memory of the networkx
+        # network includes them, the CSR one is only the graph
+        fn, nx_mb = graph_memory(lambda: generate_network(size, 3 * size, relations))
+        csr_fn, csr_mb = graph_memory(lambda: fieldnetwork.to_csr_network(fn, copy_fields=False))
+
+        rnd = random.Random(0)
+        nids = rnd.sample(list(fn.iterate_ids()), min(queries, size))
+        nx_times = neighbor_query_times(fn, nids, relations)
+        csr_times = neighbor_query_times(csr_fn, nids, relations)
+        perf_results[size] = (nx_mb, csr_mb, get_percentiles(nx_times), get_percentiles(csr_times))
+    return perf_results
+
+
+if __name__ == "__main__":
+
+    results = experiment_backends()
+    print("# nodes networkx_mb csr_mb networkx_query_p5/p50/p95_us csr_query_p5/p50/p95_us")
+    for k, v in sorted(results.items()):
+        nx_mb, csr_mb, nx_p, csr_p = v
+        print(" ".join([str(k), "{0:.1f}".format(nx_mb), "{0:.1f}".format(csr_mb),
+                        "/".join("{0:.1f}".format(p * 1e6) for p in nx_p),
+                        "/".join("{0:.1f}".format(p * 1e6) for p in csr_p)]))
@@ -0,0 +1,49 @@
+from knowledgerepr import fieldnetwork
+from api.apiutils import Relation
+from benchmarking.graph_backend_benchmarks import generate_network, get_percentiles
+
+import random
+import time
+
+
+"""
+Latency of find_path_hit between random pairs of fields, with the networkx and CSR backends
+"""
+
+
+def path_query_times(network, pairs, relation, max_hops, k):
+    times = []
+    found = 0
+    for source, target in pairs:
+        s = time.time()
+        res = network.find_path_hit(source, target, relation, max_hops=max_hops, k=k)
+        e = time.time()
+        times.append(e - s)
+        if res.size() > 0:
+            found += 1
+    return times, found
+
+
+def experiment_paths(size=200000, edges=1000000, queries=200, max_hops=(2, 3, 5), ks=(1, 5)):
+    relation = Relation.PKFK
+    fn = generate_network(size, edges, [relation])
+    csr_fn = fieldnetwork.to_csr_network(fn, copy_fields=False)
+
+    rnd = random.Random(0)
+    nids = list(fn.iterate_ids())
+    pairs = [fn.get_hits_from_info(fn.get_info_for(rnd.sample(nids, 2))) for _ in range(queries)]
+    perf_results = dict()
+    for hops in max_hops:
+        for k in ks:
+            for name, network in [('networkx', fn), ('csr', csr_fn)]:
+                times, found = path_query_times(network, pairs, relation, hops, k)
+                perf_results[(name, hops, k)] = (found, get_percentiles(times))
+    return perf_results
+
+
+if __name__ == "__main__":
+
+    results = experiment_paths()
+    print("# backend max_hops k found query_p5/p50/p95_ms")
+    for (name, hops, k), (found, p) in sorted(results.items()):
+        print(" ".join([name, str(hops), str(k), str(found), "/".join("{0:.2f}".format(x * 1e3) for x in p)]))
@@ -1,5 +1,6 @@
 from knowledgerepr import syn_network_generator as syn
 from api.apiutils import Relation
+from api.apiutils import DRS, Hit, Operation, OP
 import numpy as np
 from ddapi import API
 
@@ -171,6 +172,55 @@ def experiment_changing_max_hops_tc_queries(repetitions=100):
     return perf_results
 
 
+def experiment_node_ids(repetitions=100, input_size=50):
+    """
+    Latency of the three queries, and the time to build the network, over a graph whose field ids
+    are given as strings, as the store returns them. Compares the representation of node ids
+    across versions
+    """
+    s = time.time()
+    fn = syn.generate_network_with(num_nodes=100000, num_nodes_per_table=10, num_schema_sim=90000,
+                                   num_content_sim=90000, num_pkfk=90000, string_ids=True)
+    e = time.time()
+    api = API(fn)
+
+    nodes = fn.fields_degree(input_size)
+    nids = [x for x, y in nodes]
+    info = fn.get_info_for(nids)
+    hits = fn.get_hits_from_info(info)
+    in_drs = api.drs_from_hits(hits)
+
+    q2, q3, q4 = run_all_queries(repetitions, api_obj=api, in_drs_obj=in_drs)
+    return (e - s), get_percentiles([q2, q3, q4])
+
+
+def experiment_absorb_provenance(num_absorbs=2000, hits_per_drs=20, window=250):
+    """
+    Latency of absorbing neighbor DRSs, as in the loops of the neighbor queries, while the output
+    grows, and the time to build the provenance graph of the output when it is read at the end
+    :return: (dict of number of absorbs so far -> percentiles of the latency of the next window of
+    absorbs, time to build the graph)
+    """
+    sources = [Hit(i, "db", "t" + str(i // 10), "f" + str(i), 0) for i in range(num_absorbs)]
+    o_drs = DRS([], Operation(OP.NONE))
+    results = dict()
+    latencies = []
+    for i, source in enumerate(sources):
+        hits = [Hit(num_absorbs + i * hits_per_drs + j, "db", "n", "f", 0.5) for j in range(hits_per_drs)]
+        hits_drs = DRS(hits, Operation(OP.CONTENT_SIM, params=[source]))
+        s = time.time()
+        o_drs.absorb_provenance(hits_drs)
+        e = time.time()
+        latencies.append(e - s)
+        if len(latencies) == window:
+            results[i + 1 - window] = get_percentiles([latencies])[0]
+            latencies = []
+    s = time.time()
+    o_drs.get_provenance().prov_graph()
+    e = time.time()
+    return results, (e - s)
+
+
 def get_percentiles(list_of_lists):
     results = []
     for l in list_of_lists:
@@ -15,8 +15,15 @@ class DDAPI:
 
     __network = None
 
-    def __init__(self, network):
+    def __init__(self, network, lazy_provenance=False):
+        """
+        :param network: the FieldNetwork
+        :param lazy_provenance: if True, the DRSs built by this API, and the ones it gets from the
+        network, record their provenance and only build its graph when it is read, e.g., by why, how,
+        paths or ranking
+        """
         self.__network = network
+        self.__lazy_provenance = lazy_provenance
 
     """
     Seed API
@@ -34,11 +41,11 @@ class DDAPI:
         return self.drs_from_hit(h)
 
     def drs_from_hit(self, hit: Hit) -> DRS:
-        drs = DRS([hit], Operation(OP.ORIGIN))
+        drs = DRS([hit], Operation(OP.ORIGIN), lazy_provenance=self.__lazy_provenance)
         return drs
 
     def drs_from_hits(self, hits: [Hit]) -> DRS:
-        drs = DRS(hits, Operation(OP.ORIGIN))
+        drs = DRS(hits, Operation(OP.ORIGIN), lazy_provenance=self.__lazy_provenance)
         return drs
 
     def drs_from_table(self, source: str) -> DRS:
@@ -49,22 +56,23 @@ class DDAPI:
         :return: a DRS with the source-field internal representation
         """
         hits = self.__network.get_hits_from_table(source)
-        drs = DRS([x for x in hits], Operation(OP.ORIGIN))
+        drs = DRS([x for x in hits], Operation(OP.ORIGIN), lazy_provenance=self.__lazy_provenance)
         return drs
 
     def drs_from_table_hit(self, hit: Hit) -> DRS:
         table = hit.source_name
         hits = self.__network.get_hits_from_table(table)
-        drs = DRS([x for x in hits], Operation(OP.TABLE, params=[hit]))
+        drs = DRS([x for x in hits], Operation(OP.TABLE, params=[hit]), lazy_provenance=self.__lazy_provenance)
         return drs
 
     def drs_expand_to_table(self, drs: DRS) -> DRS:
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
+        tables_drs = []
         for h in drs:
-            table = h.source_name
-            hits = self.__network.get_hits_from_table(table)
-            drs = DRS([x for x in hits], Operation(OP.TABLE, params=[h]))
-            o_drs.absorb(drs)
+            hits = self.__network.get_hits_from_table(h.source_name)
+            tables_drs.append(DRS([x for x in hits], Operation(OP.TABLE, params=[h]),
+                                  lazy_provenance=self.__lazy_provenance))
+        o_drs.absorb_many(tables_drs)
         return o_drs
 
     def reverse_lookup(self, nid) -> [str]:
@@ -105,7 +113,8 @@ class DDAPI:
         :return: returns a DRS
         """
         hits = store_client.search_keywords(kw, KWType.KW_CONTENT, max_results)
-        drs = DRS([x for x in hits], Operation(OP.KW_LOOKUP, params=[kw]))  # materialize generator
+        drs = DRS([x for x in hits], Operation(OP.KW_LOOKUP, params=[kw]),
+                  lazy_provenance=self.__lazy_provenance)  # materialize generator
         return drs
 
     def keywords_search(self, kws: [str], max_results=10) -> DRS:
@@ -114,10 +123,8 @@ class DDAPI:
         :param kws: collection (iterable) of keywords (strings)
         :return: the matches in the internal representation
         """
-        o_drs = DRS([], Operation(OP.NONE))
-        for kw in kws:
-            res_drs = self.keyword_search(kw, max_results=max_results)
-            o_drs = o_drs.absorb(res_drs)
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
+        o_drs = o_drs.absorb_many([self.keyword_search(kw, max_results=max_results) for kw in kws])
         return o_drs
 
     def schema_name_search(self, kw: str, max_results=10) -> DRS:
@@ -128,8 +135,8 @@ class DDAPI:
         :return: returns a DRS
         """
         hits = store_client.search_keywords(kw, KWType.KW_SCHEMA, max_results)
-        drs = DRS([x for x in hits], Operation(
-            OP.SCHNAME_LOOKUP, params=[kw]))  # materialize generator
+        drs = DRS([x for x in hits], Operation(OP.SCHNAME_LOOKUP, params=[kw]),
+                  lazy_provenance=self.__lazy_provenance)  # materialize generator
         return drs
 
     def schema_names_search(self, kws: [str], max_results=10) -> DRS:
@@ -138,10 +145,8 @@ class DDAPI:
         :param kws: collection (iterable) of keywords (strings)
         :return: a DRS
         """
-        o_drs = DRS([], Operation(OP.NONE))
-        for kw in kws:
-            res_drs = self.schema_name_search(kw, max_results=max_results)
-            o_drs = o_drs.absorb(res_drs)
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
+        o_drs = o_drs.absorb_many([self.schema_name_search(kw, max_results=max_results) for kw in kws])
         return o_drs
 
     def table_name_search(self, kw: str, max_results=10) -> DRS:
@@ -152,7 +157,8 @@ class DDAPI:
         :return: returns a DRS
         """
         hits = store_client.search_keywords(kw, KWType.KW_TABLE, max_results)
-        drs = DRS([x for x in hits], Operation(OP.KW_LOOKUP, params=[kw]))  # materialize generator
+        drs = DRS([x for x in hits], Operation(OP.KW_LOOKUP, params=[kw]),
+                  lazy_provenance=self.__lazy_provenance)  # materialize generator
         return drs
 
     def table_names_search(self, kws: [str], max_results=10) -> DRS:
@@ -161,10 +167,8 @@ class DDAPI:
         :param kws: collection (iterable) of keywords (strings)
         :return: a DRS
         """
-        o_drs = DRS([], Operation(OP.NONE))
-        for kw in kws:
-            res_drs = self.table_name_search(kw, max_results=max_results)
-            o_drs = o_drs.absorb(res_drs)
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
+        o_drs = o_drs.absorb_many([self.table_name_search(kw, max_results=max_results) for kw in kws])
         return o_drs
 
     def entity_search(self, kw: str, max_results=10) -> DRS:
@@ -176,8 +180,8 @@ class DDAPI:
         """
         hits = store_client.search_keywords(
             kw, KWType.KW_ENTITIES, max_results)
-        drs = DRS([x for x in hits], Operation(
-            OP.ENTITY_LOOKUP, params=[kw]))  # materialize generator
+        drs = DRS([x for x in hits], Operation(OP.ENTITY_LOOKUP, params=[kw]),
+                  lazy_provenance=self.__lazy_provenance)  # materialize generator
         return drs
 
     def schema_neighbors(self, field: (str, str, str)) -> DRS:
@@ -189,21 +193,21 @@ class DDAPI:
         db_name, source_name, field_name = field
         hits = self.__network.get_hits_from_table(source_name)
         origin_hit = Hit(id_from(db_name, source_name, field_name), db_name, source_name, field_name, 0)
-        o_drs = DRS([x for x in hits], Operation(OP.TABLE, params=[origin_hit]))
+        o_drs = DRS([x for x in hits], Operation(OP.TABLE, params=[origin_hit]), lazy_provenance=self.__lazy_provenance)
         return o_drs
 
     def schema_neighbors_of(self, i_drs: DRS) -> DRS:
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
         o_drs = o_drs.absorb_provenance(i_drs)
         if i_drs.mode == DRSMode.TABLE:
             i_drs.set_fields_mode()
-            for h in i_drs:
-                fields_table = self.drs_from_table_hit(h)
-                i_drs = i_drs.absorb(fields_table)
+            i_drs = i_drs.absorb_many([self.drs_from_table_hit(h) for h in i_drs])
+        hits_drss = []
         for h in i_drs:
             hits = self.__network.get_hits_from_table(h.source_name)
-            hits_drs = DRS([x for x in hits], Operation(OP.TABLE, params=[h]))
-            o_drs = o_drs.absorb(hits_drs)
+            hits_drss.append(DRS([x for x in hits], Operation(OP.TABLE, params=[h]),
+                                 lazy_provenance=self.__lazy_provenance))
+        o_drs = o_drs.absorb_many(hits_drss)
         return o_drs
 
     def similar_schema_name_to_field(self, field: (str, str, str)) -> DRS:
@@ -232,16 +236,13 @@ class DDAPI:
         :param i_drs: the input DRS
         :return: DRS
         """
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
         o_drs = o_drs.absorb_provenance(i_drs)
         if i_drs.mode == DRSMode.TABLE:
             i_drs.set_fields_mode()
-            for h in i_drs:
-                fields_table = self.drs_from_table_hit(h)
-                i_drs = i_drs.absorb(fields_table)
-        for h in i_drs:
-            hits_drs = self.__network.neighbors_id(h, Relation.SCHEMA_SIM)
-            o_drs = o_drs.absorb(hits_drs)
+            i_drs = i_drs.absorb_many([self.drs_from_table_hit(h) for h in i_drs])
+        hits_drs = self.__network.neighbors_ids(i_drs, Relation.SCHEMA_SIM, lazy_provenance=self.__lazy_provenance)
+        o_drs = o_drs.absorb(hits_drs)
         return o_drs
 
     def similar_content_to_field(self, field: (str, str, str)) -> DRS:
@@ -265,16 +266,13 @@ class DDAPI:
         :param i_drs: the input DRS
         :return: DRS
         """
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
         o_drs = o_drs.absorb_provenance(i_drs)
         if i_drs.mode == DRSMode.TABLE:
             i_drs.set_fields_mode()
-            for h in i_drs:
-                fields_table = self.drs_from_table_hit(h)
-                i_drs = i_drs.absorb(fields_table)
-        for h in i_drs:
-            hits_drs = self.__network.neighbors_id(h, Relation.CONTENT_SIM)
-            o_drs = o_drs.absorb(hits_drs)
+            i_drs = i_drs.absorb_many([self.drs_from_table_hit(h) for h in i_drs])
+        hits_drs = self.__network.neighbors_ids(i_drs, Relation.CONTENT_SIM, lazy_provenance=self.__lazy_provenance)
+        o_drs = o_drs.absorb(hits_drs)
         return o_drs
 
     def inclusion_dependency_to(self, i_drs: DRS) -> DRS:
@@ -283,16 +281,14 @@ class DDAPI:
         :param i_drs: the input DRS
         :return: DRS
         """
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
         o_drs = o_drs.absorb_provenance(i_drs)
         if i_drs.mode == DRSMode.TABLE:
             i_drs.set_fields_mode()
-            for h in i_drs:
-                fields_table = self.drs_from_table_hit(h)
-                i_drs = i_drs.absorb(fields_table)
-        for h in i_drs:
-            hits_drs = self.__network.neighbors_id(h, Relation.INCLUSION_DEPENDENCY)
-            o_drs = o_drs.absorb(hits_drs)
+            i_drs = i_drs.absorb_many([self.drs_from_table_hit(h) for h in i_drs])
+        hits_drs = self.__network.neighbors_ids(i_drs, Relation.INCLUSION_DEPENDENCY,
+                                                lazy_provenance=self.__lazy_provenance)
+        o_drs = o_drs.absorb(hits_drs)
         return o_drs
 
     def pkfk_field(self, field: (str, str, str)) -> DRS:
@@ -318,17 +314,13 @@ class DDAPI:
         :return: DRS
         """
         # alternative provenance propagation
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
         o_drs = o_drs.absorb_provenance(i_drs)
         if i_drs.mode == DRSMode.TABLE:
             i_drs.set_fields_mode()
-            for h in i_drs:
-                fields_table = self.drs_from_table_hit(h)
-                i_drs = i_drs.absorb(fields_table)
-                # o_drs.extend_provenance(fields_drs)
-        for h in i_drs:
-            hits_drs = self.__network.neighbors_id(h, Relation.PKFK)
-            o_drs = o_drs.absorb(hits_drs)
+            i_drs = i_drs.absorb_many([self.drs_from_table_hit(h) for h in i_drs])
+        hits_drs = self.__network.neighbors_ids(i_drs, Relation.PKFK, lazy_provenance=self.__lazy_provenance)
+        o_drs = o_drs.absorb(hits_drs)
         # o_drs.extend_provenance(i_drs)
         return o_drs
 
@@ -384,7 +376,7 @@ class DDAPI:
         :return:
         """
         assert(a.mode == b.mode)
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
         o_drs.absorb_provenance(a)
         o_drs.absorb_provenance(b)
         if a.mode == DRSMode.FIELDS:
@@ -392,7 +384,8 @@ class DDAPI:
                 for h2 in b:  # h2 is a Hit
                     if h1 == h2:
                         return o_drs  # same source and target field
-                    res_drs = self.__network.find_path_hit(h1, h2, primitives, max_hops=max_hops)
+                    res_drs = self.__network.find_path_hit(h1, h2, primitives, max_hops=max_hops,
+                                                           lazy_provenance=self.__lazy_provenance)
                     o_drs = o_drs.absorb(res_drs)
         elif a.mode == DRSMode.TABLE:
             for h1 in a:  # h1 is a table: str
@@ -400,7 +393,7 @@ class DDAPI:
                     if h1 == h2:
                         return o_drs  # same source ant target table
                     res_drs = self.__network.find_path_table(
-                        h1, h2, primitives, self, max_hops=max_hops)
+                        h1, h2, primitives, self, max_hops=max_hops, lazy_provenance=self.__lazy_provenance)
                     o_drs = o_drs.absorb(res_drs)
         return o_drs
 
@@ -412,36 +405,31 @@ class DDAPI:
         :param primitives:
         :return:
         """
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
         o_drs = o_drs.absorb_provenance(a)
         if a.mode == DRSMode.FIELDS:
             for h1 in a:  # h1 is a Hit
                 for h2 in a:  # h2 is a Hit
                     if h1 == h2:
                         continue
-                    res_drs = self.__network.find_path_hit(h1, h2, primitives)
+                    res_drs = self.__network.find_path_hit(h1, h2, primitives, lazy_provenance=self.__lazy_provenance)
                     o_drs = o_drs.absorb(res_drs)
         elif a.mode == DRSMode.TABLE:
             for h1 in a:  # h1 is a table: str
                 for h2 in a:  # h2 is a table: str
                     res_drs = self.__network.find_path_table(
-                        h1, h2, primitives, self)
+                        h1, h2, primitives, self, lazy_provenance=self.__lazy_provenance)
                     o_drs = o_drs.absorb(res_drs)
         return o_drs
 
     def traverse(self, a: DRS, primitives, max_hops) -> DRS:
-        o_drs = DRS([], Operation(OP.NONE))
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=self.__lazy_provenance)
         if a.mode == DRSMode.TABLE:
             print("ERROR: input mode TABLE not supported")
             return []
-        fringe = [x for x in a]
         o_drs.absorb_provenance(a)
-        while max_hops > 0:
-            max_hops = max_hops - 1
-            for h in fringe:
-                hits_drs = self.__network.neighbors_id(h, primitives)
-                o_drs = self.union(o_drs, hits_drs)
-            fringe = [x for x in o_drs]  # grow the initial input
+        hits_drs = self.__network.traverse(a, primitives, max_hops, lazy_provenance=self.__lazy_provenance)
+        o_drs = o_drs.absorb(hits_drs)
         return o_drs
 
     """
@@ -0,0 +1,97 @@
+import hashlib
+import itertools
+import operator
+import os
+import pickle
+
+from api.apiutils import Relation
+
+CHECKPOINT_VERSION = 1
+
+# Stages of a model build, in the order they run
+STAGES = ['skeleton', 'schema_sim', 'content_sim_text', 'content_sim_num', 'pkfk']
+
+
+def digest(items, *params):
+    """
+    Fingerprint of the inputs of a stage
+    :param items: iterable with the input data of the stage, e.g., signatures read from the store
+    :param params: other values the output depends on, e.g., thresholds or digests of other stages
+    :return: hex digest
+    """
+    h = hashlib.sha1()
+    for item in items:
+        h.update(pickle.dumps(item, protocol=2))
+    h.update(pickle.dumps(params, protocol=2))
+    return h.hexdigest()
+
+
+def network_edges(network, relations=None):
+    """
+    Edge list of the network
+    :param network: a FieldNetwork
+    :param relations: if given, only edges of these relations are returned
+    :return: list of (src, target, relation, score)
+    """
+    if relations is None:
+        relations = list(Relation)
+    edges = []
+    for relation in relations:
+        for src, target, score in network.iterate_relation_edges(relation):
+            edges.append((src, target, relation, score))
+    return edges
+
+
+def add_edges(network, edges):
+    """
+    Adds an edge list as produced by network_edges to the network. Each run of edges of the same
+    relation is added at once with add_relations, in the order of the list
+    """
+    for relation, run in itertools.groupby(edges, key=operator.itemgetter(2)):
+        network.add_relations(relation, ((src, target, score) for src, target, _, score in run))
+
+
+def checkpoint_path(path, stage):
+    return os.path.join(path, 'checkpoints', stage + '.pkl')
+
+
+def save_checkpoint(path, stage, key, edges, payload=None):
+    """
+    Writes the output of a stage. The file is written under a temporary name first, so an
+    interrupted build never leaves a partial checkpoint behind
+    :param path: output path of the model
+    :param stage: name of the stage
+    :param key: digest of the inputs of the stage
+    :param edges: edge list produced by the stage
+    :param payload: any other output of the stage, e.g., an index
+    :return:
+    """
+    file_path = checkpoint_path(path, stage)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    checkpoint = {'version': CHECKPOINT_VERSION, 'stage': stage, 'key': key, 'edges': edges,
+                  'payload': payload}
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, file_path)
+
+
+def load_checkpoint(path, stage, key):
+    """
+    Reads the checkpoint of a stage if it was produced from the same inputs
+    :param path: output path of the model
+    :param stage: name of the stage
+    :param key: digest of the current inputs of the stage
+    :return: the checkpoint dict, with 'edges' and 'payload', or None if there is no valid one
+    """
+    file_path = checkpoint_path(path, stage)
+    if not os.path.isfile(file_path):
+        return None
+    try:
+        with open(file_path, 'rb') as f:
+            checkpoint = pickle.load(f)
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if checkpoint.get('version') != CHECKPOINT_VERSION or checkpoint.get('key') != key:
+        return None
+    return checkpoint
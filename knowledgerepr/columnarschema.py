@@ -0,0 +1,337 @@
+"""
+Columnar representation of the fields of a model, for stores with millions of columns.
+
+ColumnarIdInfo and ColumnarTableIds behave as the id -> (db_name, source_name, field_name, data_type)
+and source_name -> [id] dicts of FieldNetwork, but keep the fields in numpy arrays: field ids as
+int64 (or fixed-width strings if they are not integers), names as codes into tables of interned
+strings and cardinalities as float32. Fields added or changed afterwards are kept in a small dict
+on top of the arrays.
+"""
+from collections.abc import MutableMapping
+
+import numpy as np
+
+from api.apiutils import nid_key
+
+
+class StringTable:
+    """
+    Interned strings, each one identified by its position
+    """
+
+    def __init__(self):
+        self.strings = []
+        self.codes = dict()
+
+    def intern(self, string):
+        code = self.codes.get(string)
+        if code is None:
+            code = len(self.strings)
+            self.codes[string] = code
+            self.strings.append(string)
+        return code
+
+    def code_of(self, string):
+        """
+        :return: the code of string, or -1 if it was not interned
+        """
+        return self.codes.get(string, -1)
+
+    def freeze(self):
+        """
+        Drops the lookup of codes by string, when strings are only read by code
+        """
+        self.codes = None
+
+    def __getitem__(self, code):
+        return self.strings[code]
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getstate__(self):
+        return {'strings': self.strings, 'frozen': self.codes is None}
+
+    def __setstate__(self, state):
+        self.strings = state['strings']
+        self.codes = None
+        if not state['frozen']:
+            self.codes = {string: code for code, string in enumerate(self.strings)}
+
+
+def _nid_keys(nids):
+    """
+    :return: int64 array of the ids if all of them are integers (see nid_key), e.g., the crc32
+    ids of compute_field_id, or a unicode array otherwise
+    """
+    keys = [nid_key(nid) for nid in nids]
+    if all(type(key) is int for key in keys):
+        try:
+            return np.array(keys, dtype=np.int64)
+        except OverflowError:
+            pass
+    return np.array([str(key) for key in keys], dtype=str)
+
+
+class NidIndex:
+    """
+    Positions of field ids, found by binary search over the sorted ids instead of with a dict.
+    If an id is repeated, its last position wins
+    """
+
+    def __init__(self, nid_keys, order=None, sorted_keys=None):
+        """
+        :param nid_keys: the ids, as returned by _nid_keys
+        :param order: stable argsort of nid_keys, computed if not given
+        :param sorted_keys: nid_keys[order], computed if not given
+        """
+        self.nid_keys = nid_keys
+        self.order = order if order is not None else np.argsort(nid_keys, kind='mergesort')
+        self.sorted_keys = sorted_keys if sorted_keys is not None else nid_keys[self.order]
+
+    @classmethod
+    def from_nids(cls, nids):
+        return cls(_nid_keys(list(nids)))
+
+    def __len__(self):
+        return len(self.nid_keys)
+
+    def shadowed(self):
+        """
+        :return: positions of ids that are repeated later
+        """
+        return self.order[:-1][self.sorted_keys[:-1] == self.sorted_keys[1:]]
+
+    def nid_of(self, position):
+        if self.nid_keys.dtype.kind == 'i':
+            return int(self.nid_keys[position])
+        return nid_key(str(self.nid_keys[position]))
+
+    def position_of(self, nid):
+        """
+        :return: the position of nid, or -1 if it is not indexed
+        """
+        key = nid if type(nid) is int else nid_key(nid)
+        if self.nid_keys.dtype.kind == 'i':
+            if type(key) is not int or not -2 ** 63 <= key < 2 ** 63:
+                return -1
+        else:
+            key = str(key)
+        pos = np.searchsorted(self.sorted_keys, key, side='right') - 1
+        if pos < 0 or self.sorted_keys[pos] != key:
+            return -1
+        return int(self.order[pos])
+
+
+class ColumnarIdInfo(MutableMapping):
+    """
+    id -> (db_name, source_name, field_name, data_type) over columnar arrays, in ingestion order
+    """
+
+    def __init__(self, index, db_names, source_names, field_names, data_types,
+                 db_codes, source_codes, field_codes, type_codes, cardinality, removed=None):
+        """
+        :param index: NidIndex of the ids
+        :param db_names: StringTable of db names, and the same for sources, fields and data types
+        :param db_codes: code of the db name of each field, and the same for sources, fields and data types
+        :param cardinality: float32 cardinality of each field, nan if it has none
+        :param removed: mask of rows that are not fields of the map, by default the ones of repeated ids
+        """
+        self.index = index
+        self.db_names = db_names
+        self.source_names = source_names
+        self.field_names = field_names
+        self.data_types = data_types
+        self.db_codes = db_codes
+        self.source_codes = source_codes
+        self.field_codes = field_codes
+        self.type_codes = type_codes
+        self.cardinality = cardinality
+        if removed is None:
+            removed = np.zeros(len(index), dtype=bool)
+            # as in a dict, the last field with a repeated id wins
+            removed[index.shadowed()] = True
+        self.removed = removed
+        self.overflow = dict()
+
+    def nid_of(self, row):
+        return self.index.nid_of(row)
+
+    def row_of(self, nid):
+        """
+        :return: the row of nid in the arrays, or -1 if it is not there or was removed
+        """
+        row = self.index.position_of(nid)
+        if row < 0 or self.removed[row]:
+            return -1
+        return row
+
+    def info_of(self, row):
+        return (self.db_names[self.db_codes[row]], self.source_names[self.source_codes[row]],
+                self.field_names[self.field_codes[row]], self.data_types[self.type_codes[row]])
+
+    def cardinality_of(self, nid):
+        """
+        :return: the cardinality of the field, or None if it has none or was added after ingestion
+        """
+        row = self.row_of(nid)
+        if row < 0 or np.isnan(self.cardinality[row]):
+            return None
+        return float(self.cardinality[row])
+
+    def __getitem__(self, nid):
+        if nid in self.overflow:
+            return self.overflow[nid]
+        row = self.row_of(nid)
+        if row < 0:
+            raise KeyError(nid)
+        return self.info_of(row)
+
+    def __setitem__(self, nid, info):
+        row = self.row_of(nid)
+        if row >= 0:
+            self.removed[row] = True
+        self.overflow[nid] = info
+
+    def __delitem__(self, nid):
+        if nid in self.overflow:
+            del self.overflow[nid]
+            return
+        row = self.row_of(nid)
+        if row < 0:
+            raise KeyError(nid)
+        self.removed[row] = True
+
+    def __contains__(self, nid):
+        return nid in self.overflow or self.row_of(nid) >= 0
+
+    def __iter__(self):
+        for row in np.flatnonzero(~self.removed).tolist():
+            yield self.nid_of(row)
+        yield from list(self.overflow.keys())
+
+    def items(self):
+        for row in np.flatnonzero(~self.removed).tolist():
+            yield self.nid_of(row), self.info_of(row)
+        yield from list(self.overflow.items())
+
+    def values(self):
+        for _, info in self.items():
+            yield info
+
+    def __len__(self):
+        return len(self.index) - int(self.removed.sum()) + len(self.overflow)
+
+
+class ColumnarTableIds(MutableMapping):
+    """
+    source_name -> [id], with the ids of each source stored contiguously. Like the defaultdict it
+    replaces, looking up an unknown source adds it with no ids. The list of a source is materialized
+    the first time it is looked up, so it can be changed in place
+    """
+
+    def __init__(self, source_names, indptr, nid_keys):
+        """
+        :param source_names: StringTable of source names
+        :param indptr: the ids of the source with code i are nid_keys[indptr[i]:indptr[i + 1]]
+        :param nid_keys: ids grouped by source
+        """
+        self.source_names = source_names
+        self.indptr = indptr
+        self.nid_keys = nid_keys
+        self.removed = set()
+        self.lists = dict()
+
+    @classmethod
+    def from_codes(cls, source_names, source_codes, keys):
+        """
+        :param source_codes: code of the source of each id in keys
+        """
+        order = np.argsort(source_codes, kind='mergesort')
+        indptr = np.zeros(len(source_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source_codes, minlength=len(source_names)), out=indptr[1:])
+        return cls(source_names, indptr, keys[order])
+
+    def __getitem__(self, source):
+        ids = self.lists.get(source)
+        if ids is None:
+            code = self.source_names.code_of(source)
+            if code < 0 or source in self.removed:
+                ids = []
+            else:
+                ids = [nid_key(key) for key in self.nid_keys[self.indptr[code]:self.indptr[code + 1]].tolist()]
+            self.lists[source] = ids
+            self.removed.discard(source)
+        return ids
+
+    def __setitem__(self, source, ids):
+        self.lists[source] = ids
+        self.removed.discard(source)
+
+    def __delitem__(self, source):
+        if source not in self:
+            raise KeyError(source)
+        self.lists.pop(source, None)
+        if self.source_names.code_of(source) >= 0:
+            self.removed.add(source)
+
+    def __contains__(self, source):
+        if source in self.lists:
+            return True
+        return self.source_names.code_of(source) >= 0 and source not in self.removed
+
+    def __iter__(self):
+        for code in range(len(self.source_names)):
+            source = self.source_names[code]
+            if source not in self.removed:
+                yield source
+        for source in list(self.lists.keys()):
+            if self.source_names.code_of(source) < 0:
+                yield source
+
+    def __len__(self):
+        added = sum(1 for source in self.lists if self.source_names.code_of(source) < 0)
+        return len(self.source_names) - len(self.removed) + added
+
+
+def build_columnar_schema(batches):
+    """
+    Ingests fields in batches, e.g., the scroll pages of StoreHandler.get_all_fields_batches, keeping
+    only compact arrays of each batch
+    :param batches: iterable of lists of
+    (nid, db_name, source_name, field_name, total_values, unique_values, data_type)
+    :return: (ColumnarIdInfo, ColumnarTableIds)
+    """
+    db_names = StringTable()
+    source_names = StringTable()
+    field_names = StringTable()
+    data_types = StringTable()
+    chunks = []
+    for batch in batches:
+        if len(batch) == 0:
+            continue
+        nids, dbs, sources, names, totals, uniques, types = zip(*batch)
+        totals = np.array(totals, dtype=np.float64)
+        uniques = np.array(uniques, dtype=np.float64)
+        cardinality = np.full(len(batch), np.nan, dtype=np.float32)
+        np.divide(uniques, totals, out=cardinality, where=totals > 0, casting='unsafe')
+        chunks.append((_nid_keys(nids),
+                       np.array([db_names.intern(db) for db in dbs], dtype=np.int32),
+                       np.array([source_names.intern(source) for source in sources], dtype=np.int32),
+                       np.array([field_names.intern(name) for name in names], dtype=np.int32),
+                       np.array([data_types.intern(data_type) for data_type in types], dtype=np.uint8),
+                       cardinality))
+    if len(chunks) == 0:
+        chunks.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32),
+                       np.empty(0, dtype=np.int32), np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.float32)))
+    if not all(chunk[0].dtype.kind == 'i' for chunk in chunks):
+        chunks = [(chunk[0].astype(str),) + chunk[1:] for chunk in chunks]
+    keys, db_codes, source_codes, field_codes, type_codes, cardinality = \
+        [np.concatenate(column) for column in zip(*chunks)]
+    # only the source names are looked up by name
+    for strings in [db_names, field_names, data_types]:
+        strings.freeze()
+    id_info = ColumnarIdInfo(NidIndex(keys), db_names, source_names, field_names, data_types,
+                             db_codes, source_codes, field_codes, type_codes, cardinality)
+    table_ids = ColumnarTableIds.from_codes(source_names, source_codes, keys)
+    return id_info, table_ids
@@ -0,0 +1,449 @@
+"""
+Compact graph backend for FieldNetwork. Each relation is stored in CSR form, with int32 node
+positions and float32 scores, instead of the dict of dicts of dicts per edge of a networkx MultiGraph.
+"""
+from collections import defaultdict
+from collections.abc import MutableMapping
+import threading
+
+import networkx as nx
+import numpy as np
+
+from api.apiutils import Relation
+from api.apiutils import nid_key
+from knowledgerepr.columnarschema import NidIndex
+
+# A relation is compacted once it has this many changes in its overlay, or one per 8 of its edges
+# if that is more, so that rebuilding its arrays is amortized over the changes
+COMPACT_MIN_CHANGES = 4096
+
+
+class CSRRelation:
+    """
+    Undirected edges of one relation. The neighbors of node i are indices[indptr[i]:indptr[i + 1]],
+    sorted, with their scores at the same positions of scores. Edges added or removed one by one after
+    building are kept in an overlay, per node, until compact() is called. add_edges merges many edges
+    into the arrays at once instead
+    """
+
+    def __init__(self, num_nodes, src=(), tgt=(), scores=()):
+        """
+        :param num_nodes: number of nodes
+        :param src: positions of one end of the edges
+        :param tgt: positions of the other end of the edges
+        :param scores: scores of the edges, the last one wins if an edge is repeated
+        """
+        src = np.asarray(src, dtype=np.int64)
+        tgt = np.asarray(tgt, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float32)
+        lo = np.minimum(src, tgt)
+        hi = np.maximum(src, tgt)
+        order = np.lexsort((hi, lo))
+        lo, hi, scores = lo[order], hi[order], scores[order]
+        last = np.ones(len(lo), dtype=bool)
+        last[:-1] = (lo[:-1] != lo[1:]) | (hi[:-1] != hi[1:])
+        lo, hi, scores = lo[last], hi[last], scores[last]
+
+        loops = lo == hi
+        rows = np.concatenate([lo, hi[~loops]])
+        cols = np.concatenate([hi, lo[~loops]])
+        scores = np.concatenate([scores, scores[~loops]])
+        order = np.lexsort((cols, rows))
+        self.indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_nodes), out=self.indptr[1:])
+        self.indices = cols[order].astype(np.int32)
+        self.scores = scores[order]
+        self.score_order = None
+        self.added = defaultdict(dict)
+        self.removed = defaultdict(set)
+        self.changes = 0
+
+    @classmethod
+    def from_arrays(cls, indptr, indices, scores):
+        """
+        :return: a CSRRelation over existing CSR arrays, e.g., memory-mapped ones
+        """
+        csr = cls.__new__(cls)
+        csr.indptr = indptr
+        csr.indices = indices
+        csr.scores = scores
+        csr.score_order = None
+        csr.added = defaultdict(dict)
+        csr.removed = defaultdict(set)
+        csr.changes = 0
+        return csr
+
+    def _base(self, i):
+        if i + 1 >= len(self.indptr):
+            return 0, 0  # node added after building
+        return self.indptr[i], self.indptr[i + 1]
+
+    def _base_has(self, i, j):
+        start, end = self._base(i)
+        pos = start + np.searchsorted(self.indices[start:end], j)
+        return pos < end and self.indices[pos] == j
+
+    def _changed(self, i):
+        """
+        :return: True if node i has edges in the overlay
+        """
+        return i in self.added or i in self.removed
+
+    def neighbors(self, i):
+        """
+        :return: (positions, scores) of the neighbors of node i
+        """
+        start, end = self._base(i)
+        indices = self.indices[start:end]
+        scores = self.scores[start:end]
+        if self._changed(i):
+            overlay = self.added.get(i, dict())
+            removed = self.removed.get(i, set())
+            keep = [k for k, j in enumerate(indices.tolist()) if j not in overlay and j not in removed]
+            indices = np.concatenate([indices[keep], np.array(list(overlay.keys()), dtype=np.int32)])
+            scores = np.concatenate([scores[keep], np.array(list(overlay.values()), dtype=np.float32)])
+        return indices, scores
+
+    def _score_order(self):
+        """
+        :return: positions of indices and scores sorted by row and, within each row, by decreasing score.
+        Computed the first time neighbors are requested by score
+        """
+        if self.score_order is None:
+            rows = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+            self.score_order = np.lexsort((-self.scores, rows))
+        return self.score_order
+
+    def top_neighbors(self, i, top_k=None, min_score=None):
+        """
+        :param top_k: maximum number of neighbors, all of them if None
+        :param min_score: minimum score of the neighbors, if any
+        :return: (positions, scores) of the neighbors of node i with the highest scores, highest first
+        """
+        if self._changed(i):
+            indices, scores = self.neighbors(i)
+            order = np.argsort(-scores, kind='mergesort')[:top_k]
+            indices, scores = indices[order], scores[order]
+        else:
+            start, end = self._base(i)
+            order = self._score_order()[start:end][:top_k]
+            indices, scores = self.indices[order], self.scores[order]
+        if min_score is not None:
+            # scores are float32, compare them with the float32 threshold
+            n = int(np.sum(scores >= np.float32(min_score)))
+            indices, scores = indices[:n], scores[:n]
+        return indices, scores
+
+    def has(self, i, j):
+        if j in self.added.get(i, dict()):
+            return True
+        return j not in self.removed.get(i, set()) and self._base_has(i, j)
+
+    def add(self, i, j, score):
+        for a, b in [(i, j), (j, i)]:
+            self.added[a][b] = score
+            removed = self.removed.get(a)
+            if removed is not None:
+                removed.discard(b)
+                if len(removed) == 0:
+                    del self.removed[a]
+        self.changes += 1
+
+    def remove(self, i, j):
+        for a, b in [(i, j), (j, i)]:
+            added = self.added.get(a)
+            if added is not None:
+                added.pop(b, None)
+                if len(added) == 0:
+                    del self.added[a]
+        if self._base_has(i, j):
+            self.removed[i].add(j)
+            self.removed[j].add(i)
+        self.changes += 1
+
+    def add_edges(self, num_nodes, src, tgt, scores):
+        """
+        Adds or updates many edges at once, by building the arrays again with them, as compact does
+        :param num_nodes: number of nodes
+        :param src: positions of one end of the edges
+        :param tgt: positions of the other end of the edges
+        :param scores: scores of the edges, the last one wins if an edge is repeated
+        """
+        old_src, old_tgt, old_scores = self.edges()
+        self.__init__(num_nodes, np.concatenate([old_src, np.asarray(src, dtype=np.int64)]),
+                      np.concatenate([old_tgt, np.asarray(tgt, dtype=np.int64)]),
+                      np.concatenate([old_scores, np.asarray(scores, dtype=np.float32)]))
+
+    def needs_compaction(self):
+        """
+        :return: True if the overlay has enough changes to merge it into the arrays
+        """
+        return self.changes >= max(COMPACT_MIN_CHANGES, len(self.indices) // 8)
+
+    def degrees(self, num_nodes):
+        """
+        :return: degree of each node, where self-loops count twice as in networkx
+        """
+        degrees = np.zeros(num_nodes, dtype=np.int64)
+        base = np.diff(self.indptr)
+        degrees[:len(base)] = base
+        rows = np.repeat(np.arange(len(base), dtype=np.int64), base)
+        degrees += np.bincount(rows[rows == self.indices], minlength=num_nodes)
+        changed = set(self.removed.keys()) | set(self.added.keys())
+        for i in changed:
+            indices, _ = self.neighbors(i)
+            degrees[i] = len(indices) + int(np.sum(indices == i))
+        return degrees
+
+    def edges(self):
+        """
+        :return: (src, tgt, scores) with each edge once
+        """
+        rows = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+        once = rows <= self.indices
+        src, tgt, scores = rows[once], self.indices[once].astype(np.int64), self.scores[once]
+        if len(self.removed) > 0 or len(self.added) > 0:
+            # both overlays are symmetric, so only the edges whose src changed need a look
+            changed = np.array(sorted(set(self.removed.keys()) | set(self.added.keys())), dtype=np.int64)
+            keep = np.ones(len(src), dtype=bool)
+            for k in np.flatnonzero(np.isin(src, changed)).tolist():
+                i, j = int(src[k]), int(tgt[k])
+                keep[k] = j not in self.removed.get(i, set()) and j not in self.added.get(i, dict())
+            overlay = [(i, j, score) for i, neighbors in self.added.items()
+                       for j, score in neighbors.items() if i <= j]
+            src = np.concatenate([src[keep], np.array([i for i, _, _ in overlay], dtype=np.int64)])
+            tgt = np.concatenate([tgt[keep], np.array([j for _, j, _ in overlay], dtype=np.int64)])
+            scores = np.concatenate([scores[keep], np.array([s for _, _, s in overlay], dtype=np.float32)])
+        return src, tgt, scores
+
+    def compact(self, num_nodes):
+        """
+        Merges the overlay into the CSR arrays
+        """
+        src, tgt, scores = self.edges()
+        self.__init__(num_nodes, src, tgt, scores)
+
+
+class LazyRelations(MutableMapping):
+    """
+    Relation -> CSRRelation, where each CSRRelation is loaded the first time it is used
+    """
+
+    def __init__(self, loaders):
+        """
+        :param loaders: dict of Relation -> function that returns its CSRRelation
+        """
+        self.loaders = dict(loaders)
+        self.loaded = dict()
+        self.lock = threading.Lock()
+
+    def __getitem__(self, relation):
+        csr = self.loaded.get(relation)
+        if csr is None:
+            with self.lock:
+                csr = self.loaded.get(relation)
+                if csr is None:
+                    csr = self.loaders.pop(relation)()
+                    self.loaded[relation] = csr
+        return csr
+
+    def __setitem__(self, relation, csr):
+        with self.lock:
+            self.loaders.pop(relation, None)
+            self.loaded[relation] = csr
+
+    def __delitem__(self, relation):
+        with self.lock:
+            if relation in self.loaders:
+                del self.loaders[relation]
+            else:
+                del self.loaded[relation]
+
+    def __contains__(self, relation):
+        return relation in self.loaded or relation in self.loaders
+
+    def __iter__(self):
+        return iter(list(self.loaded.keys()) + list(self.loaders.keys()))
+
+    def __len__(self):
+        return len(self.loaded) + len(self.loaders)
+
+    def is_loaded(self, relation):
+        return relation in self.loaded
+
+
+class CSRGraph:
+    """
+    Nodes (field ids and cardinalities) and one CSRRelation per relation type. Nodes are identified
+    by their position; positions of removed nodes are not reused
+    """
+
+    def __init__(self, index, cardinality, relations=None):
+        """
+        :param index: NidIndex of the ids of the nodes
+        :param cardinality: cardinality of the nodes, 0 if they have none
+        :param relations: dict of Relation -> CSRRelation, or LazyRelations
+        """
+        self.index = index
+        self.cardinality = np.asarray(cardinality, dtype=np.float32)
+        self.added_positions = dict()
+        self.added_nids = []
+        self.added_cardinality = []
+        self.removed_positions = set()
+        self.relations = relations if relations is not None else dict()
+
+    @classmethod
+    def from_network(cls, network):
+        """
+        Builds the CSR graph of the fields and relations of a FieldNetwork
+        """
+        nids = list(network.iterate_ids())
+        graph = cls(NidIndex.from_nids(nids), [network.get_cardinality_of(nid) for nid in nids])
+        # as in NidIndex, the last position of a repeated id wins
+        positions = {nid: pos for pos, nid in enumerate(nids)}
+        edges = defaultdict(lambda: ([], [], []))
+        for node_src, node_target, relation, score in network.iterate_edges():
+            src, tgt, scores = edges[relation]
+            src.append(positions[node_src])
+            tgt.append(positions[node_target])
+            scores.append(score)
+        for relation in Relation:
+            if relation in edges:
+                graph.relations[relation] = CSRRelation(len(graph), *edges.pop(relation))
+        return graph
+
+    def to_networkx(self):
+        G = nx.MultiGraph()
+        for pos in range(len(self)):
+            if pos not in self.removed_positions:
+                G.add_node(self.nid_of(pos), cardinality=self.cardinality_of(pos))
+        for relation, csr in self.relations.items():
+            src, tgt, scores = csr.edges()
+            for i, j, score in zip(src.tolist(), tgt.tolist(), scores.tolist()):
+                G.add_edge(self.nid_of(i), self.nid_of(j), relation, {'score': score})
+        return G
+
+    def __len__(self):
+        return len(self.index) + len(self.added_nids)
+
+    def __contains__(self, nid):
+        return self.position_of(nid) >= 0
+
+    def position_of(self, nid):
+        """
+        :return: the position of the node, or -1 if it is not in the graph
+        """
+        if type(nid) is not int:
+            nid = nid_key(nid)
+        pos = self.added_positions.get(nid)
+        if pos is None:
+            pos = self.index.position_of(nid)
+        if pos in self.removed_positions:
+            return -1
+        return pos
+
+    def nid_of(self, pos):
+        if pos < len(self.index):
+            return self.index.nid_of(pos)
+        return self.added_nids[pos - len(self.index)]
+
+    def cardinality_of(self, pos):
+        if pos < len(self.index):
+            return float(self.cardinality[pos])
+        return self.added_cardinality[pos - len(self.index)]
+
+    def add_node(self, nid, cardinality=None):
+        nid = nid_key(nid)
+        if cardinality is None:
+            cardinality = 0
+        pos = self.position_of(nid)
+        if 0 <= pos < len(self.index):
+            self.cardinality[pos] = cardinality
+        elif pos >= len(self.index):
+            self.added_cardinality[pos - len(self.index)] = cardinality
+        else:
+            self.added_positions[nid] = len(self)
+            self.added_nids.append(nid)
+            self.added_cardinality.append(cardinality)
+
+    def add_nodes(self, nid_keys, cardinality):
+        """
+        Adds many nodes at once. Their ids extend the NidIndex, concatenated after its ids as
+        build_columnar_schema concatenates batches, so the positions of the other nodes do not change.
+        Once nodes were added one by one, or if some of the ids are in the graph, each node is added
+        with add_node instead
+        :param nid_keys: ids of the nodes, as returned by _nid_keys
+        :param cardinality: cardinality of the nodes, nan if they have none
+        """
+        cardinality = np.nan_to_num(np.asarray(cardinality, dtype=np.float32))
+        new_index = NidIndex(nid_keys)
+        nids = [new_index.nid_of(pos) for pos in range(len(new_index))]
+        if len(self.added_nids) > 0 or any(self.position_of(nid) >= 0 for nid in nids):
+            for nid, card in zip(nids, cardinality.tolist()):
+                self.add_node(nid, card)
+            return
+        keys = self.index.nid_keys
+        if keys.dtype.kind != nid_keys.dtype.kind:
+            keys, nid_keys = keys.astype(str), nid_keys.astype(str)
+        start = len(self.index)
+        self.index = NidIndex(np.concatenate([keys, nid_keys]))
+        self.cardinality = np.concatenate([self.cardinality, cardinality])
+        # as in NidIndex, the last position of a repeated id wins
+        self.removed_positions.update(pos for pos in self.index.shadowed().tolist() if pos >= start)
+
+    def remove_node(self, nid):
+        pos = self.position_of(nid)
+        if pos < 0:
+            raise KeyError(nid)
+        for csr in self.relations.values():
+            indices, _ = csr.neighbors(pos)
+            for j in indices.tolist():
+                csr.remove(pos, j)
+            self._compact_if_needed(csr)
+        self.removed_positions.add(pos)
+
+    def add_edge(self, relation, i, j, score):
+        """
+        Adds or updates the edge between positions i and j of relation
+        """
+        csr = self.relation(relation)
+        csr.add(i, j, score)
+        self._compact_if_needed(csr)
+
+    def remove_edge(self, relation, i, j):
+        """
+        Removes the edge between positions i and j of relation, if it exists
+        """
+        csr = self.relation(relation)
+        csr.remove(i, j)
+        self._compact_if_needed(csr)
+
+    def add_edges(self, relation, src, tgt, scores):
+        """
+        Adds or updates many edges of relation at once, see CSRRelation.add_edges
+        """
+        self.relation(relation).add_edges(len(self), src, tgt, scores)
+
+    def _compact_if_needed(self, csr):
+        if csr.needs_compaction():
+            csr.compact(len(self))
+
+    def relation(self, relation):
+        """
+        :return: the CSRRelation of relation, empty if it has no edges
+        """
+        csr = self.relations.get(relation)
+        if csr is None:
+            csr = CSRRelation(len(self))
+            self.relations[relation] = csr
+        return csr
+
+    def degrees(self):
+        degrees = np.zeros(len(self), dtype=np.int64)
+        for csr in self.relations.values():
+            degrees += csr.degrees(len(self))
+        return degrees
+
+    def compact(self):
+        for csr in self.relations.values():
+            csr.compact(len(self))
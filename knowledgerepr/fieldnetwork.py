@@ -1,7 +1,12 @@
 import matplotlib.pyplot as plt
+import copy
+import heapq
+import itertools
 import operator
 import networkx as nx
 import os
+import sys
+import numpy as np
 
 
 from collections import defaultdict
@@ -11,7 +16,14 @@ from api.apiutils import OP
 from api.apiutils import Hit
 from api.apiutils import Relation
 from api.apiutils import compute_field_id
+from api.apiutils import nid_key
 from api.annotation import MRS
+from knowledgerepr import columnarschema
+from knowledgerepr import pathsearch
+from knowledgerepr import tablejoinindex
+from knowledgerepr import traversal
+from knowledgerepr.tablejoinindex import TableJoinIndex, TableReachability
+from knowledgerepr.csrgraph import CSRGraph
 
 
 def build_hit(sn, fn):
@@ -26,12 +38,17 @@ class FieldNetwork:
     __source_ids = defaultdict(list)
 
     def __init__(self, graph=None, id_names=None, source_ids=None):
-        if graph is None:
-            self.__G = nx.MultiGraph()
-        else:
-            self.__G = graph
-            self.__id_names = id_names
-            self.__source_ids = source_ids
+        # fresh containers, otherwise all instances share the class-level ones
+        self.__G = graph if graph is not None else nx.MultiGraph()
+        self.__id_names = id_names if id_names is not None else dict()
+        self.__source_ids = source_ids if source_ids is not None else defaultdict(list)
+        # Relation -> TableJoinIndex, built the first time each one is used
+        self.__table_joins = dict()
+        # Relation -> TableReachability, dropped when the relation changes
+        self.__table_reachability = dict()
+        # Relation -> id -> {id of neighbor: score}, built the first time neighbors by each relation
+        # are looked up
+        self.__adjacency = dict()
 
     def graph_order(self):
         return len(self.__id_names.keys())
@@ -57,12 +74,14 @@ class FieldNetwork:
         return self.__source_ids[source]
 
     def get_data_type_of(self, nid):
-        _, _, _, data_type = self.__id_names[nid]
+        _, _, _, data_type = self.__id_names[nid_key(nid)]
         return data_type
 
     def get_info_for(self, nids):
         info = []
         for nid in nids:
+            if type(nid) is not int:
+                nid = nid_key(nid)
             db_name, source_name, field_name, data_type = self.__id_names[nid]
             info.append((nid, db_name, source_name, field_name))
         return info
@@ -78,8 +97,15 @@ class FieldNetwork:
         return hits
 
     def get_cardinality_of(self, node_id):
-        c = self.__G.node[node_id]
-        card = c['cardinality']
+        node_id = nid_key(node_id)
+        c = self.__G.node.get(node_id)
+        if c is not None and 'cardinality' in c:
+            card = c['cardinality']
+        elif isinstance(self.__id_names, columnarschema.ColumnarIdInfo):
+            # fields ingested in bulk are only added to the graph when they get relations
+            card = self.__id_names.cardinality_of(node_id)
+        else:
+            raise KeyError(node_id)
         if card is None:
             return 0  # no cardinality is like card 0
         return card
@@ -103,20 +129,29 @@ class FieldNetwork:
         and one of:
         sourcename -> id
         Then it also initializes the graph with all the nodes, e.g., ids and the cardinality
-        for these, if any.
+        for these, if any. Ids are kept as ints (see nid_key) and names are interned, so that
+        the fields of a table or a db share their names
         :param fields:
         :return:
         """
         print("Building schema relation...")
-        for (nid, db_name, sn_name, fn_name, total_values, unique_values, data_type) in fields:
-            self.__id_names[nid] = (db_name, sn_name, fn_name, data_type)
-            self.__source_ids[sn_name].append(nid)
-            cardinality_ratio = None
-            if float(total_values) > 0:
-                cardinality_ratio = float(unique_values) / float(total_values)
-            self.add_field(nid, cardinality_ratio)
+        self.add_fields(fields)
         print("Building schema relation...OK")
 
+    def init_meta_schema_batches(self, batches):
+        """
+        Bulk version of init_meta_schema for large stores. The fields are kept in columnar arrays
+        (see columnarschema) instead of dicts of tuples, and are only added to the graph once they
+        get relations
+        :param batches: iterable of lists of fields, as StoreHandler.get_all_fields_batches returns them
+        :return:
+        """
+        if len(self.__id_names) > 0:
+            raise ValueError("Bulk ingestion requires an empty network")
+        print("Building schema relation (bulk)...")
+        self.__id_names, self.__source_ids = columnarschema.build_columnar_schema(batches)
+        print("Building schema relation (bulk)...OK")
+
     def add_field(self, nid, cardinality=None):
         """
         Creates a graph node for this field and adds it to the graph
@@ -124,20 +159,50 @@ class FieldNetwork:
         :param cardinality: the cardinality of the values of the node, if any
         :return: the newly added field node
         """
+        if type(nid) is not int:
+            nid = nid_key(nid)
         self.__G.add_node(nid, cardinality=cardinality)
         return nid
 
+    def remove_field(self, nid):
+        """
+        Removes the field from the graph, together with all its relations, and from the
+        id -> info and source -> ids maps. The source is dropped when it has no fields left
+        :param nid: the id of the field
+        :return:
+        """
+        nid = nid_key(nid)
+        relations = set(self.__table_joins.keys()) | set(self.__adjacency.keys())
+        for relation in relations:
+            for neighbor in list(self.relation_neighbors(nid, relation)):
+                self._unindex_relation(relation, nid, neighbor)
+        if nid in self.__G:
+            self.__G.remove_node(nid)
+        _, source_name, _, _ = self.__id_names.pop(nid)
+        source_ids = self.__source_ids[source_name]
+        source_ids.remove(nid)
+        if len(source_ids) == 0:
+            del self.__source_ids[source_name]
+
     def add_fields(self, list_of_fields):
         """
-        Creates a list of graph nodes from the list of fields and adds them to the graph
-        :param list_of_fields: list of (source_name, field_name) tuples
-        :return: the newly added list of field nodes
+        Adds the fields to the id -> info and source -> ids maps, and creates a graph node for each
+        one with add_field
+        :param list_of_fields: iterable of
+        (nid, db_name, source_name, field_name, total_values, unique_values, data_type), as in
+        init_meta_schema
+        :return: the ids of the newly added field nodes
         """
         nodes = []
-        for nid, sn, fn in list_of_fields:
-            n = Hit(nid, sn, fn, -1)
-            nodes.append(n)
-        self.__G.add_nodes_from(nodes)
+        for (nid, db_name, sn_name, fn_name, total_values, unique_values, data_type) in list_of_fields:
+            nid = nid_key(nid)
+            db_name, sn_name, fn_name = sys.intern(db_name), sys.intern(sn_name), sys.intern(fn_name)
+            self.__id_names[nid] = (db_name, sn_name, fn_name, data_type)
+            self.__source_ids[sn_name].append(nid)
+            cardinality_ratio = None
+            if float(total_values) > 0:
+                cardinality_ratio = float(unique_values) / float(total_values)
+            nodes.append(self.add_field(nid, cardinality_ratio))
         return nodes
 
     def add_relation(self, node_src, node_target, relation, score):
@@ -149,9 +214,141 @@ class FieldNetwork:
         :param score: the numerical value of the score
         :return:
         """
+        node_src, node_target = nid_key(node_src), nid_key(node_target)
+        self._index_relation(relation, [(node_src, node_target, score)])
         score = {'score': score}
         self.__G.add_edge(node_src, node_target, relation, score)
 
+    def add_relations(self, relation, edges):
+        """
+        Adds or updates the score of relation for many edges at once
+        :param relation: the type of relation (edge)
+        :param edges: iterable of (node_src, node_target, score)
+        :return:
+        """
+        edges = [(nid_key(src), nid_key(target), score) for src, target, score in edges]
+        self._index_relation(relation, edges)
+        self.__G.add_edges_from((src, target, relation, {'score': score}) for src, target, score in edges)
+
+    def iterate_relation_edges(self, relation):
+        """
+        Iterates the edges of relation, each one once
+        :param relation: the type of relation (edge)
+        :return: generator of (node_src, node_target, score)
+        """
+        for src, target, key, data in self.__G.edges_iter(keys=True, data=True):
+            if key == relation:
+                yield src, target, data['score']
+
+    def iterate_edges(self):
+        """
+        Iterates the edges of all relations, each one once
+        :return: generator of (node_src, node_target, relation, score)
+        """
+        for src, target, key, data in self.__G.edges_iter(keys=True, data=True):
+            yield src, target, key, data['score']
+
+    def remove_relation(self, node_src, node_target, relation):
+        """
+        Removes the relation between node_src and node_target, if it exists
+        """
+        node_src, node_target = nid_key(node_src), nid_key(node_target)
+        self._unindex_relation(relation, node_src, node_target)
+        if self.__G.has_edge(node_src, node_target, key=relation):
+            self.__G.remove_edge(node_src, node_target, key=relation)
+
+    def table_join_index(self, relation):
+        """
+        :param relation: the type of relation (edge) that joins tables, e.g., PKFK
+        :return: the TableJoinIndex of relation. It is built the first time it is requested, and kept
+        up to date with the edges added and removed afterwards
+        """
+        index = self.__table_joins.get(relation)
+        if index is None:
+            index = TableJoinIndex(self.__id_names)
+            index.add_edges(self.iterate_relation_edges(relation))
+            self.__table_joins[relation] = index
+        return index
+
+    def table_reachability(self, relation, max_hops=2):
+        """
+        :param relation: the type of relation (edge) that joins tables, e.g., PKFK
+        :param max_hops: maximum number of joins between tables whose distance is needed
+        :return: the TableReachability of relation. It is built when it is first requested, or after
+        the relation changes, unless one was set with set_table_reachability
+        """
+        reachability = self.__table_reachability.get(relation)
+        if reachability is None or reachability.max_hops < max_hops:
+            reachability = TableReachability.build(self.table_join_index(relation), max_hops=max_hops)
+            self.__table_reachability[relation] = reachability
+        return reachability
+
+    def set_table_reachability(self, relation, reachability):
+        """
+        Uses reachability, e.g., the one stored with the model, as the TableReachability of relation
+        """
+        self.__table_reachability[relation] = reachability
+
+    def _relation_adjacency(self, relation):
+        """
+        :param relation: the type of relation (edge)
+        :return: id -> {id of neighbor: score} of relation, so that looking up the neighbors of a field
+        does not go through its edges of other relations. It is built from the edges of relation the
+        first time it is requested, and kept up to date afterwards
+        """
+        adjacency = self.__adjacency.get(relation)
+        if adjacency is None:
+            adjacency = dict()
+            # in the order of the neighbors in the graph, which find_path_table follows
+            for nid, neighbors in self.__G.adjacency_iter():
+                for k, edges in neighbors.items():
+                    data = edges.get(relation)
+                    if data is not None:
+                        adjacency.setdefault(nid, dict())[k] = data['score']
+            self.__adjacency[relation] = adjacency
+        return adjacency
+
+    def _ranked_neighbors(self, nid, relation, top_k=None, min_score=None):
+        """
+        :param nid: id of a field
+        :param relation: the type of relation (edge)
+        :param top_k: maximum number of neighbors, all of them if None
+        :param min_score: minimum score of the neighbors, if any
+        :return: list of (id of neighbor, score) of nid by relation with the highest scores, highest
+        first, and ties in the order of the adjacency
+        """
+        neighbors = self._relation_adjacency(relation).get(nid, dict()).items()
+        if min_score is not None:
+            neighbors = [(k, score) for k, score in neighbors if score >= min_score]
+        if top_k is None:
+            return sorted(neighbors, key=operator.itemgetter(1), reverse=True)
+        # same as sorting them and keeping the first top_k, without sorting all of them
+        return heapq.nlargest(top_k, neighbors, key=operator.itemgetter(1))
+
+    def _index_relation(self, relation, edges):
+        self.__table_reachability.pop(relation, None)
+        index = self.__table_joins.get(relation)
+        if index is not None:
+            index.add_edges(edges)
+        neighbors = self.__adjacency.get(relation)
+        if neighbors is not None:
+            for node_src, node_target, score in edges:
+                neighbors.setdefault(node_src, dict())[node_target] = score
+                neighbors.setdefault(node_target, dict())[node_src] = score
+
+    def _unindex_relation(self, relation, node_src, node_target):
+        self.__table_reachability.pop(relation, None)
+        index = self.__table_joins.get(relation)
+        if index is not None:
+            index.remove(node_src, node_target)
+        neighbors = self.__adjacency.get(relation)
+        if neighbors is not None:
+            for nid, other in [(node_src, node_target), (node_target, node_src)]:
+                if nid in neighbors:
+                    neighbors[nid].pop(other, None)
+                    if len(neighbors[nid]) == 0:
+                        del neighbors[nid]
+
     def fields_degree(self, topk):
         degree = nx.degree(self.__G)
         sorted_degree = sorted(degree.items(), key=operator.itemgetter(1))
@@ -214,106 +411,208 @@ class FieldNetwork:
         if relation == Relation.CONTAINER:
             return OP.CONTAINER
 
-    def neighbors_id(self, hit: Hit, relation: Relation) -> DRS:
-        if isinstance(hit, Hit):
-            nid = str(hit.nid)
-        if isinstance(hit, str):
-            nid = hit
-        nid = str(nid)
+    def neighbors_id(self, hit: Hit, relation: Relation, top_k=None, min_score=None,
+                     lazy_provenance=False) -> DRS:
+        """
+        :param hit: Hit or id of the field
+        :param relation: the type of relation (edge)
+        :param top_k: if given, only the top_k neighbors with the highest scores, highest first
+        :param min_score: if given, only the neighbors with a score of at least min_score
+        :param lazy_provenance: if True, the provenance of the output DRS is lazy (see DRS)
+        :return: DRS with the neighbors of the field
+        """
+        nid = hit.nid if isinstance(hit, Hit) else nid_key(hit)
         data = []
-        neighbours = self.__G[nid]
-        for k, v in neighbours.items():
-            if relation in v:
-                score = v[relation]['score']
-                (db_name, source_name, field_name, data_type) = self.__id_names[k]
-                data.append(Hit(k, db_name, source_name, field_name, score))
+        neighbours = self._relation_adjacency(relation).get(nid)
+        if neighbours is None:
+            if nid not in self.__G and nid not in self.__id_names:
+                raise KeyError(nid)
+            neighbours = dict()  # no relations of this type, or a field ingested in bulk
+        neighbours = neighbours.items()
+        if top_k is not None or min_score is not None:
+            neighbours = self._ranked_neighbors(nid, relation, top_k, min_score)
+        for k, score in neighbours:
+            (db_name, source_name, field_name, data_type) = self.__id_names[k]
+            data.append(Hit(k, db_name, source_name, field_name, score))
         op = self.get_op_from_relation(relation)
-        o_drs = DRS(data, Operation(op, params=[hit]))
+        o_drs = DRS(data, Operation(op, params=[hit]), lazy_provenance=lazy_provenance)
         return o_drs
 
-    def md_neighbors_id(self, hit: Hit, md_neighbors: MRS, relation: Relation) -> DRS:
-        if isinstance(hit, Hit):
-            nid = str(hit.nid)
-        if isinstance(hit, str):
-            nid = hit
-        nid = str(nid)
+    def neighbors_ids(self, hits, relation: Relation, top_k=None, min_score=None,
+                      lazy_provenance=False) -> DRS:
+        """
+        Neighbors of many fields at once. Same result as absorbing the neighbors_id of each field into
+        a carrier DRS, but the output DRS and its provenance are built once
+        :param hits: iterable of Hit or ids
+        :param relation: the type of relation (edge)
+        :param top_k: if given, only the top_k neighbors with the highest scores of each field
+        :param min_score: if given, only the neighbors with a score of at least min_score
+        :param lazy_provenance: if True, the provenance of the output DRS is lazy (see DRS)
+        :return: DRS with the neighbors of all the fields, each one once
+        """
+        adjacency = self._relation_adjacency(relation)
+        ranked = top_k is not None or min_score is not None
+        sources = []
+        for hit in hits:
+            if not isinstance(hit, Hit):
+                hit = self.get_hits_from_info(self.get_info_for([hit]))[0]
+            if ranked:
+                sources.append((hit, self._ranked_neighbors(hit.nid, relation, top_k, min_score)))
+            else:
+                sources.append((hit, adjacency.get(hit.nid, dict()).items()))
+        return self._neighbors_drs(sources, relation, lazy_provenance)
+
+    def _neighbors_drs(self, sources, relation, lazy_provenance=False):
+        """
+        :param sources: list of (Hit, iterable of (id of neighbor, score))
+        :param lazy_provenance: if True, the provenance of the output DRS is lazy (see DRS)
+        :return: DRS with the neighbors, each one once with its last score, as absorb leaves them, and
+        an edge from each Hit to its neighbors
+        """
+        op = self.get_op_from_relation(relation)
+        hits = dict()
+        edges = []
+        for source, neighbors in sources:
+            for k, score in neighbors:
+                (db_name, source_name, field_name, data_type) = self.__id_names[k]
+                hit = Hit(k, db_name, source_name, field_name, score)
+                hits[k] = hit
+                edges.append((source, hit, op, dict()))
+        o_drs = DRS(list(hits.values()), Operation(OP.NONE), lazy_provenance=lazy_provenance)
+        o_drs.get_provenance().add_edges([source for source, _ in sources], edges)
+        return o_drs
+
+    def traverse(self, hits, relation: Relation, max_hops, max_results=None, workers=None,
+                 use_processes=False, lazy_provenance=False) -> DRS:
+        """
+        Fields reachable from hits in at most max_hops hops of relation. Each field is expanded once,
+        on the hop after the one where it is first reached, and the output DRS and its provenance are
+        built once at the end
+        :param hits: iterable of Hit or ids
+        :param relation: the type of relation (edge)
+        :param max_hops: maximum number of hops
+        :param max_results: if given, the traversal stops once this many fields are reached
+        :param workers: if more than 1, large frontiers are expanded by this many threads
+        :param use_processes: if True, the workers are forked processes instead of threads
+        :param lazy_provenance: if True, the provenance of the output DRS is lazy (see DRS)
+        :return: DRS with the reached fields, and an edge from each expanded field to its neighbors
+        """
+        sources = dict()
+        for hit in hits:
+            if not isinstance(hit, Hit):
+                hit = self.get_hits_from_info(self.get_info_for([hit]))[0]
+            sources[hit.nid] = hit
+        neighbors = self._traversal_neighbors(relation)
+        if workers is not None and workers > 1:
+            expander_type = traversal.ProcessExpander if use_processes else traversal.ThreadExpander
+            with expander_type(neighbors, workers) as expander:
+                expansions = traversal.traverse(neighbors, list(sources), max_hops, max_results, expander)
+        else:
+            expansions = traversal.traverse(neighbors, list(sources), max_hops, max_results)
+        id_names = self._get_underlying_repr_id_to_field_info()
+        expanded = []
+        for nid, followed in expansions:
+            hit = sources.get(nid)
+            if hit is None:
+                (db_name, source_name, field_name, data_type) = id_names[nid]
+                hit = Hit(nid, db_name, source_name, field_name, 0)
+            expanded.append((hit, followed))
+        return self._neighbors_drs(expanded, relation, lazy_provenance)
+
+    def _traversal_neighbors(self, relation):
+        """
+        :return: function of an id to an iterable of (id of neighbor, score) by relation
+        """
+        adjacency = self._relation_adjacency(relation)
+
+        def neighbors(nid):
+            return adjacency.get(nid, dict()).items()
+        return neighbors
+
+    def relation_neighbors(self, nid, relation):
+        """
+        :param nid: id of a field
+        :param relation: the type of relation (edge)
+        :return: dict of the ids of the neighbors of nid by relation -> score of the edge. It must not
+        be changed
+        """
+        if type(nid) is not int:
+            nid = nid_key(nid)
+        return self._relation_adjacency(relation).get(nid, dict())
+
+    def md_neighbors_id(self, hit: Hit, md_neighbors: MRS, relation: Relation, lazy_provenance=False) -> DRS:
+        nid = hit.nid if isinstance(hit, Hit) else nid_key(hit)
         data = []
         score = 1.0 # TODO: return more meaningful score results
         for hit in md_neighbors:
-            k = hit.target if hit.target != nid else hit.source
+            k = nid_key(hit.target)
+            if k == nid:
+                k = nid_key(hit.source)
             (db_name, source_name, field_name, data_type) = self.__id_names[k]
             data.append(Hit(k, db_name, source_name, field_name, score))
         op = self.get_op_from_relation(relation)
-        o_drs = DRS(data, Operation(op, params=[hit]))
+        o_drs = DRS(data, Operation(op, params=[hit]), lazy_provenance=lazy_provenance)
         return o_drs
 
-    def find_path_hit(self, source, target, relation, max_hops=5):
+    def find_path_hit(self, source, target, relation, max_hops=5, k=1, lazy_provenance=False):
+        """
+        Shortest paths of relation between two fields, see pathsearch
+        :param source: Hit where paths start
+        :param target: Hit where paths end
+        :param relation: the type of relation (edge)
+        :param max_hops: maximum number of edges of a path
+        :param k: maximum number of paths, shortest first
+        :param lazy_provenance: if True, the provenance of the output DRS is lazy (see DRS)
+        :return: DRS with the provenance of the paths, empty if there is none
+        """
 
         def assemble_field_path_provenance(o_drs, path, relation):
             src = path[0]
             tgt = path[-1]
-            origin = DRS([src], Operation(OP.ORIGIN))
+            origin = DRS([src], Operation(OP.ORIGIN), lazy_provenance=lazy_provenance)
             o_drs.absorb_provenance(origin)
             prev_c = src
             for c in path[1:-1]:
-                nxt = DRS([c], Operation(OP.PKFK, params=[prev_c]))
+                nxt = DRS([c], Operation(OP.PKFK, params=[prev_c]), lazy_provenance=lazy_provenance)
                 o_drs.absorb_provenance(nxt)
                 prev_c = c
-            sink = DRS([tgt], Operation(OP.PKFK, params=[prev_c]))
+            sink = DRS([tgt], Operation(OP.PKFK, params=[prev_c]), lazy_provenance=lazy_provenance)
             o_drs = o_drs.absorb(sink)
             return o_drs
 
-        def deep_explore(candidates, target_group, already_visited, path, max_hops):
-            """
-            Recursively depth-first explore the graph, checking if candidates are in target_group
-            Returns (boolean, [])
-            """
-            local_max_hops = max_hops
-
-            if local_max_hops == 0:
-                return False
-
-            # first check membership
-            for c in candidates:
-                if c in target_group:
-                    path.insert(0, c)
-                    return True
-
-            # if not, then we explore these individually
-            for c in candidates:
-                if c in already_visited:
-                    continue  # next candidate
-                else:
-                    already_visited.append(c)  # add candidate to set of already visited
-
-                next_level_candidates = [x for x in self.neighbors_id(c, relation)]  # get next set of candidates
-
-                if len(next_level_candidates) == 0:
-                    continue
-                next_max_hops = local_max_hops - 1  # reduce one level depth and go ahead
-                success = deep_explore(next_level_candidates, target_group, already_visited, path, next_max_hops)
-                if success:
-                    path.insert(0, c)
-                    return True
-            return False  # if all nodes were already visited
-
-        # maximum number of hops
-        max_hops = 5
-
-        o_drs = DRS([], Operation(OP.NONE))  # Carrier of provenance
-
-        # TODO: same src == trg, etc
-
-        path = []
-
-        success = deep_explore([source], [target], [], path, max_hops)
-        if success:
-            o_drs = assemble_field_path_provenance(o_drs, path, relation)
-            return o_drs
-        else:
-            return DRS([], Operation(OP.NONE))
+        def path_hits(path):
+            hits = [source]
+            for prev_nid, nid in zip(path, path[1:]):
+                (db_name, source_name, field_name, data_type) = self.__id_names[nid]
+                score = self.relation_neighbors(prev_nid, relation)[nid]
+                hits.append(Hit(nid, db_name, source_name, field_name, score))
+            return hits
+
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=lazy_provenance)  # Carrier of provenance
+
+        neighbors = lambda nid: self.relation_neighbors(nid, relation).keys()
+        paths = pathsearch.k_shortest_paths(neighbors, source.nid, target.nid, max_hops, k=k)
+        if len(paths) == 0:
+            return DRS([], Operation(OP.NONE), lazy_provenance=lazy_provenance)
+        for path in paths:
+            o_drs = assemble_field_path_provenance(o_drs, path_hits(path), relation)
+        return o_drs
 
-    def find_path_table(self, source: str, target: str, relation, api, max_hops=3, lean_search=False):
+    def find_path_table(self, source: str, target: str, relation, api, max_hops=3, lean_search=False,
+                        lazy_provenance=False):
+        """
+        Join paths between two tables, searched over the table join index of relation. Each path is a
+        list of (field, sibling) where field joins the next table of the path and sibling is the field
+        of the same table that the previous table joins
+        :param source: name of the table where paths start
+        :param target: name of the table where paths end
+        :param relation: the type of relation (edge) that joins tables, e.g., PKFK
+        :param api: unused, tables are no longer expanded through the API
+        :param max_hops: maximum number of joins of a path
+        :param lean_search: unused, no per-table DRS are built anymore
+        :param lazy_provenance: if True, the provenance of the output DRS is lazy (see DRS)
+        :return: DRS with the provenance of the paths
+        """
 
         def assemble_table_path_provenance(o_drs, paths, relation):
 
@@ -321,119 +620,254 @@ class FieldNetwork:
                 src, src_sibling = path[0]
                 assert (src_sibling is None)  # sibling of source should be None, as source is an origin
                 tgt, tgt_sibling = path[-1]
-                origin = DRS([src], Operation(OP.ORIGIN))
+                origin = DRS([src], Operation(OP.ORIGIN), lazy_provenance=lazy_provenance)
                 o_drs.absorb_provenance(origin)
                 prev_c = src
                 for c, sibling in path[1:-1]:
-                    nxt = DRS([sibling], Operation(OP.PKFK, params=[prev_c]))
+                    nxt = DRS([sibling], Operation(OP.PKFK, params=[prev_c]), lazy_provenance=lazy_provenance)
                     o_drs.absorb_provenance(nxt)
                     if c.nid != sibling.nid:  # avoid loop on head nodes of the graph
-                        linker = DRS([c], Operation(OP.TABLE, params=[sibling]))
+                        linker = DRS([c], Operation(OP.TABLE, params=[sibling]), lazy_provenance=lazy_provenance)
                         o_drs.absorb_provenance(linker)
                     prev_c = c
-                sink = DRS([tgt_sibling], Operation(OP.PKFK, params=[prev_c]))
+                sink = DRS([tgt_sibling], Operation(OP.PKFK, params=[prev_c]), lazy_provenance=lazy_provenance)
 
                 #The join path at the target has None sibling
                 if tgt is not None and tgt_sibling is not None and tgt.nid != tgt_sibling.nid:
                     o_drs = o_drs.absorb_provenance(sink)
-                    linker = DRS([tgt], Operation(OP.TABLE, params=[tgt_sibling]))
+                    linker = DRS([tgt], Operation(OP.TABLE, params=[tgt_sibling]), lazy_provenance=lazy_provenance)
                     o_drs.absorb(linker)
                 else:
                     o_drs = o_drs.absorb(sink)
             return o_drs
 
-        def check_membership(c, paths):
-            for p in paths:
-                for (s, sibling) in p:
-                    if c.source_name == s.source_name:
-                        return True
-            return False
-
-        def append_to_paths(paths, c):
-            new_paths = []
-            for p in paths:
-                new_path = []
-                new_path.extend(p)
-                new_path.append(c)
-                new_paths.append(new_path)
-            return new_paths
-
-        def get_table_neighbors(hit, relation, paths):
-            results = []
-            direct_neighbors = self.neighbors_id(hit, relation)
-
-            # Rewriting results - filtering out results that are in the same table as the input. Rewriting prov
-            direct_neighbors_list = [neigh for neigh in direct_neighbors if neigh.source_name != hit.source_name]
-            op = self.get_op_from_relation(relation)
-            direct_neighbors = DRS(direct_neighbors_list, Operation(op, params=[hit]))
-
-            # FIXME: filter out already seen nodes here
-            for n in direct_neighbors:
-                if not check_membership(n, paths):
-                    if lean_search:
-                        t_neighbors = api._drs_from_table_hit_lean_no_provenance(n)
-                    else:
-                        t_neighbors = api.drs_from_table_hit(n)  # Brought old API
-                    # t_neighbors = api.make_drs(n)  # XXX: this won't take all table neighbors, only the input one
-                    results.extend([(x, n) for x in t_neighbors])
-            return results  # note how we include hit as sibling of x here
-
-        def dfs_explore(sources, targets, max_hops, paths):
-
-            target_nid_set = set([x.nid for x in targets])
-
-            # Check if sources have reached targets
-            for (s, sibling) in sources:
-                if s.nid in target_nid_set:  # faster than using the generic __eq__ of Hit
-                #if s in targets:
-                    # Append successful paths to found_paths
-                    # T1.A join T2.B, and T2.C may join with other tables T3.D
-                    # get_table_neighbors returns next_candidates (s, sibling) (C,B)
-                    # in case T2 is the target add to the path (sibling, sibling)
-                    # Otherwise (C,B)
-                    if s.source_name == targets[0].source_name:
-                        next_paths = append_to_paths(paths, (sibling, sibling))
-                    else:
-                        next_paths = append_to_paths(paths, (s, sibling))
-                    found_paths.extend(next_paths)
-                    return True
+        def build_hit(nid, score):
+            (db_name, source_name, field_name, data_type) = self.__id_names[nid]
+            return Hit(nid, db_name, source_name, field_name, score)
 
+        def get_table_joins(table, visited):
+            """
+            Fields of table, in their order in the table, that join tables not in visited, each with
+            the list of (field, table, score) it joins, in the order of its neighbors
+            """
+            exits = set(field for other, keys in index.neighbors(table).items() if other not in visited
+                        for field, _ in keys)
+            table_joins = []
+            for nid in self.get_fields_of_source(table):
+                if nid not in exits:
+                    continue
+                joins = []
+                for field, score in self.relation_neighbors(nid, relation).items():
+                    _, other, _, _ = self.__id_names[field]
+                    if other != table and other not in visited:
+                        joins.append((field, other, score))
+                table_joins.append((nid, joins))
+            return table_joins
+
+        def dfs_explore(table, sibling, path, visited, max_hops):
+            if table == target:
+                found_paths.append(path + [(sibling, sibling)])
+                return
             # Check if no more hops are allowed:
             if max_hops == 0:
-                return False  # not found path
-
-            # Get next set of candidates and keep exploration
-            for (s, sibling) in sources:
-                next_candidates = get_table_neighbors(s, relation, paths)  # updated paths to test membership
-                # recursive on new candidates, one fewer hop and updated paths
-                if len(next_candidates) == 0:
+                return
+            visited = visited | {table}
+            for nid, joins in get_table_joins(table, visited):
+                next_path = path + [(build_hit(nid, 0), sibling)]
+                # as soon as a field joins the target there is no need to look further from it
+                to_target = [(field, score) for field, other, score in joins if other == target]
+                if len(to_target) > 0:
+                    hit = build_hit(*to_target[0])
+                    found_paths.append(next_path + [(hit, hit)])
                     continue
-                next_paths = append_to_paths(paths, (s, sibling))
-                dfs_explore(next_candidates, targets, max_hops - 1, next_paths)
+                for field, other, score in joins:
+                    dfs_explore(other, build_hit(field, score), next_path, visited, max_hops - 1)
 
-        o_drs = DRS([], Operation(OP.NONE))  # Carrier of provenance
+        index = self.table_join_index(relation)
 
-        # TODO: same src == trg, etc
-
-        # src_drs = api.drs_from_table(source)
-        # trg_drs = api.drs_from_table(target)
-        src_drs = api.make_drs(source)
-        trg_drs = api.make_drs(target)
+        o_drs = DRS([], Operation(OP.NONE), lazy_provenance=lazy_provenance)  # Carrier of provenance
 
         found_paths = []
-        candidates = [(x, None) for x in src_drs]  # tuple carrying candidate and same-table attribute
+        dfs_explore(source, None, [], set(), max_hops)
 
-        paths = [[]]  # to carry partial paths
+        o_drs = assemble_table_path_provenance(o_drs, found_paths, relation)
 
-        dfs_explore(candidates, [x for x in trg_drs], max_hops, paths)
+        return o_drs
 
-        # for p in found_paths:
-        #     print(p)
 
-        o_drs = assemble_table_path_provenance(o_drs, found_paths, relation)
+class CSRFieldNetwork(FieldNetwork):
+    """
+    FieldNetwork whose relations are kept in a CSRGraph (int32 neighbor arrays and float32 scores per
+    relation) instead of a networkx MultiGraph. Use deserialize_network(path, backend='csr') or
+    to_csr_network to get one
+    """
 
+    def __init__(self, graph=None, id_names=None, source_ids=None):
+        if graph is None:
+            graph = CSRGraph(columnarschema.NidIndex.from_nids([]), [])
+        super().__init__(graph, id_names, source_ids)
+
+    def init_meta_schema_batches(self, batches):
+        """
+        Bulk version of init_meta_schema. The fields are kept in columnar arrays as in FieldNetwork,
+        and all of them become nodes of the graph at once, in the order of the arrays
+        :param batches: iterable of lists of fields, as StoreHandler.get_all_fields_batches returns them
+        :return:
+        """
+        G = self._get_underlying_repr_graph()
+        if len(G) > 0:
+            raise ValueError("Bulk ingestion requires an empty network")
+        super().init_meta_schema_batches(batches)
+        id_names = self._get_underlying_repr_id_to_field_info()
+        G.add_nodes(id_names.index.nid_keys, id_names.cardinality)
+
+    def get_cardinality_of(self, node_id):
+        G = self._get_underlying_repr_graph()
+        pos = G.position_of(nid_key(node_id))
+        if pos < 0:
+            raise KeyError(node_id)
+        return G.cardinality_of(pos)
+
+    def _visualize_graph(self):
+        nx.draw(self._get_underlying_repr_graph().to_networkx())
+
+    def add_relation(self, node_src, node_target, relation, score):
+        G = self._get_underlying_repr_graph()
+        node_src, node_target = nid_key(node_src), nid_key(node_target)
+        for nid in [node_src, node_target]:
+            if nid not in G:
+                G.add_node(nid)
+        self._index_relation(relation, [(node_src, node_target, score)])
+        G.add_edge(relation, G.position_of(node_src), G.position_of(node_target), score)
+
+    def add_relations(self, relation, edges):
+        """
+        Adds or updates the score of relation for many edges at once. They are merged into the CSR
+        arrays of relation in one go instead of going through the overlay one by one
+        :param relation: the type of relation (edge)
+        :param edges: iterable of (node_src, node_target, score)
+        :return:
+        """
+        G = self._get_underlying_repr_graph()
+        edges = [(nid_key(src), nid_key(target), score) for src, target, score in edges]
+        src, tgt, scores = [], [], []
+        for node_src, node_target, score in edges:
+            for nid in [node_src, node_target]:
+                if nid not in G:
+                    G.add_node(nid)
+            src.append(G.position_of(node_src))
+            tgt.append(G.position_of(node_target))
+            scores.append(score)
+        self._index_relation(relation, edges)
+        G.add_edges(relation, src, tgt, scores)
+
+    def iterate_relation_edges(self, relation):
+        G = self._get_underlying_repr_graph()
+        src, tgt, scores = G.relation(relation).edges()
+        for i, j, score in zip(src.tolist(), tgt.tolist(), scores.tolist()):
+            yield G.nid_of(i), G.nid_of(j), score
+
+    def iterate_edges(self):
+        for relation in list(self._get_underlying_repr_graph().relations.keys()):
+            for src, target, score in self.iterate_relation_edges(relation):
+                yield src, target, relation, score
+
+    def remove_relation(self, node_src, node_target, relation):
+        G = self._get_underlying_repr_graph()
+        node_src, node_target = nid_key(node_src), nid_key(node_target)
+        i = G.position_of(node_src)
+        j = G.position_of(node_target)
+        if i >= 0 and j >= 0:
+            self._unindex_relation(relation, node_src, node_target)
+            G.remove_edge(relation, i, j)
+
+    def fields_degree(self, topk):
+        G = self._get_underlying_repr_graph()
+        degrees = G.degrees()
+        top = np.argsort(-degrees, kind='mergesort')
+        topk_nodes = []
+        for pos in top.tolist():
+            if len(topk_nodes) == topk:
+                break
+            if pos not in G.removed_positions:
+                topk_nodes.append((G.nid_of(pos), int(degrees[pos])))
+        return topk_nodes
+
+    def neighbors_id(self, hit: Hit, relation: Relation, top_k=None, min_score=None,
+                     lazy_provenance=False) -> DRS:
+        nid = hit.nid if isinstance(hit, Hit) else nid_key(hit)
+        G = self._get_underlying_repr_graph()
+        id_names = self._get_underlying_repr_id_to_field_info()
+        pos = G.position_of(nid)
+        if pos < 0:
+            raise KeyError(nid)
+        data = []
+        if top_k is not None or min_score is not None:
+            indices, scores = G.relation(relation).top_neighbors(pos, top_k, min_score)
+        else:
+            indices, scores = G.relation(relation).neighbors(pos)
+        for j, score in zip(indices.tolist(), scores.tolist()):
+            k = G.nid_of(j)
+            (db_name, source_name, field_name, data_type) = id_names[k]
+            data.append(Hit(k, db_name, source_name, field_name, score))
+        op = self.get_op_from_relation(relation)
+        o_drs = DRS(data, Operation(op, params=[hit]), lazy_provenance=lazy_provenance)
         return o_drs
 
+    def neighbors_ids(self, hits, relation: Relation, top_k=None, min_score=None,
+                      lazy_provenance=False) -> DRS:
+        G = self._get_underlying_repr_graph()
+        csr = G.relation(relation)
+        ranked = top_k is not None or min_score is not None
+        sources = []
+        for hit in hits:
+            if not isinstance(hit, Hit):
+                hit = self.get_hits_from_info(self.get_info_for([hit]))[0]
+            pos = G.position_of(hit.nid)
+            if pos < 0:
+                raise KeyError(hit.nid)
+            if ranked:
+                indices, scores = csr.top_neighbors(pos, top_k, min_score)
+            else:
+                indices, scores = csr.neighbors(pos)
+            sources.append((hit, zip([G.nid_of(j) for j in indices.tolist()], scores.tolist())))
+        return self._neighbors_drs(sources, relation, lazy_provenance)
+
+    def _traversal_neighbors(self, relation):
+        G = self._get_underlying_repr_graph()
+        csr = G.relation(relation)
+
+        def neighbors(nid):
+            pos = G.position_of(nid)
+            if pos < 0:
+                return []
+            indices, scores = csr.neighbors(pos)
+            return zip([G.nid_of(j) for j in indices.tolist()], scores.tolist())
+        return neighbors
+
+    def relation_neighbors(self, nid, relation):
+        G = self._get_underlying_repr_graph()
+        pos = G.position_of(nid_key(nid))
+        if pos < 0:
+            return dict()
+        indices, scores = G.relation(relation).neighbors(pos)
+        return {G.nid_of(j): score for j, score in zip(indices.tolist(), scores.tolist())}
+
+
+def to_csr_network(network, copy_fields=True):
+    """
+    :param network: a FieldNetwork
+    :param copy_fields: if False, the CSRFieldNetwork shares the id -> info and source -> ids maps
+    of network, so network should not be used afterwards
+    :return: a CSRFieldNetwork with the fields and relations of network
+    """
+    id_names = network._get_underlying_repr_id_to_field_info()
+    source_ids = network._get_underlying_repr_table_to_ids()
+    if copy_fields:
+        id_names = copy.deepcopy(id_names)
+        source_ids = copy.deepcopy(source_ids)
+    return CSRFieldNetwork(CSRGraph.from_network(network), id_names, source_ids)
+
 
 def serialize_network_to_csv(network, path):
     nodes = set()
@@ -469,13 +903,62 @@ def serialize_network(network, path):
     nx.write_gpickle(table_to_ids, path + "table_ids.pickle")
 
 
-def deserialize_network(path):
+def deserialize_network(path, backend='networkx'):
+    """
+    :param path: directory of the model
+    :param backend: 'networkx' for a FieldNetwork, 'csr' for a CSRFieldNetwork. The graph is
+    converted if it was serialized with the other backend. 'mmap' opens the model file of the
+    directory (see modelformat) as a CSRFieldNetwork
+    :return: the network
+    """
+    if backend not in ['networkx', 'csr', 'mmap']:
+        raise ValueError("Unknown backend: {0}".format(backend))
+    if backend == 'mmap':
+        from knowledgerepr import modelformat
+        network = modelformat.open_model(path + modelformat.MODEL_FILE)
+        load_table_reachability(network, path)
+        return network
     G = nx.read_gpickle(path + "graph.pickle")
     id_to_info = nx.read_gpickle(path + "id_info.pickle")
     table_to_ids = nx.read_gpickle(path + "table_ids.pickle")
-    network = FieldNetwork(G, id_to_info, table_to_ids)
+    if isinstance(id_to_info, dict):
+        G, id_to_info = _upgrade_nids(G, id_to_info, table_to_ids)
+    if isinstance(G, CSRGraph):
+        network = CSRFieldNetwork(G, id_to_info, table_to_ids)
+        if backend == 'networkx':
+            network = FieldNetwork(G.to_networkx(), id_to_info, table_to_ids)
+    else:
+        network = FieldNetwork(G, id_to_info, table_to_ids)
+        if backend == 'csr':
+            network = to_csr_network(network, copy_fields=False)
+    load_table_reachability(network, path)
     return network
 
 
+def _upgrade_nids(G, id_to_info, table_to_ids):
+    """
+    Models serialized before field ids were kept as ints have string ids. They are converted once,
+    when the model is loaded
+    :return: (G, id_to_info) with int ids. The ids of table_to_ids are converted in place
+    """
+    if all(type(nid) is not str for nid in itertools.islice(id_to_info.keys(), 1)):
+        return G, id_to_info
+    if not isinstance(G, CSRGraph):
+        G = nx.relabel_nodes(G, nid_key)
+    id_to_info = {nid_key(nid): info for nid, info in id_to_info.items()}
+    for ids in table_to_ids.values():
+        ids[:] = [nid_key(nid) for nid in ids]
+    return G, id_to_info
+
+
+def load_table_reachability(network, path):
+    """
+    Sets the PKFK TableReachability stored in the model directory, if any, as the one of network
+    """
+    reachability = tablejoinindex.deserialize_table_reachability(path)
+    if reachability is not None:
+        network.set_table_reachability(Relation.PKFK, reachability)
+
+
 if __name__ == "__main__":
     print("Field Network")
@@ -0,0 +1,288 @@
+"""
+Binary, memory-mapped model format.
+
+A model file starts with a header: MAGIC, the format version (uint32), 4 reserved bytes and the
+length (uint64) of a JSON table of contents that follows it. The table of contents has the dtype,
+shape and offset of every array in the file. Arrays are aligned to 64 bytes:
+
+- nodes: ids (int64, or fixed-width strings), their stable argsort and the sorted ids
+- node attributes: db, source, field and data type codes, and float32 cardinality
+- string tables of db, source, field names and data types: utf-8 bytes and int64 offsets
+- table_ids: ids of each source, contiguous, with int64 offsets by source code
+- one CSR structure per relation: int64 indptr, int32 indices and float32 scores
+
+Arrays are opened with numpy.memmap, so opening a model reads only the header and processes that
+open the same model share its pages through the OS page cache. Arrays are mapped copy-on-write:
+changes to the network stay in the process that makes them.
+"""
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+from api.apiutils import Relation
+from knowledgerepr.columnarschema import NidIndex, ColumnarIdInfo, ColumnarTableIds, _nid_keys
+from knowledgerepr.csrgraph import CSRGraph, CSRRelation, LazyRelations
+from knowledgerepr.fieldnetwork import CSRFieldNetwork, deserialize_network
+
+MAGIC = b'AURUMMDL'
+FORMAT_VERSION = 1
+MODEL_FILE = "model.bin"
+ALIGNMENT = 64
+
+_HEADER = struct.Struct('<8sIIQ')
+
+
+class MappedStringTable:
+    """
+    Read-only string table over utf-8 bytes and offsets. Strings are decoded when they are read
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+        self.codes = None
+
+    def __getitem__(self, code):
+        code = int(code)
+        return bytes(self.data[self.offsets[code]:self.offsets[code + 1]]).decode('utf-8')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def code_of(self, string):
+        """
+        :return: the code of string, or -1 if it is not in the table. The lookup is built on first use
+        """
+        if self.codes is None:
+            self.load()
+        return self.codes.get(string, -1)
+
+    def load(self):
+        """
+        Builds the lookup of codes by string
+        """
+        self.codes = {self[code]: code for code in range(len(self))}
+
+
+def _encode_strings(strings):
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _intern(strings):
+    """
+    :return: (codes, distinct strings in order of first appearance)
+    """
+    table = dict()
+    codes = [table.setdefault(string, len(table)) for string in strings]
+    return codes, list(table.keys())
+
+
+def write_model(network, path):
+    """
+    Writes a FieldNetwork, with either backend, to a model file
+    :param network: the network
+    :param path: the model file
+    :return:
+    """
+    id_info = network._get_underlying_repr_id_to_field_info()
+    table_ids = network._get_underlying_repr_table_to_ids()
+    nids = list(network.iterate_ids())
+    graph = CSRGraph.from_network(network)
+
+    arrays = dict()
+    index = graph.index
+    arrays['nodes/keys'] = index.nid_keys
+    arrays['nodes/order'] = index.order
+    arrays['nodes/sorted_keys'] = index.sorted_keys
+    arrays['nodes/cardinality'] = graph.cardinality
+    infos = [id_info[nid] for nid in nids]
+    for i, name in enumerate(['db', 'source', 'field', 'data_type']):
+        codes, strings = _intern([info[i] for info in infos])
+        arrays['nodes/' + name + '_codes'] = np.array(codes, dtype=np.uint8 if name == 'data_type' else np.int32)
+        arrays['strings/' + name + '/data'], arrays['strings/' + name + '/offsets'] = _encode_strings(strings)
+
+    # table_ids keep their own order, and their own source names, e.g., tables with no fields left
+    sources = list(table_ids.keys())
+    source_nids = [table_ids[source] for source in sources]
+    arrays['strings/table/data'], arrays['strings/table/offsets'] = _encode_strings(sources)
+    arrays['tables/indptr'] = np.zeros(len(sources) + 1, dtype=np.int64)
+    np.cumsum([len(ids) for ids in source_nids], out=arrays['tables/indptr'][1:])
+    table_keys = _nid_keys([nid for ids in source_nids for nid in ids])
+    if table_keys.dtype.kind != index.nid_keys.dtype.kind:
+        table_keys = table_keys.astype(str)
+    arrays['tables/keys'] = table_keys
+
+    relations = []
+    for relation, csr in graph.relations.items():
+        relations.append(relation.name)
+        arrays['relations/' + relation.name + '/indptr'] = csr.indptr
+        arrays['relations/' + relation.name + '/indices'] = csr.indices
+        arrays['relations/' + relation.name + '/scores'] = csr.scores
+
+    toc = {'version': FORMAT_VERSION, 'num_nodes': len(nids), 'relations': relations, 'arrays': dict()}
+    # offsets depend on the length of the toc, which depends on the offsets: fix the toc length first
+    for name, array in arrays.items():
+        toc['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': 0}
+    toc_length = len(json.dumps(toc).encode('utf-8')) + 32 * len(arrays)
+    offset = _aligned(_HEADER.size + toc_length)
+    for name, array in arrays.items():
+        toc['arrays'][name]['offset'] = offset
+        offset = _aligned(offset + array.nbytes)
+    toc_bytes = json.dumps(toc).encode('utf-8').ljust(toc_length)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, toc_length))
+        f.write(toc_bytes)
+        for name, array in arrays.items():
+            f.seek(toc['arrays'][name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, path)
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def read_toc(path):
+    """
+    :return: the table of contents of a model file
+    """
+    with open(path, 'rb') as f:
+        magic, version, _, toc_length = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("{0} is not a model file".format(path))
+        if version != FORMAT_VERSION:
+            raise ValueError("Model format version {0} is not supported, expected {1}".format(version,
+                                                                                          FORMAT_VERSION))
+        return json.loads(f.read(toc_length).decode('utf-8'))
+
+
+def _map_array(path, spec):
+    shape = tuple(spec['shape'])
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=np.dtype(spec['dtype']))
+    return np.memmap(path, dtype=np.dtype(spec['dtype']), mode='c', offset=spec['offset'], shape=shape)
+
+
+class ModelFile:
+    """
+    The arrays of a model file, each one mapped the first time it is used
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.toc = read_toc(path)
+        self.arrays = dict()
+
+    def __getitem__(self, name):
+        array = self.arrays.get(name)
+        if array is None:
+            array = _map_array(self.path, self.toc['arrays'][name])
+            self.arrays[name] = array
+        return array
+
+    def warm(self, chunk_size=1 << 24):
+        """
+        Reads the whole file, so that its pages are in the OS page cache when the arrays are used
+        """
+        with open(self.path, 'rb') as f:
+            while len(f.read(chunk_size)) > 0:
+                pass
+
+    def strings(self, name):
+        return MappedStringTable(self['strings/' + name + '/data'], self['strings/' + name + '/offsets'])
+
+    def relations(self):
+        return [Relation[name] for name in self.toc['relations']]
+
+    def relation(self, relation):
+        """
+        :return: CSRRelation of relation
+        """
+        prefix = 'relations/' + relation.name + '/'
+        return CSRRelation.from_arrays(self[prefix + 'indptr'], self[prefix + 'indices'], self[prefix + 'scores'])
+
+    def index(self):
+        return NidIndex(self['nodes/keys'], self['nodes/order'], self['nodes/sorted_keys'])
+
+    def id_info(self, index):
+        cardinality = self['nodes/cardinality']
+        return ColumnarIdInfo(index, self.strings('db'), self.strings('source'), self.strings('field'),
+                              self.strings('data_type'), self['nodes/db_codes'], self['nodes/source_codes'],
+                              self['nodes/field_codes'], self['nodes/data_type_codes'], cardinality,
+                              removed=np.zeros(len(index), dtype=bool))
+
+    def table_ids(self):
+        return ColumnarTableIds(self.strings('table'), self['tables/indptr'], self['tables/keys'])
+
+
+def open_model(path, warm=False):
+    """
+    Opens a model file as a CSRFieldNetwork. The header and the names of the tables are read, so
+    that fields can be looked up by table right away. Everything else is mapped, and each relation
+    is loaded the first time it is used
+    :param path: the model file
+    :param warm: if True, a background thread loads all the model, see warm_model
+    :return: the network
+    """
+    model = ModelFile(path)
+    index = model.index()
+    relations = LazyRelations({relation: (lambda relation=relation: model.relation(relation))
+                               for relation in model.relations()})
+    graph = CSRGraph(index, model['nodes/cardinality'], relations)
+    table_ids = model.table_ids()
+    table_ids.source_names.load()
+    network = CSRFieldNetwork(graph, model.id_info(index), table_ids)
+    if warm:
+        warm_model(model, network)
+    return network
+
+
+def warm_model(model, network):
+    """
+    Loads, in a daemon thread, the pages of the model file and every relation
+    :param model: the ModelFile the network was opened from
+    :param network: the network
+    :return: the thread
+    """
+    def warm():
+        model.warm()
+        graph = network._get_underlying_repr_graph()
+        for relation in list(graph.relations.keys()):
+            graph.relation(relation)
+
+    thread = threading.Thread(target=warm, name='warm-model', daemon=True)
+    thread.start()
+    return thread
+
+
+def convert_pickle_model(path, output_path=None):
+    """
+    Converts a model directory with the pickle layout of serialize_network to a model file
+    :param path: the model directory
+    :param output_path: the model file, by default MODEL_FILE in the model directory
+    :return: the path of the model file
+    """
+    if output_path is None:
+        output_path = os.path.join(path, MODEL_FILE)
+    write_model(deserialize_network(os.path.join(path, '')), output_path)
+    return output_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Converts a model serialized as pickle files to a model file')
+    parser.add_argument('--model', required=True, help='Path of the model directory')
+    parser.add_argument('--output', help='Path of the model file, by default ' + MODEL_FILE + ' in the model directory')
+    args = parser.parse_args()
+
+    print("Model file: " + convert_pickle_model(args.model, args.output))
@@ -1,21 +1,24 @@
+import copy
+import os
 import time
 
 from dataanalysis import dataanalysis as da
 from math import isinf
 
-from enum import Enum
 from knowledgerepr.fieldnetwork import Relation
 from nearpy import Engine
 from nearpy.hashes import RandomBinaryProjections, RandomBinaryProjectionTree
 from nearpy.hashes import RandomDiscretizedProjections
 from nearpy.distances import CosineDistance, EuclideanDistance, ManhattanDistance
+from nearpy.utils.utils import unitvec
 from sklearn.decomposition import TruncatedSVD
-from datasketch import MinHash, MinHashLSH
+from datasketch import MinHashLSH
 
 from sklearn.cluster import DBSCAN
 import numpy as np
 
 from collections import defaultdict
+from multiprocessing import Pool
 
 rbp = RandomBinaryProjections('default', 30)
 
@@ -76,10 +79,14 @@ def lsa_dimensionality_reduction(tfidf):
 
 class LSHRandomProjectionsIndex:
 
-    def __init__(self, num_features, projection_count=30):
+    # TF-IDF vectorizer of the field names, None in indexes pickled before it was kept
+    vectorizer = None
+
+    def __init__(self, num_features, projection_count=30, rand_seed=None, vectorizer=None):
         self.num_features = num_features
+        self.vectorizer = vectorizer
         #self.rbp = RandomDiscretizedProjections('default', projection_count, bin_width=100)
-        self.rbp = RandomBinaryProjections('default', projection_count)
+        self.rbp = RandomBinaryProjections('default', projection_count, rand_seed=rand_seed)
         #self.rbp = RandomBinaryProjectionTree('default', projection_count, 1)
         self.text_engine = Engine(num_features, lshashes=[self.rbp], distance=CosineDistance())
 
@@ -93,8 +100,260 @@ class LSHRandomProjectionsIndex:
         res = self.text_engine.neighbours(vector)
         return res
 
-
-def build_schema_sim_relation(network):
+    def remove(self, vector, key):
+        self.text_engine.delete_vector(key, vector)
+
+    def vectorize(self, docs):
+        """
+        TF-IDF vectors of the given docs with the vocabulary the index was built with
+        :param docs: list of field names
+        :return: list of dense vectors
+        """
+        if self.vectorizer is None:
+            raise ValueError("The index has no vectorizer, the model must be rebuilt to be updated")
+        tfidf = self.vectorizer.transform(docs)
+        return [tfidf.getrow(i).todense().A[0] for i in range(tfidf.shape[0])]
+
+
+class LSHMinHashIndex:
+    """
+    MinHash LSH index that keeps all signatures in one contiguous uint64 matrix. It uses the
+    same banding as datasketch's MinHashLSH (two signatures are candidates iff they are equal
+    in at least one band) but computes the band hashes of all rows at once and produces
+    candidate pairs in bulk instead of one query per signature.
+    """
+
+    def __init__(self, threshold=0.7, num_perm=512):
+        lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.b, self.r = lsh.b, lsh.r
+        self.hashranges = lsh.hashranges
+        self.keys = []
+        self.key_rows = dict()
+        self.signatures = np.empty((0, num_perm), dtype=np.uint64)
+        self.band_hashes = np.empty((0, self.b), dtype=np.uint64)
+        self.removed = np.empty(0, dtype=bool)
+        self._sorted_bands = None
+
+    def __contains__(self, key):
+        return key in self.key_rows
+
+    def __len__(self):
+        return len(self.key_rows)
+
+    def insert(self, key, minhash):
+        """
+        Inserts a unique key with its minhash (a MinHash object or the array of hash values)
+        """
+        self.insert_many([(key, minhash)])
+
+    def insert_many(self, key_minhashes, chunk_size=4096):
+        """
+        Inserts many (key, minhash) pairs, materializing them chunk by chunk into the matrix
+        :param key_minhashes: iterable of (key, minhash)
+        :param chunk_size: number of signatures converted at once
+        :return:
+        """
+        keys = []
+        new_keys = set()
+        chunks = []
+        chunk = np.empty((chunk_size, self.num_perm), dtype=np.uint64)
+        filled = 0
+        for key, minhash in key_minhashes:
+            if key in self.key_rows or key in new_keys:
+                raise ValueError("The given key already exists")
+            keys.append(key)
+            new_keys.add(key)
+            chunk[filled] = self._as_signature(minhash)
+            filled += 1
+            if filled == chunk_size:
+                chunks.append(chunk)
+                chunk = np.empty((chunk_size, self.num_perm), dtype=np.uint64)
+                filled = 0
+        chunks.append(chunk[:filled])
+        signatures = np.concatenate(chunks)
+
+        first_row = len(self.keys)
+        for row, key in enumerate(keys, first_row):
+            self.key_rows[key] = row
+        self.keys.extend(keys)
+        self.signatures = np.concatenate([self.signatures, signatures])
+        self.band_hashes = np.concatenate([self.band_hashes, self._compute_band_hashes(signatures)])
+        self.removed = np.concatenate([self.removed, np.zeros(len(keys), dtype=bool)])
+        self._sorted_bands = None
+
+    def remove(self, key):
+        """
+        Removes the key from the index. Its row is only marked as removed
+        """
+        if key not in self.key_rows:
+            raise ValueError("The given key does not exist")
+        row = self.key_rows.pop(key)
+        self.removed[row] = True
+
+    def query(self, minhash):
+        """
+        Retrieves the keys that share at least one band with the given minhash
+        :param minhash: a MinHash object or the array of hash values
+        :return: list of keys
+        """
+        return [self.keys[row] for row in self.query_rows(minhash)]
+
+    def query_rows(self, minhash):
+        """
+        Retrieves the rows that share at least one band with the given minhash
+        :param minhash: a MinHash object or the array of hash values
+        :return: sorted array of rows
+        """
+        signature = self._as_signature(minhash)
+        band_hashes = self._compute_band_hashes(signature.reshape(1, -1))[0]
+        if self._sorted_bands is None:
+            orders = np.argsort(self.band_hashes, axis=0, kind='mergesort')
+            self._sorted_bands = (orders, np.take_along_axis(self.band_hashes, orders, axis=0))
+        orders, sorted_hashes = self._sorted_bands
+        candidates = [np.empty(0, dtype=np.int64)]
+        for band, (start, end) in enumerate(self.hashranges):
+            left = np.searchsorted(sorted_hashes[:, band], band_hashes[band], side='left')
+            right = np.searchsorted(sorted_hashes[:, band], band_hashes[band], side='right')
+            rows = orders[left:right, band]
+            rows = rows[np.all(self.signatures[rows, start:end] == signature[start:end], axis=1)]
+            candidates.append(rows[~self.removed[rows]])
+        return np.unique(np.concatenate(candidates))
+
+    def candidate_pairs(self, processes=None):
+        """
+        Computes all pairs of signatures that share at least one band. Bands are sharded
+        across a pool of processes
+        :param processes: number of processes, defaults to the number of cpus. With 1 no
+        pool is created
+        :return: two arrays (rows_i, rows_j) with the rows of each pair, rows_i < rows_j
+        """
+        num_rows = len(self.keys)
+        if num_rows == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if processes is None:
+            processes = os.cpu_count() or 1
+        processes = min(processes, self.b)
+        bands = list(range(self.b))
+        if processes <= 1:
+            codes = self.band_pairs(bands)
+        else:
+            shards = [bands[i::processes] for i in range(processes)]
+            with Pool(processes, initializer=_init_band_worker, initargs=(self,)) as pool:
+                codes = np.unique(np.concatenate(pool.map(_band_worker_pairs, shards)))
+        return codes // num_rows, codes % num_rows
+
+    def band_pairs(self, bands):
+        """
+        Groups the rows by their hash on each of the given bands and emits the pairs within
+        each group
+        :param bands: list of band indexes
+        :return: sorted array of unique pair codes, row_i * num_rows + row_j with row_i < row_j
+        """
+        num_rows = len(self.keys)
+        live_rows = np.flatnonzero(~self.removed)
+        codes = [np.empty(0, dtype=np.int64)]
+        for band in bands:
+            start, end = self.hashranges[band]
+            hashes = self.band_hashes[live_rows, band]
+            order = live_rows[np.argsort(hashes, kind='mergesort')]
+            hashes = self.band_hashes[order, band]
+            band_sigs = self.signatures[order, start:end]
+            group_starts = np.concatenate([[True], hashes[1:] != hashes[:-1]])
+            if np.any(~group_starts[1:] & np.any(band_sigs[1:] != band_sigs[:-1], axis=1)):
+                # Hash collision between different bands, group by the band values instead
+                sort_keys = [band_sigs[:, col] for col in reversed(range(end - start))] + [hashes]
+                by_values = np.lexsort(sort_keys)
+                order, hashes, band_sigs = order[by_values], hashes[by_values], band_sigs[by_values]
+                group_starts = np.concatenate([[True], (hashes[1:] != hashes[:-1]) |
+                                               np.any(band_sigs[1:] != band_sigs[:-1], axis=1)])
+            starts = np.flatnonzero(group_starts)
+            ends = np.append(starts[1:], len(order))
+            # each row pairs with the rows after it in its group
+            counts = np.repeat(ends, ends - starts) - np.arange(len(order)) - 1
+            first = np.repeat(np.arange(len(order)), counts)
+            second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+            row_i, row_j = order[first], order[second]
+            codes.append(np.minimum(row_i, row_j) * num_rows + np.maximum(row_i, row_j))
+        return np.unique(np.concatenate(codes))
+
+    def estimate_similarity(self, rows_i, rows_j, chunk_size=8192):
+        """
+        Estimates the Jaccard similarity and the containment of pairs of rows from their
+        signatures. Jaccard is the fraction of equal hash values. The minimum of A over a
+        permutation is strictly below the minimum of B with probability |A - B| / |A U B|, so
+        |A n B| / |B| is estimated as equal / (equal + count(B below A)). The containment is
+        the largest of the two directions
+        :param rows_i: array of rows
+        :param rows_j: array of rows, paired with rows_i
+        :param chunk_size: number of pairs compared at once
+        :return: (jaccard, containment) arrays of floats
+        """
+        values = self.signatures.view(np.int64)  # profiler hash values are signed
+        jaccard = np.empty(len(rows_i))
+        containment = np.empty(len(rows_i))
+        for start in range(0, len(rows_i), chunk_size):
+            end = start + chunk_size
+            sigs_i = values[rows_i[start:end]]
+            sigs_j = values[rows_j[start:end]]
+            equal = np.count_nonzero(sigs_i == sigs_j, axis=1)
+            i_below = np.count_nonzero(sigs_i < sigs_j, axis=1)
+            j_below = self.num_perm - equal - i_below
+            jaccard[start:end] = equal / self.num_perm
+            containment[start:end] = equal / np.maximum(equal + np.minimum(i_below, j_below), 1)
+        return jaccard, containment
+
+    def has_signature(self, key, minhash):
+        """
+        :return: whether key is indexed with this minhash
+        """
+        if key not in self.key_rows:
+            return False
+        return np.array_equal(self.signatures[self.key_rows[key]], self._as_signature(minhash))
+
+    def _as_signature(self, minhash):
+        hashvalues = getattr(minhash, 'hashvalues', minhash)
+        if len(hashvalues) != self.num_perm:
+            raise ValueError("Expecting minhash with length %d, got %d" % (self.num_perm, len(hashvalues)))
+        return np.asarray(hashvalues).astype(np.int64).view(np.uint64)
+
+    def _compute_band_hashes(self, signatures):
+        # FNV-1a over the 64-bit values of each band, all rows at once
+        band_hashes = np.empty((len(signatures), self.b), dtype=np.uint64)
+        prime = np.uint64(0x100000001b3)
+        for band, (start, end) in enumerate(self.hashranges):
+            h = np.full(len(signatures), 0xcbf29ce484222325, dtype=np.uint64)
+            for col in range(start, end):
+                h ^= signatures[:, col]
+                h *= prime
+            band_hashes[:, band] = h
+        return band_hashes
+
+
+# Index shared with the band workers of LSHMinHashIndex.candidate_pairs
+_band_index = None
+
+
+def _init_band_worker(index):
+    global _band_index
+    _band_index = index
+
+
+def _band_worker_pairs(bands):
+    return _band_index.band_pairs(bands)
+
+
+def build_schema_sim_relation(network, batch=True, rand_seed=None):
+    """
+    Connects fields with similar names with SCHEMA_SIM edges, scored with the cosine distance
+    of their TF-IDF vectors.
+    :param network: the FieldNetwork with the skeleton already built
+    :param batch: if True, hash and group all fields at once over the sparse TF-IDF matrix, otherwise
+    index and query every field one at a time through the nearpy engine. Both produce the same edges
+    :param rand_seed: seed for the random hyperplanes of the LSH index
+    :return: the LSH index with all the fields indexed
+    """
 
     def connect(nid1, nid2, score):
         network.add_relation(nid1, nid2, Relation.SCHEMA_SIM, score)
@@ -109,11 +368,20 @@ def build_schema_sim_relation(network):
     print("Time to create docs and TF-IDF: ")
     print("Create docs and TF-IDF: {0}".format(str(et - st)))
 
-    nid_gen = network.iterate_ids()
     num_features = tfidf.shape[1]
-    new_index_engine = LSHRandomProjectionsIndex(num_features)
+    new_index_engine = LSHRandomProjectionsIndex(num_features, rand_seed=rand_seed,
+                                                 vectorizer=copy.deepcopy(da.vect))
+
+    if batch:
+        nids = [nid for nid in network.iterate_ids()]
+        st = time.time()
+        _schema_sim_batch(nids, tfidf, new_index_engine, connect)
+        et = time.time()
+        print("Index and create graph schema (batch): {0}".format(str(et - st)))
+        return new_index_engine
 
     # Index vectors in engine
+    nid_gen = network.iterate_ids()
     st = time.time()
     row_idx = 0
     for key in nid_gen:
@@ -147,6 +415,72 @@ def build_schema_sim_relation(network):
     return new_index_engine
 
 
+def update_schema_sim_relation(network, schema_sim_index, nids):
+    """
+    Indexes new fields in the schema-sim index and connects them with their neighbors, as the
+    engine path of build_schema_sim_relation does. The vocabulary and weights of the TF-IDF
+    vectors are the ones of the model build
+    :param network: the network, with the new fields already added
+    :param schema_sim_index: the LSHRandomProjectionsIndex built by build_schema_sim_relation
+    :param nids: the new fields
+    :return:
+    """
+    id_info = network._get_underlying_repr_id_to_field_info()
+    names = [field_name for (_, _, _, field_name) in network.get_info_for(nids)]
+    vectors = schema_sim_index.vectorize(names)
+    for nid, vector in zip(nids, vectors):
+        schema_sim_index.index(vector, nid)
+    for nid, vector in zip(nids, vectors):
+        N = schema_sim_index.query(vector)
+        if len(N) > 1:
+            for (data, key, value) in N:
+                if nid != key and key in id_info:
+                    network.add_relation(nid, key, Relation.SCHEMA_SIM, value)
+
+
+def _schema_sim_batch(nids, tfidf, index, connect, query_chunk=1024):
+    """
+    Batched version of the index and query passes of build_schema_sim_relation. All vectors are
+    projected on the hyperplanes with a single sparse matrix multiply, then grouped by bucket. Each
+    bucket is scored at once, mimicking the engine's query: cosine distance against all bucket members
+    and keep the 10 nearest, including itself.
+    """
+    rbp = index.rbp
+    engine = index.text_engine
+    nearest = engine.vector_filters[0].N
+
+    # Project all vectors at once and compute packed bucket keys
+    keys = rbp.hash_vectors(tfidf)
+    _, bucket_of_row = np.unique(keys, axis=0, return_inverse=True)
+    bucket_of_row = bucket_of_row.ravel()
+
+    # Rows of each bucket, in index order
+    order = np.argsort(bucket_of_row, kind='stable')
+    boundaries = np.flatnonzero(np.diff(bucket_of_row[order])) + 1
+    for rows in np.split(order, boundaries):
+        bucket_key = rbp.bucket_keys(keys[rows[:1]])[0]
+        dense_rows = tfidf[rows].toarray()
+        unit_rows = np.empty(dense_rows.shape)
+        for i in range(len(rows)):
+            unit_rows[i] = unitvec(dense_rows[i])
+            # Keep the engine storage populated, so the index can still be queried afterwards
+            engine.storage.store_vector(rbp.hash_name, bucket_key, unit_rows[i], nids[rows[i]])
+
+        # One row alone in its bucket has no neighbors
+        if len(rows) < 2:
+            continue
+        for chunk_start in range(0, len(rows), query_chunk):
+            chunk = slice(chunk_start, chunk_start + query_chunk)
+            distances = 1.0 - unit_rows[chunk].dot(unit_rows.T)
+            nearest_idx = np.argsort(distances, axis=1, kind='stable')[:, :nearest]
+            for q_distances, q, neighbors in zip(distances, rows[chunk], nearest_idx):
+                nid = nids[q]
+                for n in neighbors:
+                    key = nids[rows[n]]
+                    if nid != key:
+                        connect(nid, key, q_distances[n])
+
+
 def build_schema_sim_relation_lsa(network, fields):
     docs = []
     for (nid, sn, fn, _, _) in fields:
@@ -226,113 +560,283 @@ def build_content_sim_relation_text(network, signatures):
     create_sim_graph_text(nid_gen, network, text_engine, tfidf, Relation.CONTENT_SIM)
 
 
-def build_content_sim_mh_text(network, mh_signatures):
+def build_content_sim_mh_text(network, mh_signatures, processes=None, min_score=0.7):
+    """
+    Connects text fields whose minhash signatures share at least one LSH band with
+    CONTENT_SIM edges. Candidate pairs are verified with the Jaccard similarity and
+    containment estimated from their signatures: pairs where both are below min_score are
+    dropped, the rest are connected with the largest of the two as score, i.e., the one the
+    pair was kept on
+    :param network: the network to which the relation is added
+    :param mh_signatures: iterable of (nid, minhash signature)
+    :param processes: number of processes among which the LSH bands are sharded
+    :param min_score: minimum Jaccard or containment of connected pairs, 0 keeps all candidates
+    :return: the LSHMinHashIndex with all signatures
+    """
 
     def connect(nid1, nid2, score):
         network.add_relation(nid1, nid2, Relation.CONTENT_SIM, score)
 
-    # Materialize signatures for convenience
-    mh_sig_obj = []
+    content_index = LSHMinHashIndex(threshold=0.7, num_perm=512)
+    content_index.insert_many(mh_signatures)
 
-    content_index = MinHashLSH(threshold=0.7, num_perm=512)
+    rows_i, rows_j = content_index.candidate_pairs(processes=processes)
+    jaccard, containment = content_index.estimate_similarity(rows_i, rows_j)
+    scores = np.maximum(jaccard, containment)
+    keep = scores >= min_score
+    for row_i, row_j, score in zip(rows_i[keep].tolist(), rows_j[keep].tolist(), scores[keep].tolist()):
+        connect(content_index.keys[row_i], content_index.keys[row_j], score)
 
-    # Create minhash objects and index
-    for nid, mh_sig in mh_signatures:
-        mh_obj = MinHash(num_perm=512)
-        mh_array = np.asarray(mh_sig, dtype=int)
-        mh_obj.hashvalues = mh_array
-        content_index.insert(nid, mh_obj)
-        mh_sig_obj.append((nid, mh_obj))
+    return content_index
 
-    # Query objects
-    for nid, mh_obj in mh_sig_obj:
-        res = content_index.query(mh_obj)
-        for r_nid in res:
-            if r_nid != nid:
-                connect(nid, r_nid, 1)
 
-    return content_index
+def update_content_sim_mh_text(network, content_index, mh_signatures, min_score=0.7):
+    """
+    Inserts the signatures of new text fields in the index and connects them as
+    build_content_sim_mh_text does, with the largest of the Jaccard similarity and the
+    containment as score
+    :param network: the network to which the relation is added
+    :param content_index: the LSHMinHashIndex built by build_content_sim_mh_text
+    :param mh_signatures: iterable of (nid, minhash signature) of the new fields
+    :param min_score: minimum Jaccard or containment of connected pairs
+    :return:
+    """
+    mh_signatures = list(mh_signatures)
+    content_index.insert_many(mh_signatures)
+    for nid, _ in mh_signatures:
+        row = content_index.key_rows[nid]
+        candidates = content_index.query_rows(content_index.signatures[row])
+        candidates = candidates[candidates != row]
+        jaccard, containment = content_index.estimate_similarity(np.full(len(candidates), row), candidates)
+        scores = np.maximum(jaccard, containment)
+        keep = scores >= min_score
+        for candidate, score in zip(candidates[keep].tolist(), scores[keep].tolist()):
+            network.add_relation(nid, content_index.keys[candidate], Relation.CONTENT_SIM, score)
+
+
+class _NumOverlapSignatures:
+    """
+    Numerical signatures of fields as arrays, to evaluate the overlap relations of
+    build_content_sim_relation_num_overlap_distr over many pairs of fields at once
+    """
+
+    def __init__(self, id_sig):
+        self.fields = []
+        self.domains = []
+        self.stats = []
+        for c_k, (c_median, c_iqr, c_min_v, c_max_v) in id_sig:
+            self.fields.append(c_k)
+            self.domains.append((c_median + c_iqr) - (c_median - c_iqr))
+            self.stats.append((c_min_v, c_median - c_iqr, c_median + c_iqr, c_max_v))
+        num_fields = len(self.fields)
+
+        # Position of each field in the order the quadratic version visits them. When both
+        # directions of a pair qualify, the score of the last visited reference is the one kept
+        self.order = sorted(range(num_fields), key=lambda i: (self.domains[i], self.fields[i], self.stats[i]),
+                            reverse=True)
+        self.rank = np.empty(num_fields, dtype=np.int64)
+        self.rank[self.order] = np.arange(num_fields)
+
+        self.x_min = np.asarray([s[0] for s in self.stats], dtype=float)
+        self.x_left = np.asarray([s[1] for s in self.stats], dtype=float)
+        self.x_right = np.asarray([s[2] for s in self.stats], dtype=float)
+        self.x_max = np.asarray([s[3] for s in self.stats], dtype=float)
+        self.domain = np.asarray(self.domains, dtype=float)
+        # inclusion dependencies are only checked for integer-valued signatures
+        self.int_domain = np.asarray([not isinstance(d, float) for d in self.domains], dtype=bool)
+        self.any_inf = np.isinf(self.x_min) | np.isinf(self.x_max)
+
+        # Points (domain 0) are clustered separately and ranges without a defined width never
+        # overlap anything, so neither takes part in the pairwise comparison
+        self.point = np.asarray([d == 0 for d in self.domains], dtype=bool)
+        self.ranged = ~self.point & ~np.isnan(self.x_left) & ~np.isnan(self.x_right)
+        self.lo = np.minimum(self.x_left, self.x_right)
+        self.hi = np.maximum(self.x_left, self.x_right)
+
+    def single_points(self):
+        """
+        :return: the fields with a single point domain, as (nid, domain, min, left, right, max), in
+        visit order
+        """
+        return [(self.fields[i], self.domains[i]) + self.stats[i] for i in self.order if self.point[i]]
+
+    def overlap_of(self, ref, cand):
+        """
+        Vectorized compute_overlap of build_content_sim_relation_num_overlap_distr
+        """
+        ref_left, ref_right, ref_domain = self.x_left[ref], self.x_right[ref], self.domain[ref]
+        left, right = self.x_left[cand], self.x_right[cand]
+        contained = (left >= ref_left) & (right <= ref_right)
+        left_in = ~contained & (left >= ref_left) & (left <= ref_right)
+        right_in = ~contained & ~left_in & (right <= ref_right) & (right >= ref_left)
+        ov = np.zeros(len(ref))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ov[contained] = (right[contained] - left[contained]) / ref_domain[contained]
+            ov[left_in] = (ref_right[left_in] - left[left_in]) / ref_domain[left_in]
+            ov[right_in] = (right[right_in] - ref_left[right_in]) / ref_domain[right_in]
+        return ov
+
+    def check(self, ref, cand, overlap):
+        """
+        :return: (overlap, content_sim, inclusion_dependency) for ref as reference of cand
+        """
+        ov = self.overlap_of(ref, cand)
+        skip = self.int_domain[cand] & (self.any_inf[ref] | self.any_inf[cand])
+        with np.errstate(invalid='ignore'):
+            inddep = self.int_domain[cand] & ~skip & (self.x_min[cand] >= self.x_min[ref]) \
+                     & (self.x_max[cand] <= self.x_max[ref]) & (self.x_min[cand] >= 0) & (ov >= 0.3)
+            content_sim = ~skip & (ov >= overlap)
+        return ov, content_sim, inddep
+
+    def connect_pairs(self, i, j, connect, overlap):
+        """
+        Evaluates both directions of the pairs of fields (i, j) and connects the ones that qualify
+        """
+        ov_ij, cs_ij, ind_ij = self.check(i, j, overlap)  # i as reference
+        ov_ji, cs_ji, ind_ji = self.check(j, i, overlap)  # j as reference
+        score = np.where(cs_ij & (~cs_ji | (self.rank[i] > self.rank[j])), ov_ij, ov_ji)
+        for k in np.flatnonzero(cs_ij | cs_ji):
+            connect(self.fields[i[k]], self.fields[j[k]], float(score[k]))
+        for k in np.flatnonzero(ind_ij | ind_ji):
+            connect(self.fields[i[k]], self.fields[j[k]], 1, inddep=True)
+
+
+def build_content_sim_relation_num_overlap_distr_indexed(network, id_sig, max_pairs=1 << 22):
+    """
+    Builds the same CONTENT_SIM and INCLUSION_DEPENDENCY relations as
+    build_content_sim_relation_num_overlap_distr, but without comparing every pair of fields.
+    The [median - iqr, median + iqr] ranges are sorted by their left end and swept, so only
+    pairs of ranges that intersect are enumerated (any other pair has overlap 0). The overlap
+    ratios and inclusion dependency checks are then computed over all candidate pairs at once.
+    :param network: the network to which the relations are added
+    :param id_sig: iterable of (nid, (median, iqr, min, max))
+    :param max_pairs: max number of candidate pairs evaluated at once, bounds memory usage
+    :return:
+    """
 
+    overlap = 0.85
 
-def build_content_sim_relation_num_overlap_distr_indexed(network, id_sig):
+    def connect(nid1, nid2, score, inddep=False):
+        if inddep is False:
+            network.add_relation(nid1, nid2, Relation.CONTENT_SIM, score)
+        else:
+            network.add_relation(nid1, nid2, Relation.INCLUSION_DEPENDENCY, score)
 
-    def compute_overlap(value1, value2):
-        ov = 0
-        if value1 == value2:
-            ov = 1
-        if value1 > value2:
-            if value1 > 0:
-                ov = value2 / value1
+    signatures = _NumOverlapSignatures(id_sig)
+
+    # Sweep: a range intersects every range whose left end falls between its own ends
+    swept = np.flatnonzero(signatures.ranged)
+    by_lo = np.argsort(signatures.lo[swept], kind='mergesort')
+    swept = swept[by_lo]
+    lo, hi = signatures.lo[swept], signatures.hi[swept]
+    positions = np.arange(len(swept))
+    counts = np.searchsorted(lo, hi, side='right') - positions - 1
+    cum_counts = np.cumsum(counts)
+
+    start = 0
+    while start < len(swept):
+        base = cum_counts[start] - counts[start]
+        stop = max(int(np.searchsorted(cum_counts, base + max_pairs, side='right')), start + 1)
+        c = counts[start:stop]
+        a = np.repeat(positions[start:stop], c)
+        b = a + 1 + np.arange(len(a)) - np.repeat(np.cumsum(c) - c, c)
+        start = stop
+        if len(a) > 0:
+            signatures.connect_pairs(swept[a], swept[b], connect, overlap)
+
+    _connect_single_points(signatures.single_points(), connect, overlap)
+
+
+def update_content_sim_relation_num_overlap_distr(network, id_sig, nids, recluster_points=False):
+    """
+    Adds the CONTENT_SIM and INCLUSION_DEPENDENCY relations of the given fields, comparing them
+    with all the fields in id_sig, as build_content_sim_relation_num_overlap_distr_indexed does
+    :param network: the network to which the relations are added
+    :param id_sig: iterable of (nid, (median, iqr, min, max)) of all numerical fields, including nids
+    :param nids: the fields to connect, e.g., the fields of a new table
+    :param recluster_points: whether to recompute the relations among fields with a single point
+    domain, needed when such fields were added or removed
+    :return:
+    """
+
+    overlap = 0.85
+
+    def connect(nid1, nid2, score, inddep=False):
+        if inddep is False:
+            network.add_relation(nid1, nid2, Relation.CONTENT_SIM, score)
         else:
-            if value2 > 0:
-                ov = value1 / value2
-        return ov
+            network.add_relation(nid1, nid2, Relation.INCLUSION_DEPENDENCY, score)
+
+    signatures = _NumOverlapSignatures(id_sig)
+    rows = dict((nid, row) for row, nid in enumerate(signatures.fields))
+    new_rows = np.asarray(sorted(rows[nid] for nid in nids), dtype=np.int64)
+    is_new = np.zeros(len(signatures.fields), dtype=bool)
+    is_new[new_rows] = True
+
+    for row in new_rows:
+        if not signatures.ranged[row]:
+            continue
+        # ranges that intersect this one, pairs of new fields only once
+        others = signatures.ranged & (signatures.lo <= signatures.hi[row]) & (signatures.hi >= signatures.lo[row])
+        others &= ~is_new | (np.arange(len(others)) > row)
+        others[row] = False
+        j = np.flatnonzero(others)
+        signatures.connect_pairs(np.full(len(j), row, dtype=np.int64), j, connect, overlap)
+
+    if recluster_points:
+        points = signatures.single_points()
+        point_nids = set(p[0] for p in points)
+        for nid in point_nids:
+            for neighbor in network.neighbors_id(nid, Relation.CONTENT_SIM):
+                if neighbor.nid in point_nids:
+                    network.remove_relation(nid, neighbor.nid, Relation.CONTENT_SIM)
+        _connect_single_points(points, connect, overlap)
+
+
+def _connect_single_points(single_points, connect, overlap):
+    """
+    Clusters the fields whose domain is a single point by their median and connects the
+    members of each cluster
+    :param single_points: list of (nid, domain, min, left, right, max)
+    :param connect: function to connect two nids with a given score
+    :param overlap: score of the connections
+    :return:
+    """
+    fields = []
+    medians = []
+
+    for (nid, domain, x_min, x_left, x_right, x_max) in single_points:
+        median = x_right - float(x_right / 2)
+        fields.append(nid)
+        medians.append(median)
+
+    x_median = np.asarray(medians)
+    x_median = x_median.reshape(-1, 1)
 
-    def check_overlap_maybe_connect(overlap):
+    # At this point, we may have not found any points at all, in which case we can
+    # safely exit
+    if len(x_median) == 0:
         return
 
-    class Event(Enum):
-        OPEN = 0
-        CLOSE = 1
-        FINISHED = 2
+    db_median = DBSCAN(eps=0.1, min_samples=2).fit(x_median)
+    labels_median = db_median.labels_
+    n_clusters = len(set(labels_median)) - (1 if -1 in labels_median else 0)
+    #print("#clusters: " + str(n_clusters))
 
-    overlap = 0.7
+    clusters_median = defaultdict(list)
+    for i in range(len(labels_median)):
+        clusters_median[labels_median[i]].append(i)
 
-    # Materialize data
-    nids = []
-    # events are one of (value, open_event) or (value, close_event)
-    events = []
-    for c_k, (c_median, c_iqr, c_min_v, c_max_v) in id_sig:
-        nids.append(c_k)
-        open_event_value = c_median - c_iqr
-        events.append((open_event_value, Event.OPEN))
-        nids.append(c_k)
-        close_event_value = c_median + c_iqr
-        events.append((close_event_value, Event.CLOSE))
-
-    # Sort data
-    sorted_data = sorted(zip(events, nids), key=lambda x: x[0][0])
-    events = [x for x, y in sorted_data]
-    nids = [y for x, y in sorted_data]
-    active_set = dict()
-    start_events = dict()
-
-    # Iterate data
-    for idx in range(len(events)):
-        event_value, event_type = events[idx]
-        current_nid = nids[idx]
-        # Open or Close event?
-        if event_type == Event.OPEN:
-            for active_element_nid, active_element_values in active_set.items():
-                active_element_values[current_nid] = (event_value, event_type)
-            active_set[current_nid] = dict()
-            start_events[current_nid] = event_value
-        elif event_type == Event.CLOSE:
-            for key in list(active_set.keys()):
-                active_element_nid = key
-                active_element_values = active_set[active_element_nid]
-                if current_nid != active_element_nid:
-                    if current_nid in active_element_values.keys():
-                        open_event_value = active_element_values[current_nid][0]  # 1 is event_type
-                        overlap = event_value - open_event_value
-                        active_element_values[current_nid] = (overlap, Event.FINISHED)
-                elif current_nid == active_element_nid:
-                    for key in list(active_element_values.keys()):
-                        ae_nid = key
-                        ae_event = active_element_values[ae_nid]
-                        ae_value, ae_type = ae_event
-                        if ae_type == Event.FINISHED:
-                            closing_event_start_time = start_events[current_nid]
-                            overlap = compute_overlap(closing_event_start_time, ae_value)
-                            check_overlap_maybe_connect(overlap)
-                        elif ae_type == Event.OPEN:
-                            overlap = compute_overlap(event_value, ae_value)
-                            # store value in the active element
-                            active_set[active_element_nid][ae_nid] = (overlap, Event.FINISHED)
-                        # remove entry from values
-                        #del active_element_values[current_nid]
-                    # remove entry from active set
-                    del active_set[current_nid]
+    for k, v in clusters_median.items():
+        if k == -1:
+            continue
+        #print("Cluster: " + str(k))
+        for el in v:
+            for el2 in v:
+                if el != el2:
+                    nid1 = fields[el]
+                    nid2 = fields[el2]
+                    connect(nid1, nid2, overlap)
 
 
 def build_content_sim_relation_num_overlap_distr(network, id_sig):
@@ -379,27 +883,12 @@ def build_content_sim_relation_num_overlap_distr(network, id_sig):
     for ref in candidate_entries:
         ref_nid, ref_domain, ref_x_min, ref_x_left, ref_x_right, ref_x_max = ref
 
-        if ref_nid == '2314808454':
-            debug = True
-
         if ref_domain == 0:
             single_points.append(ref)
 
-        info1 = network.get_info_for([ref_nid])
-
-        (nid, db_name, source_name, field_name) = info1[0]
-        #print("")
-        #print("")
-        #print("Checking: " + source_name + " - " + field_name)
-        #print("")
-        #print("")
-
         for entry in candidate_entries:
             candidate_nid, candidate_domain, candidate_x_min, candidate_x_left, candidate_x_right, candidate_x_max = entry
 
-            if candidate_nid == '1504465753':
-                debug = True
-
             if candidate_nid == ref_nid:
                 continue
 
@@ -409,9 +898,6 @@ def build_content_sim_relation_num_overlap_distr(network, id_sig):
             # Check for filtered inclusion dependencies first
             if not isinstance(candidate_domain, float):  # Filter these out
                 # Check ind. dep.
-                info2 = network.get_info_for([candidate_nid])
-                (_, _, sn1, fn1) = info1[0]
-                (_, _, sn2, fn2) = info2[0]
                 if isinf(float(ref_x_min)) or isinf(float(ref_x_max)) or isinf(float(candidate_x_max)) or isinf(float(candidate_x_min)):
                     continue
                 if candidate_x_min >= ref_x_min and candidate_x_max <= ref_x_max:
@@ -479,46 +965,7 @@ def build_content_sim_relation_num_overlap_distr(network, id_sig):
             """
 
     # Final clustering for single points
-
-    fields = []
-    medians = []
-
-    for (nid, domain, x_min, x_left, x_right, x_max) in single_points:
-        median = x_right - float(x_right / 2)
-        fields.append(nid)
-        medians.append(median)
-
-    x_median = np.asarray(medians)
-    x_median = x_median.reshape(-1, 1)
-
-    # At this point, we may have not found any points at all, in which case we can
-    # safely exit
-    if len(x_median) == 0:
-        return
-
-    db_median = DBSCAN(eps=0.1, min_samples=2).fit(x_median)
-    labels_median = db_median.labels_
-    n_clusters = len(set(labels_median)) - (1 if -1 in labels_median else 0)
-    #print("#clusters: " + str(n_clusters))
-
-    clusters_median = defaultdict(list)
-    for i in range(len(labels_median)):
-        clusters_median[labels_median[i]].append(i)
-
-    for k, v in clusters_median.items():
-        if k == -1:
-            continue
-        #print("Cluster: " + str(k))
-        for el in v:
-            nid = fields[el]
-            info = network.get_info_for([nid])
-            (nid, db_name, source_name, field_name) = info[0]
-            #print(source_name + " - " + field_name + " median: " + str(medians[el]))
-            for el2 in v:
-                if el != el2:
-                    nid1 = fields[el]
-                    nid2 = fields[el2]
-                    connect(nid1, nid2, overlap)
+    _connect_single_points(single_points, connect, overlap)
 
 
 def build_content_sim_relation_num_double_clustering(network, id_sig):
@@ -621,39 +1068,87 @@ def build_content_sim_relation_num(network, id_sig):
                     network.add_relation(nid1, nid2, Relation.CONTENT_SIM, 1)
 
 
-def build_pkfk_relation(network):
+def relation_csr(network, relation, row_of):
+    """
+    CSR adjacency of a relation
+    :param network: the network
+    :param relation: the type of relation
+    :param row_of: dict of nid -> row, for all the fields of the network
+    :return: (indptr, indices) where the neighbors of row i are indices[indptr[i]:indptr[i + 1]].
+    Every edge is in the neighbors of both its ends
+    """
+    src = []
+    tgt = []
+    for node_src, node_target, _ in network.iterate_relation_edges(relation):
+        src.append(row_of[node_src])
+        tgt.append(row_of[node_target])
+    src = np.asarray(src, dtype=np.int64)
+    tgt = np.asarray(tgt, dtype=np.int64)
+    loops = src == tgt
+    rows = np.concatenate([src, tgt[~loops]])
+    cols = np.concatenate([tgt, src[~loops]])
+    indptr = np.zeros(len(row_of) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(row_of)), out=indptr[1:])
+    return indptr, cols[np.argsort(rows, kind='mergesort')]
 
-    def get_neighborhood(n):
-        neighbors = []
-        data_type = network.get_data_type_of(n)
-        if data_type == "N":
-            neighbors = network.neighbors_id(n, Relation.INCLUSION_DEPENDENCY)
-        if data_type == "T":
-            neighbors = network.neighbors_id(n, Relation.CONTENT_SIM)
-        return neighbors
-
-    total_pkfk_relations = 0
-    for n in network.iterate_ids():
-        n_card = network.get_cardinality_of(n)
-        if n == '2314808454' or n == '1504465753':
-            debug = True
-        if n_card > 0.7:  # Early check if this is a candidate
-            neighborhood = get_neighborhood(n)
-            for ne in neighborhood:
-                if ne is not n:
-                    if ne.nid == '1504465753' or ne.nid == '2314808454':
-                        debug = True
-                    ne_card = network.get_cardinality_of(ne.nid)
-                    if n_card > ne_card:
-                        highest_card = n_card
-                    else:
-                        highest_card = ne_card
-                    #if ne_card < 0.5:
-                    network.add_relation(n, ne.nid, Relation.PKFK, highest_card)
-                    total_pkfk_relations += 1
-                    #print(str(n) + " -> " + str(ne))
-    print("Total number PKFK: {0}".format(str(total_pkfk_relations)))
 
+def build_pkfk_relation(network):
+    """
+    Adds a PKFK relation between each candidate key, i.e., a field with cardinality above 0.7, and
+    its inclusion dependency neighbors (numerical fields) or content-sim neighbors (text fields).
+    The score is the highest cardinality of the two fields. Runs as array operations over the CSR
+    adjacency of both relations and the cardinality of all fields
+    :param network: the network, with the content-sim and inclusion dependency relations
+    :return:
+    """
+    id_info = network._get_underlying_repr_id_to_field_info()
+    nids = list(id_info.keys())
+    row_of = {nid: row for row, nid in enumerate(nids)}
+    data_types = [data_type for _, _, _, data_type in id_info.values()]
+    card = np.array([network.get_cardinality_of(nid) for nid in nids], dtype=np.float64)
+
+    src = []
+    tgt = []
+    for relation, data_type in [(Relation.INCLUSION_DEPENDENCY, "N"), (Relation.CONTENT_SIM, "T")]:
+        indptr, indices = relation_csr(network, relation, row_of)
+        is_candidate = np.array([t == data_type for t in data_types], dtype=bool) & (card > 0.7)
+        rows = np.repeat(np.arange(len(nids), dtype=np.int64), np.diff(indptr))
+        candidates = is_candidate[rows] & (rows != indices)
+        src.append(rows[candidates])
+        tgt.append(indices[candidates])
+    src = np.concatenate(src)
+    tgt = np.concatenate(tgt)
+
+    # a pair is found once from each end that is a candidate key
+    pairs = np.unique(np.minimum(src, tgt) * len(nids) + np.maximum(src, tgt))
+    src = pairs // max(len(nids), 1)
+    tgt = pairs % max(len(nids), 1)
+    scores = np.maximum(card[src], card[tgt])
+    network.add_relations(Relation.PKFK, ((nids[i], nids[j], score) for i, j, score in
+                                          zip(src.tolist(), tgt.tolist(), scores.tolist())))
+    print("Total number PKFK: {0}".format(str(len(pairs))))
+
+
+def update_pkfk_relation(network, nids):
+    """
+    Adds the PKFK relations of the given fields, as build_pkfk_relation does
+    :param network: the network, with the content-sim and inclusion dependency relations of the
+    fields already added
+    :param nids: the new fields
+    :return:
+    """
+    for n in nids:
+        n_card = network.get_cardinality_of(n)
+        n_type = network.get_data_type_of(n)
+        for relation, data_type in [(Relation.INCLUSION_DEPENDENCY, "N"), (Relation.CONTENT_SIM, "T")]:
+            for ne in network.neighbors_id(n, relation):
+                if ne.nid == n:
+                    continue
+                ne_card = network.get_cardinality_of(ne.nid)
+                # either end can be the candidate key, if the relation is the one of its data type
+                if (n_type == data_type and n_card > 0.7) or \
+                        (network.get_data_type_of(ne.nid) == data_type and ne_card > 0.7):
+                    network.add_relation(n, ne.nid, Relation.PKFK, max(n_card, ne_card))
 
 if __name__ == "__main__":
     print("TODO")
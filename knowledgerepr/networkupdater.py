@@ -0,0 +1,98 @@
+from knowledgerepr import networkbuilder
+
+
+def _is_single_point(num_signature):
+    median, iqr, _, _ = num_signature
+    return (median + iqr) - (median - iqr) == 0
+
+
+def update_network(network, schema_sim_index, content_sim_index, num_sig_index, fields=(), mh_signatures=(),
+                   id_sig=(), removed=(), content_sim_min_score=0.7):
+    """
+    Updates a model with new, changed and removed fields without rebuilding it. Changed fields are
+    removed and added again. Only the relations of these fields are computed, by querying the indexes
+    persisted with the model. Content-sim, inclusion dependency and PKFK relations are the same a full
+    rebuild would produce. Schema-sim uses the TF-IDF vocabulary of the model build and does not
+    recompute the nearest neighbors of the other fields, so it may differ slightly
+    :param network: the FieldNetwork of the model
+    :param schema_sim_index: the LSHRandomProjectionsIndex of the model, updated in place
+    :param content_sim_index: the LSHMinHashIndex of the model, updated in place
+    :param num_sig_index: dict of nid -> (median, iqr, min, max) of all numerical fields of the model,
+    updated in place
+    :param fields: profiles (nid, db_name, source_name, field_name, total_values, unique_values, data_type)
+    of the new and changed fields
+    :param mh_signatures: (nid, minhash signature) of the new and changed text fields
+    :param id_sig: (nid, (median, iqr, min, max)) of the new and changed numerical fields
+    :param removed: nids of the removed fields
+    :param content_sim_min_score: min score of content-sim pairs, see build_content_sim_mh_text
+    :return:
+    """
+    fields = list(fields)
+    id_sig = list(id_sig)
+    id_info = network._get_underlying_repr_id_to_field_info()
+    nids = [nid for nid, _, _, _, _, _, _ in fields]
+    recluster_points = False
+
+    # Remove deleted and changed fields with all their relations
+    for nid in list(removed) + [nid for nid in nids if nid in id_info]:
+        (_, _, _, field_name) = network.get_info_for([nid])[0]
+        schema_sim_index.remove(schema_sim_index.vectorize([field_name])[0], nid)
+        if nid in content_sim_index:
+            content_sim_index.remove(nid)
+        if nid in num_sig_index:
+            recluster_points |= _is_single_point(num_sig_index.pop(nid))
+        network.remove_field(nid)
+
+    # Add new and changed fields
+    network.init_meta_schema(fields)
+    networkbuilder.update_schema_sim_relation(network, schema_sim_index, nids)
+    networkbuilder.update_content_sim_mh_text(network, content_sim_index, mh_signatures,
+                                              min_score=content_sim_min_score)
+    for nid, num_signature in id_sig:
+        num_sig_index[nid] = num_signature
+        recluster_points |= _is_single_point(num_signature)
+    networkbuilder.update_content_sim_relation_num_overlap_distr(network, num_sig_index.items(),
+                                                               [nid for nid, _ in id_sig],
+                                                               recluster_points=recluster_points)
+    networkbuilder.update_pkfk_relation(network, nids)
+
+
+def diff_profiles(network, content_sim_index, num_sig_index, fields, mh_signatures, id_sig):
+    """
+    Compares the profiles in the store with the fields of a model
+    :param network: the FieldNetwork of the model
+    :param content_sim_index: the LSHMinHashIndex of the model
+    :param num_sig_index: dict of nid -> (median, iqr, min, max) of the model
+    :param fields: profiles (nid, db_name, source_name, field_name, total_values, unique_values, data_type)
+    of all fields in the store
+    :param mh_signatures: (nid, minhash signature) of all text fields in the store
+    :param id_sig: (nid, (median, iqr, min, max)) of all numerical fields in the store
+    :return: (fields, mh_signatures, id_sig, removed) where the first three only have the new and
+    changed fields, and removed has the nids of the model that are no longer in the store
+    """
+    id_info = network._get_underlying_repr_id_to_field_info()
+    mh_signatures = dict(mh_signatures)
+    id_sig = dict(id_sig)
+    new_fields = []
+    for field in fields:
+        (nid, db_name, sn_name, fn_name, total_values, unique_values, data_type) = field
+        changed = nid not in id_info or id_info[nid] != (db_name, sn_name, fn_name, data_type)
+        if not changed:
+            cardinality = 0
+            if float(total_values) > 0:
+                cardinality = float(unique_values) / float(total_values)
+            # models ingested in bulk keep cardinalities as float32
+            changed = abs(network.get_cardinality_of(nid) - cardinality) > 1e-6
+        if not changed and nid in mh_signatures:
+            changed = not content_sim_index.has_signature(nid, mh_signatures[nid])
+        if not changed and nid in id_sig:
+            changed = tuple(num_sig_index.get(nid, ())) != tuple(id_sig[nid])
+        if changed:
+            new_fields.append(field)
+    in_store = set(nid for nid, _, _, _, _, _, _ in fields)
+    removed = [nid for nid in id_info if nid not in in_store]
+    new_nids = set(nid for nid, _, _, _, _, _, _ in new_fields)
+    return new_fields, \
+        [(nid, sig) for nid, sig in mh_signatures.items() if nid in new_nids], \
+        [(nid, sig) for nid, sig in id_sig.items() if nid in new_nids], \
+        removed
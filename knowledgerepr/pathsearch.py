@@ -0,0 +1,103 @@
+"""
+Shortest paths between two fields over the adjacency of one relation. Paths are lists of ids, found
+with a bidirectional breadth-first search, and the k shortest loopless ones with Yen's algorithm.
+"""
+import heapq
+
+
+def shortest_path(neighbors, source, target, max_hops, blocked_nodes=frozenset(), blocked_edges=frozenset()):
+    """
+    Bidirectional breadth-first search: the frontier of the side with fewer nodes is expanded one
+    level at a time until both sides meet
+    :param neighbors: function of an id to the ids of its neighbors
+    :param source: id where paths start
+    :param target: id where paths end
+    :param max_hops: maximum number of edges of the path
+    :param blocked_nodes: ids that the path can not go through
+    :param blocked_edges: (id, id) edges that the path can not use, in the direction they are used
+    :return: a shortest path, as a list of ids from source to target, or None if there is none
+    """
+    if source == target:
+        return [source]
+    if source in blocked_nodes or target in blocked_nodes:
+        return None
+    # parent of each node reached from each side, and its distance to that side
+    parents = ({source: None}, {target: None})
+    distances = ({source: 0}, {target: 0})
+    frontiers = ([source], [target])
+    depths = [0, 0]
+    while len(frontiers[0]) > 0 and len(frontiers[1]) > 0 and depths[0] + depths[1] < max_hops:
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        other = 1 - side
+        next_frontier = []
+        meet = None
+        for u in frontiers[side]:
+            for v in neighbors(u):
+                edge = (u, v) if side == 0 else (v, u)
+                if v in blocked_nodes or edge in blocked_edges or v in parents[side]:
+                    continue
+                parents[side][v] = u
+                distances[side][v] = depths[side] + 1
+                next_frontier.append(v)
+                if v in parents[other]:
+                    length = depths[side] + 1 + distances[other][v]
+                    if meet is None or length < meet[0]:
+                        meet = (length, v)
+        depths[side] += 1
+        frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+        if meet is not None:
+            if meet[0] > max_hops:
+                return None
+            return _join(parents, meet[1])
+    return None
+
+
+def _join(parents, middle):
+    path = []
+    node = middle
+    while node is not None:
+        path.append(node)
+        node = parents[0][node]
+    path.reverse()
+    node = parents[1][middle]
+    while node is not None:
+        path.append(node)
+        node = parents[1][node]
+    return path
+
+
+def k_shortest_paths(neighbors, source, target, max_hops, k=1):
+    """
+    Yen's algorithm, with shortest_path to find the deviations of each path
+    :param neighbors: function of an id to the ids of its neighbors
+    :param source: id where paths start
+    :param target: id where paths end
+    :param max_hops: maximum number of edges of the paths
+    :param k: maximum number of paths
+    :return: up to k loopless paths from source to target, shortest first
+    """
+    path = shortest_path(neighbors, source, target, max_hops)
+    if path is None or k < 1:
+        return []
+    paths = [path]
+    seen = {tuple(path)}
+    candidates = []
+    while len(paths) < k:
+        previous = paths[-1]
+        for i in range(len(previous) - 1):
+            root = previous[:i + 1]
+            blocked_edges = set()
+            for p in paths:
+                if p[:i + 1] == root:
+                    blocked_edges.add((p[i], p[i + 1]))
+            spur = shortest_path(neighbors, previous[i], target, max_hops - i, blocked_nodes=set(root[:-1]),
+                                 blocked_edges=blocked_edges)
+            if spur is not None:
+                candidate = root[:-1] + spur
+                if tuple(candidate) not in seen:
+                    seen.add(tuple(candidate))
+                    heapq.heappush(candidates, (len(candidate), len(seen), candidate))
+        if len(candidates) == 0:
+            break
+        paths.append(heapq.heappop(candidates)[2])
+    return paths
@@ -0,0 +1,151 @@
+import multiprocessing
+import resource
+import sys
+import time
+import traceback
+
+
+# Largest peak RSS of the process seen before the last reset_peak_rss, in MB
+_process_peak_rss_mb = 0
+
+
+def _proc_status_mb(field):
+    """
+    :return: the given field (e.g., VmRSS) of /proc/self/status in MB, or None where there is none
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb():
+    """
+    Current resident set size of the current process in MB, or None where it is not available
+    """
+    return _proc_status_mb('VmRSS')
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of the current process in MB, since the last reset_peak_rss. Where the
+    peak cannot be reset, this is the peak since the process started
+    """
+    peak_rss = _proc_status_mb('VmHWM')
+    if peak_rss is not None:
+        return peak_rss
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss /= 1024  # bytes on macOS, kilobytes elsewhere
+    return peak_rss / 1024
+
+
+def process_peak_rss_mb():
+    """
+    Peak resident set size of the current process in MB since it started, across resets
+    """
+    return max(_process_peak_rss_mb, peak_rss_mb())
+
+
+def reset_peak_rss():
+    """
+    Resets the peak RSS of the current process to its current RSS, so that peak_rss_mb only covers
+    what runs afterwards. Only possible on Linux
+    :return: True if the peak was reset
+    """
+    global _process_peak_rss_mb
+    peak_rss = peak_rss_mb()
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    _process_peak_rss_mb = max(_process_peak_rss_mb, peak_rss)
+    return True
+
+
+def measure(build, args):
+    """
+    Runs build(*args)
+    :return: (output of build, stats) where stats has the wall-clock time in seconds, the peak RSS
+    in MB of the process while it ran, and that peak minus the RSS when it started. The peak is
+    reset before running build where possible. Otherwise the peak is the one of the whole process
+    so far, and peak_rss_scope is 'process' instead of 'stage'
+    """
+    reset = reset_peak_rss()
+    start_rss = rss_mb()
+    start = time.time()
+    output = build(*args)
+    stats = {'wall_clock': time.time() - start, 'peak_rss_mb': peak_rss_mb(),
+             'peak_rss_scope': 'stage' if reset else 'process'}
+    if start_rss is not None:
+        stats['rss_delta_mb'] = stats['peak_rss_mb'] - start_rss
+    return output, stats
+
+
+def _stage_worker(conn, build, args):
+    try:
+        conn.send((True, measure(build, args)))
+    except BaseException:
+        conn.send((False, traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+class StageRunner:
+    """
+    Runs independent stages concurrently, each in its own worker process. Workers are not
+    daemonic, so stages can use process pools themselves. The output of a stage is sent back
+    to the parent when it finishes, so it should be compact, e.g., an edge list
+    """
+
+    def __init__(self, parallel=True):
+        """
+        :param parallel: if False, stages run in the calling process when submitted
+        """
+        self.parallel = parallel
+        self.running = dict()
+        self.finished = dict()
+
+    def submit(self, stage, build, *args):
+        """
+        Starts running build(*args) as the given stage
+        """
+        if stage in self.running or stage in self.finished:
+            raise ValueError("Stage {0} was already submitted".format(stage))
+        if not self.parallel:
+            output, stats = measure(build, args)
+            stats['process'] = 'main'
+            self.finished[stage] = (output, stats)
+            return
+        parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_stage_worker, args=(child_conn, build, args))
+        process.start()
+        child_conn.close()
+        self.running[stage] = (process, parent_conn)
+
+    def result(self, stage):
+        """
+        Waits for the stage to finish
+        :return: (output, stats) of the stage
+        """
+        if stage in self.running:
+            process, conn = self.running.pop(stage)
+            try:
+                success, value = conn.recv()
+            except EOFError:
+                process.join()
+                raise RuntimeError("Stage {0} died with exit code {1}".format(stage, process.exitcode))
+            finally:
+                conn.close()
+            process.join()
+            if not success:
+                raise RuntimeError("Stage {0} failed:\n{1}".format(stage, value))
+            output, stats = value
+            stats['process'] = 'worker'
+            self.finished[stage] = (output, stats)
+        return self.finished.pop(stage)
@@ -3,13 +3,19 @@ from knowledgerepr.fieldnetwork import serialize_network
 from api.apiutils import Relation
 
 
-def generate_network_with(num_nodes=10, num_nodes_per_table=2, num_schema_sim=5, num_content_sim=5, num_pkfk=2):
+def generate_network_with(num_nodes=10, num_nodes_per_table=2, num_schema_sim=5, num_content_sim=5, num_pkfk=2,
+                          string_ids=False):
+    """
+    :param string_ids: whether to use the string form of the ids, as the store returns them
+    """
+
+    node_id = str if string_ids else int
 
     def node_generator():
         for i in range(num_nodes):
             for j in range(num_nodes_per_table):
                 table_name = "synt" + str(i)
-                element = (i, "syndb", table_name, "synf" + str(i), 100, 50, "T")
+                element = (node_id(i), "syndb", table_name, "synf" + str(i), 100, 50, "T")
                 yield element
 
     def gen_pairs_relation(source, num_relations):
@@ -49,17 +55,17 @@ def generate_network_with(num_nodes=10, num_nodes_per_table=2, num_schema_sim=5,
     gen_schema_sim = gen_pairs_relation(0, num_schema_sim)
     for src, trg in gen_schema_sim:
         #print(str(src) + " - " + str(trg))
-        fn.add_relation(src, trg, Relation.SCHEMA_SIM, 0.2)
+        fn.add_relation(node_id(src), node_id(trg), Relation.SCHEMA_SIM, 0.2)
 
     # num content sim
     gen_schema_sim = gen_pairs_relation(1, num_content_sim)
     for src, trg in gen_schema_sim:
-        fn.add_relation(src, trg, Relation.CONTENT_SIM, 0.5)
+        fn.add_relation(node_id(src), node_id(trg), Relation.CONTENT_SIM, 0.5)
 
     # num pkfk
     gen_schema_sim = gen_pairs_relation(2, num_pkfk)
     for src, trg in gen_schema_sim:
-        fn.add_relation(src, trg, Relation.PKFK, 0.8)
+        fn.add_relation(node_id(src), node_id(trg), Relation.PKFK, 0.8)
 
     return fn
 
@@ -0,0 +1,204 @@
+"""
+Table-level graph of one relation, e.g., PKFK. Nodes are tables and the edge between two tables
+carries the pairs of fields that join them, with their scores. Built once from the field-level
+relation and updated with each edge that is added or removed, so that join paths between tables are
+found without expanding the fields of every table on the way.
+
+TableReachability summarizes that graph: its connected components, the distance in joins between
+tables up to a maximum number of hops and, optionally, precomputed join paths. It is built with the
+model and stored next to it (REACHABILITY_FILE).
+"""
+from collections import defaultdict
+import os
+
+from inputoutput import inputoutput as io
+
+REACHABILITY_FILE = "table_reachability.pkl"
+
+
+class TableJoinIndex:
+
+    def __init__(self, id_names):
+        """
+        :param id_names: id -> (db_name, source_name, field_name, data_type) of the network
+        """
+        self.id_names = id_names
+        # table -> joined table -> {(id of a field of table, id of a field of joined table): score}
+        self.joins = defaultdict(dict)
+
+    def _table_of(self, nid):
+        _, source_name, _, _ = self.id_names[nid]
+        return source_name
+
+    def add(self, node_src, node_target, score):
+        """
+        Adds or updates the join between the tables of two fields. Relations within a table are not joins
+        """
+        src_table = self._table_of(node_src)
+        target_table = self._table_of(node_target)
+        if src_table == target_table:
+            return
+        self.joins[src_table].setdefault(target_table, dict())[(node_src, node_target)] = score
+        self.joins[target_table].setdefault(src_table, dict())[(node_target, node_src)] = score
+
+    def add_edges(self, edges):
+        """
+        :param edges: iterable of (node_src, node_target, score)
+        """
+        for node_src, node_target, score in edges:
+            self.add(node_src, node_target, score)
+
+    def remove(self, node_src, node_target):
+        """
+        Removes the join between two fields, if any. Tables that no longer join are disconnected
+        """
+        src_table = self._table_of(node_src)
+        target_table = self._table_of(node_target)
+        for table, other, key in [(src_table, target_table, (node_src, node_target)),
+                                  (target_table, src_table, (node_target, node_src))]:
+            keys = self.joins.get(table, dict()).get(other)
+            if keys is None:
+                continue
+            keys.pop(key, None)
+            if len(keys) == 0:
+                del self.joins[table][other]
+                if len(self.joins[table]) == 0:
+                    del self.joins[table]
+
+    def neighbors(self, table):
+        """
+        :return: dict of joined table -> {(field of table, field of joined table): score}
+        """
+        return self.joins.get(table, dict())
+
+    def join_keys(self, table, other):
+        """
+        :return: {(field of table, field of other): score} of the fields that join both tables
+        """
+        return self.neighbors(table).get(other, dict())
+
+
+class TableReachability:
+
+    def __init__(self, components, distances, max_hops):
+        """
+        :param components: table -> id of its connected component, for tables that join some other table
+        :param distances: table -> {table: number of joins}, for tables at most max_hops joins away
+        :param max_hops: maximum number of joins of distances
+        """
+        self.components = components
+        self.distances = distances
+        self.max_hops = max_hops
+        # (table, table, max_hops) -> join paths between both tables
+        self.paths = dict()
+
+    @classmethod
+    def build(cls, join_index, max_hops=2):
+        """
+        :param join_index: TableJoinIndex
+        :param max_hops: maximum number of joins between tables whose distance is kept
+        """
+        components = dict()
+        component = -1
+        for table in join_index.joins.keys():
+            if table in components:
+                continue
+            component += 1
+            components[table] = component
+            pending = [table]
+            while len(pending) > 0:
+                for other in join_index.neighbors(pending.pop()).keys():
+                    if other not in components:
+                        components[other] = component
+                        pending.append(other)
+        distances = {table: _bounded_distances(join_index, table, max_hops) for table in join_index.joins.keys()}
+        return cls(components, distances, max_hops)
+
+    def connected(self, table, other):
+        """
+        :return: True if both tables are in the same connected component
+        """
+        if table == other:
+            return True
+        component = self.components.get(table)
+        return component is not None and component == self.components.get(other)
+
+    def connected_all(self, tables):
+        """
+        :return: True if all tables are in the same connected component
+        """
+        tables = list(tables)
+        return all(self.connected(tables[0], other) for other in tables[1:])
+
+    def reachable(self, table, other, max_hops):
+        """
+        :return: False if there is no join path between both tables with at most max_hops joins. Beyond
+        the max_hops of the index only the connected components are known
+        """
+        if not self.connected(table, other):
+            return False
+        if table == other or max_hops > self.max_hops:
+            return True
+        return self.distances[table].get(other, max_hops + 1) <= max_hops
+
+    def get_paths(self, table, other, max_hops):
+        """
+        :return: the precomputed join paths between both tables, or None if they were not precomputed
+        """
+        return self.paths.get((table, other, max_hops))
+
+    def set_paths(self, table, other, max_hops, paths):
+        self.paths[(table, other, max_hops)] = paths
+
+
+def _bounded_distances(join_index, table, max_hops):
+    distances = {table: 0}
+    frontier = [table]
+    for hops in range(1, max_hops + 1):
+        next_frontier = []
+        for t in frontier:
+            for other in join_index.neighbors(t).keys():
+                if other not in distances:
+                    distances[other] = hops
+                    next_frontier.append(other)
+        frontier = next_frontier
+    return distances
+
+
+def precompute_paths(network, reachability, relation, max_hops):
+    """
+    Finds and keeps in reachability the join paths of every pair of tables at most max_hops joins away
+    :param network: FieldNetwork
+    :param reachability: TableReachability of relation in network
+    :param relation: the type of relation (edge) that joins tables, e.g., PKFK
+    :param max_hops: maximum number of joins of the paths, at most reachability.max_hops
+    :return: number of pairs of tables
+    """
+    assert max_hops <= reachability.max_hops
+    pairs = 0
+    for table, distances in reachability.distances.items():
+        for other, hops in distances.items():
+            if table < other and hops <= max_hops:
+                paths = network.find_path_table(table, other, relation, None, max_hops=max_hops).paths()
+                reachability.set_paths(table, other, max_hops, paths)
+                reachability.set_paths(other, table, max_hops, paths)
+                pairs += 1
+    return pairs
+
+
+def serialize_table_reachability(reachability, path):
+    """
+    :param path: directory of the model
+    """
+    io.serialize_object(reachability, os.path.join(path, REACHABILITY_FILE))
+
+
+def deserialize_table_reachability(path):
+    """
+    :param path: directory of the model
+    :return: the TableReachability stored with the model, or None if it has none
+    """
+    path = os.path.join(path, REACHABILITY_FILE)
+    if not os.path.exists(path):
+        return None
+    return io.deserialize_object(path)
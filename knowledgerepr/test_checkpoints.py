@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from api.apiutils import Relation
+from knowledgerepr import checkpoints
+from knowledgerepr.fieldnetwork import FieldNetwork
+
+
+def fields():
+    return [(str(i), "db", "table" + str(i // 3), "field" + str(i), 100, 10 * i, "N") for i in range(9)]
+
+
+class TestCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def build_network(self):
+        network = FieldNetwork()
+        network.init_meta_schema(fields())
+        return network
+
+    def test_digest(self):
+        self.assertEqual(checkpoints.digest(fields(), 0.7), checkpoints.digest(fields(), 0.7))
+        self.assertNotEqual(checkpoints.digest(fields(), 0.7), checkpoints.digest(fields(), 0.8))
+        self.assertNotEqual(checkpoints.digest(fields()), checkpoints.digest(fields()[1:]))
+
+    def test_save_and_load(self):
+        network = self.build_network()
+        network.add_relation("0", "1", Relation.CONTENT_SIM, 0.9)
+        network.add_relation("0", "2", Relation.INCLUSION_DEPENDENCY, 1)
+        network.add_relation("3", "4", Relation.PKFK, 0.8)
+        edges = checkpoints.network_edges(network)
+        self.assertEqual(3, len(edges))
+        self.assertEqual(1, len(checkpoints.network_edges(network, relations=[Relation.PKFK])))
+
+        checkpoints.save_checkpoint(self.path, 'content_sim_num', 'key', edges, payload={'a': 1})
+        self.assertFalse(os.path.exists(checkpoints.checkpoint_path(self.path, 'content_sim_num') + '.tmp'))
+        self.assertIsNone(checkpoints.load_checkpoint(self.path, 'content_sim_num', 'other_key'))
+        self.assertIsNone(checkpoints.load_checkpoint(self.path, 'pkfk', 'key'))
+        checkpoint = checkpoints.load_checkpoint(self.path, 'content_sim_num', 'key')
+        self.assertEqual({'a': 1}, checkpoint['payload'])
+
+        restored = self.build_network()
+        checkpoints.add_edges(restored, checkpoint['edges'])
+        self.assertEqual(sorted(map(str, edges)), sorted(map(str, checkpoints.network_edges(restored))))
+
+    def test_load_corrupt_checkpoint(self):
+        checkpoints.save_checkpoint(self.path, 'pkfk', 'key', [])
+        with open(checkpoints.checkpoint_path(self.path, 'pkfk'), 'wb') as f:
+            f.write(b'not a pickle')
+        self.assertIsNone(checkpoints.load_checkpoint(self.path, 'pkfk', 'key'))
+
+
+if __name__ == "__main__":
+    unittest.main()
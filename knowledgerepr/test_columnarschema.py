@@ -0,0 +1,82 @@
+import pickle
+import random
+import unittest
+
+from api.apiutils import Relation
+from knowledgerepr.fieldnetwork import FieldNetwork
+from knowledgerepr import columnarschema
+
+
+def fields(num_fields, seed=0, nid_prefix=""):
+    rnd = random.Random(seed)
+    for i in range(num_fields):
+        total = rnd.choice([0, 100])
+        yield (nid_prefix + str(rnd.randrange(10 ** 9)), "db" + str(i % 2), "table" + str(i // 7),
+               "name" + str(rnd.randrange(30)), total, rnd.randrange(101), rnd.choice("NT"))
+
+
+def batches(field_list, batch_size=13):
+    for i in range(0, len(field_list), batch_size):
+        yield field_list[i:i + batch_size]
+
+
+class TestColumnarSchema(unittest.TestCase):
+
+    def build_networks(self, field_list):
+        network = FieldNetwork()
+        network.init_meta_schema(field_list)
+        network_bulk = FieldNetwork()
+        network_bulk.init_meta_schema_batches(batches(field_list))
+        return network, network_bulk
+
+    def assert_same_schema(self, network, network_bulk):
+        nids = sorted(network.iterate_ids())
+        self.assertEqual(nids, sorted(network_bulk.iterate_ids()))
+        self.assertEqual(network.graph_order(), network_bulk.graph_order())
+        self.assertEqual(network.get_info_for(nids), network_bulk.get_info_for(nids))
+        for nid in nids:
+            self.assertEqual(network.get_data_type_of(nid), network_bulk.get_data_type_of(nid))
+            self.assertAlmostEqual(network.get_cardinality_of(nid), network_bulk.get_cardinality_of(nid), places=6)
+        tables = sorted(network._get_underlying_repr_table_to_ids().keys())
+        self.assertEqual(tables, sorted(network_bulk._get_underlying_repr_table_to_ids().keys()))
+        self.assertEqual(network.get_number_tables(), network_bulk.get_number_tables())
+        for table in tables:
+            self.assertEqual(network.get_fields_of_source(table), network_bulk.get_fields_of_source(table))
+
+    def test_bulk_matches_init_meta_schema(self):
+        for nid_prefix in ["", "x"]:
+            network, network_bulk = self.build_networks(list(fields(300, nid_prefix=nid_prefix)))
+            self.assert_same_schema(network, network_bulk)
+            self.assertEqual(0, len(network_bulk._get_underlying_repr_graph()))
+            with self.assertRaises(KeyError):
+                network.get_cardinality_of(-1)
+
+    def test_repeated_ids(self):
+        field_list = list(fields(50))
+        field_list.append((field_list[3][0], "db", "other table", "other name", 10, 10, "N"))
+        network, network_bulk = self.build_networks(field_list)
+        self.assert_same_schema(network, network_bulk)
+
+    def test_changes_after_bulk(self):
+        field_list = list(fields(100))
+        network, network_bulk = self.build_networks(field_list[:80])
+        for n in [network, network_bulk]:
+            n.init_meta_schema(field_list[80:])
+            for nid, _, _, _, _, _, _ in field_list[:14]:
+                n.remove_field(nid)
+            n.add_relation(field_list[20][0], field_list[90][0], Relation.CONTENT_SIM, 0.5)
+        self.assert_same_schema(network, network_bulk)
+        self.assertNotIn("table0", network_bulk._get_underlying_repr_table_to_ids())
+        self.assertEqual(network.neighbors_id(field_list[20][0], Relation.CONTENT_SIM).data,
+                         network_bulk.neighbors_id(field_list[20][0], Relation.CONTENT_SIM).data)
+        self.assertEqual([], network_bulk.neighbors_id(field_list[30][0], Relation.CONTENT_SIM).data)
+
+        id_info = pickle.loads(pickle.dumps(network_bulk._get_underlying_repr_id_to_field_info()))
+        table_ids = pickle.loads(pickle.dumps(network_bulk._get_underlying_repr_table_to_ids()))
+        self.assertIsInstance(id_info, columnarschema.ColumnarIdInfo)
+        network_loaded = FieldNetwork(network_bulk._get_underlying_repr_graph(), id_info, table_ids)
+        self.assert_same_schema(network, network_loaded)
+
+
+if __name__ == "__main__":
+    unittest.main()
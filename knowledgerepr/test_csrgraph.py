@@ -0,0 +1,264 @@
+import random
+import tempfile
+import unittest
+
+import algebra
+import ddapi
+from api.apiutils import DRS, OP, Operation, Relation
+from knowledgerepr import csrgraph
+from knowledgerepr import fieldnetwork
+from knowledgerepr import networkbuilder
+from knowledgerepr.test_columnarschema import batches, fields
+from knowledgerepr.csrgraph import CSRGraph
+from knowledgerepr.fieldnetwork import FieldNetwork, CSRFieldNetwork
+
+RELATIONS = [Relation.SCHEMA_SIM, Relation.CONTENT_SIM, Relation.INCLUSION_DEPENDENCY, Relation.PKFK]
+
+
+def random_network(num_fields=150, num_edges=500, seed=0):
+    rnd = random.Random(seed)
+    network = FieldNetwork()
+    network.init_meta_schema((str(i), "db", "table" + str(i // 5), "f" + str(i), rnd.choice([0, 100]),
+                              rnd.choice([10, 75, 100]), rnd.choice("NT")) for i in range(num_fields))
+    for _ in range(num_edges):
+        network.add_relation(str(rnd.randrange(num_fields)), str(rnd.randrange(num_fields)),
+                             rnd.choice(RELATIONS), rnd.choice([0.25, 0.5, 1.0]))
+    return network
+
+
+class TestCSRGraph(unittest.TestCase):
+
+    def assert_same_network(self, network, csr_network):
+        nids = list(network.iterate_ids())
+        self.assertEqual(sorted(nids), sorted(csr_network.iterate_ids()))
+        for nid in nids:
+            self.assertAlmostEqual(network.get_cardinality_of(nid), csr_network.get_cardinality_of(nid), places=6)
+            for relation in RELATIONS:
+                neighbors = sorted((h.nid, h.score) for h in network.neighbors_id(nid, relation))
+                csr_neighbors = sorted((h.nid, h.score) for h in csr_network.neighbors_id(nid, relation))
+                self.assertEqual(neighbors, csr_neighbors)
+        for relation in RELATIONS:
+            pairs = set(frozenset((h1.nid, h2.nid)) for h1, h2 in network.enumerate_relation(relation, as_str=False))
+            csr_pairs = set(frozenset((h1.nid, h2.nid))
+                            for h1, h2 in csr_network.enumerate_relation(relation, as_str=False))
+            self.assertEqual(pairs, csr_pairs)
+        degrees = dict(network.fields_degree(len(nids)))
+        for nid, degree in csr_network.fields_degree(10):
+            self.assertEqual(degrees[nid], degree)
+        self.assertEqual(max(degrees.values()), csr_network.fields_degree(1)[0][1])
+
+    def test_same_queries_as_networkx(self):
+        network = random_network()
+        csr_network = fieldnetwork.to_csr_network(network)
+        self.assertIsInstance(csr_network._get_underlying_repr_graph(), CSRGraph)
+        self.assert_same_network(network, csr_network)
+
+    def test_changes(self):
+        network = random_network()
+        csr_network = fieldnetwork.to_csr_network(network)
+        for n in [network, csr_network]:
+            rnd = random.Random(1)
+            n.init_meta_schema([("1000", "db", "new table", "new", 100, 90, "T")])
+            n.add_relation("1000", "3", Relation.CONTENT_SIM, 0.75)
+            n.remove_field("7")
+            for _ in range(100):
+                src, tgt, relation = str(rnd.randrange(8, 150)), str(rnd.randrange(8, 150)), rnd.choice(RELATIONS)
+                if rnd.random() < 0.5:
+                    n.add_relation(src, tgt, relation, 0.125)
+                else:
+                    n.remove_relation(src, tgt, relation)
+        self.assert_same_network(network, csr_network)
+        csr_network._get_underlying_repr_graph().compact()
+        self.assert_same_network(network, csr_network)
+
+    def test_bulk_edges_and_compaction(self):
+        network = random_network()
+        csr_network = fieldnetwork.to_csr_network(network)
+        csr = csr_network._get_underlying_repr_graph().relation(Relation.PKFK)
+        rnd = random.Random(3)
+        edges = [(str(rnd.randrange(150)), str(rnd.randrange(150)), rnd.randrange(1, 9) / 8) for _ in range(300)]
+        for n in [network, csr_network]:
+            n.add_relations(Relation.PKFK, edges)
+        self.assertEqual(0, len(csr.added) + len(csr.removed))
+        self.assert_same_network(network, csr_network)
+
+        src, tgt, _ = edges[0]
+        for n in [network, csr_network]:
+            n.remove_relation(src, tgt, Relation.PKFK)
+        G = csr_network._get_underlying_repr_graph()
+        self.assertEqual({G.position_of(src), G.position_of(tgt)}, set(csr.removed.keys()))
+        self.assert_same_network(network, csr_network)
+
+        compact_min_changes = csrgraph.COMPACT_MIN_CHANGES
+        csrgraph.COMPACT_MIN_CHANGES = 20
+        try:
+            for _ in range(250):
+                src, tgt = str(rnd.randrange(150)), str(rnd.randrange(150))
+                for n in [network, csr_network]:
+                    n.add_relation(src, tgt, Relation.PKFK, 0.5)
+        finally:
+            csrgraph.COMPACT_MIN_CHANGES = compact_min_changes
+        self.assertTrue(csr.changes < 250)
+        self.assert_same_network(network, csr_network)
+
+    def test_relation_adjacency(self):
+        network = random_network()
+        network.neighbors_id("0", Relation.PKFK)  # the adjacency is kept up to date from now on
+        rnd = random.Random(2)
+        network.remove_field("7")
+        for _ in range(200):
+            src, tgt, relation = str(rnd.randrange(8, 150)), str(rnd.randrange(8, 150)), rnd.choice(RELATIONS)
+            if rnd.random() < 0.5:
+                network.add_relation(src, tgt, relation, rnd.random())
+            else:
+                network.remove_relation(src, tgt, relation)
+        network.add_relations(Relation.PKFK, [("8", "20", 0.5), ("9", "30", 0.25)])
+        G = network._get_underlying_repr_graph()
+        for nid in network.iterate_ids():
+            for relation in RELATIONS:
+                expected = sorted((k, v[relation]['score']) for k, v in G[nid].items() if relation in v)
+                self.assertEqual(expected, sorted((h.nid, h.score) for h in network.neighbors_id(nid, relation)))
+        with self.assertRaises(KeyError):
+            network.neighbors_id("7", Relation.PKFK)
+
+    def test_neighbors_ids(self):
+        network = random_network()
+        for n in [network, fieldnetwork.to_csr_network(network)]:
+            for relation in RELATIONS:
+                hits = n.get_hits_from_table("table3") + n.get_hits_from_table("table4")
+                expected = DRS([], Operation(OP.NONE))
+                for h in hits:
+                    expected.absorb(n.neighbors_id(h, relation))
+                o_drs = n.neighbors_ids([h.nid for h in hits[:2]] + hits[2:], relation)
+                self.assertEqual(sorted(expected.data), sorted(o_drs.data))
+                self.assertEqual(sorted(expected.get_provenance().prov_graph().edges(keys=True)),
+                                 sorted(o_drs.get_provenance().prov_graph().edges(keys=True)))
+                self.assertEqual(set(expected.get_provenance().prov_graph().nodes()),
+                                 set(o_drs.get_provenance().prov_graph().nodes()))
+
+    def assert_same_provenance(self, eager, lazy):
+        self.assertFalse(eager.is_lazy_provenance())
+        self.assertTrue(lazy.is_lazy_provenance())
+        self.assertIsNone(lazy.get_provenance()._p_graph)
+        self.assertEqual(sorted(eager.data), sorted(lazy.data))
+        self.assertEqual(sorted(eager.get_provenance().prov_graph().edges(keys=True)),
+                         sorted(lazy.get_provenance().prov_graph().edges(keys=True)))
+
+    def test_lazy_provenance(self):
+        network = random_network()
+        for n in [network, fieldnetwork.to_csr_network(network)]:
+            hits = n.get_hits_from_table("table3")
+            for relation in RELATIONS:
+                self.assert_same_provenance(n.neighbors_id(hits[0], relation),
+                                            n.neighbors_id(hits[0], relation, lazy_provenance=True))
+                self.assert_same_provenance(n.neighbors_ids(hits, relation, top_k=2),
+                                            n.neighbors_ids(hits, relation, top_k=2, lazy_provenance=True))
+                self.assert_same_provenance(n.traverse(hits, relation, 2),
+                                            n.traverse(hits, relation, 2, lazy_provenance=True))
+            target = sorted(n.traverse(hits[:1], Relation.PKFK, 3).data)[-1]
+            self.assert_same_provenance(n.find_path_hit(hits[0], target, Relation.PKFK),
+                                        n.find_path_hit(hits[0], target, Relation.PKFK, lazy_provenance=True))
+            self.assert_same_provenance(n.find_path_table("table3", "table20", Relation.PKFK, None),
+                                        n.find_path_table("table3", "table20", Relation.PKFK, None,
+                                                          lazy_provenance=True))
+
+        api = algebra.API(network, None, lazy_provenance=True)
+        self.assert_same_provenance(algebra.API(network, None).content_similar_to(hits[0]),
+                                    api.content_similar_to(hits[0]))
+        old_api = ddapi.API(network, lazy_provenance=True)
+        self.assert_same_provenance(ddapi.API(network).similar_content_to(DRS([hits[0]], Operation(OP.ORIGIN))),
+                                    old_api.similar_content_to(old_api.drs_from_hit(hits[0])))
+
+    def assert_top_neighbors(self, n, nid, relation, top_k, min_score):
+        neighbors = sorted(((h.nid, h.score) for h in n.neighbors_id(nid, relation)), key=lambda x: -x[1])
+        if min_score is not None:
+            neighbors = [(k, score) for k, score in neighbors if score >= min_score]
+        o_drs = n.neighbors_id(nid, relation, top_k=top_k, min_score=min_score)
+        top = [(h.nid, h.score) for h in o_drs]
+        # ties at the cut can be broken either way, but the scores are the same
+        self.assertEqual([score for _, score in neighbors[:top_k]], [score for _, score in top])
+        self.assertTrue(set(top) <= set(neighbors))
+        self.assertEqual(len(top), len(o_drs.get_provenance().prov_graph().edges()))
+
+    def test_top_neighbors(self):
+        network = random_network()
+        csr_network = fieldnetwork.to_csr_network(network)
+        for n in [network, csr_network]:
+            for step in range(2):
+                for nid in range(0, 150, 7):
+                    for relation in RELATIONS:
+                        for top_k, min_score in [(1, None), (3, None), (None, 0.5), (2, 0.5), (0, None), (5, 2.0)]:
+                            self.assert_top_neighbors(n, nid, relation, top_k, min_score)
+                    hits = n.get_hits_from_table("table" + str(nid // 5))
+                    o_drs = n.neighbors_ids(hits, Relation.PKFK, top_k=2, min_score=0.5)
+                    expected = DRS([], Operation(OP.NONE))
+                    for h in hits:
+                        expected.absorb(n.neighbors_id(h, Relation.PKFK, top_k=2, min_score=0.5))
+                    self.assertEqual(sorted(expected.data), sorted(o_drs.data))
+                    self.assertEqual(sorted(expected.get_provenance().prov_graph().edges(keys=True)),
+                                     sorted(o_drs.get_provenance().prov_graph().edges(keys=True)))
+                # the ranked neighbors follow the changes
+                rnd = random.Random(3)
+                for _ in range(100):
+                    src, tgt = rnd.randrange(8, 150), rnd.randrange(8, 150)
+                    relation = rnd.choice(RELATIONS)
+                    if rnd.random() < 0.5:
+                        n.add_relation(src, tgt, relation, rnd.choice([0.125, 0.75, 2.0]))
+                    else:
+                        n.remove_relation(src, tgt, relation)
+
+    def test_pkfk_relation(self):
+        network = random_network()
+        csr_network = fieldnetwork.to_csr_network(network)
+        networkbuilder.build_pkfk_relation(network)
+        networkbuilder.build_pkfk_relation(csr_network)
+        self.assert_same_network(network, csr_network)
+
+    def test_add_fields(self):
+        field_list = list(fields(120))
+        field_list.append((field_list[3][0], "db0", "table3", "repeated", 100, 10, "T"))
+        rnd = random.Random(2)
+        edges = [(rnd.choice(field_list)[0], rnd.choice(field_list)[0], rnd.choice(RELATIONS),
+                  rnd.choice([0.25, 0.5, 1.0])) for _ in range(300)]
+        one_by_one = [FieldNetwork(), CSRFieldNetwork()]
+        for n in one_by_one:
+            n.add_fields(field_list[:50])
+            n.add_fields(field_list[50:])
+        bulk = [FieldNetwork(), CSRFieldNetwork()]
+        for n in bulk:
+            n.init_meta_schema_batches(batches(field_list))
+        for network, csr_network in [one_by_one, bulk]:
+            G = csr_network._get_underlying_repr_graph()
+            self.assertEqual(network.graph_order(), len(G) - len(G.removed_positions))
+            for n in [network, csr_network]:
+                for src, target, relation, score in edges:
+                    n.add_relation(src, target, relation, score)
+            self.assert_same_network(network, csr_network)
+            nids = sorted(network.iterate_ids())
+            self.assertEqual(network.get_info_for(nids), csr_network.get_info_for(nids))
+            for table in ["table0", "table3", "table16"]:
+                self.assertEqual(sorted(network.get_hits_from_table(table)),
+                                 sorted(csr_network.get_hits_from_table(table)))
+        with self.assertRaises(ValueError):
+            bulk[1].init_meta_schema_batches(batches(field_list))
+
+    def test_deserialize_backend(self):
+        network = random_network()
+        path = tempfile.mkdtemp() + "/"
+        fieldnetwork.serialize_network(network, path)
+        csr_network = fieldnetwork.deserialize_network(path, backend='csr')
+        self.assertIsInstance(csr_network, CSRFieldNetwork)
+        self.assert_same_network(network, csr_network)
+
+        csr_path = tempfile.mkdtemp() + "/"
+        fieldnetwork.serialize_network(csr_network, csr_path)
+        self.assertIsInstance(fieldnetwork.deserialize_network(csr_path, backend='csr'), CSRFieldNetwork)
+        network_loaded = fieldnetwork.deserialize_network(csr_path)
+        self.assertNotIsInstance(network_loaded, CSRFieldNetwork)
+        self.assert_same_network(network_loaded, csr_network)
+        with self.assertRaises(ValueError):
+            fieldnetwork.deserialize_network(path, backend='other')
+
+
+if __name__ == "__main__":
+    unittest.main()
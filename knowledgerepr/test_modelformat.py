@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+
+from api.apiutils import Relation
+from knowledgerepr import fieldnetwork
+from knowledgerepr import modelformat
+from knowledgerepr.fieldnetwork import CSRFieldNetwork
+from knowledgerepr.test_csrgraph import random_network, TestCSRGraph
+
+
+class TestModelFormat(unittest.TestCase):
+
+    assert_same_network = TestCSRGraph.assert_same_network
+
+    def assert_same_fields(self, network, mapped_network):
+        for nid in network.iterate_ids():
+            self.assertEqual(network.get_info_for([nid]), mapped_network.get_info_for([nid]))
+        table_ids = network._get_underlying_repr_table_to_ids()
+        mapped_table_ids = mapped_network._get_underlying_repr_table_to_ids()
+        self.assertEqual(sorted(table_ids.keys()), sorted(mapped_table_ids.keys()))
+        for source in table_ids.keys():
+            self.assertEqual(table_ids[source], mapped_table_ids[source])
+
+    def test_write_open(self):
+        network = random_network()
+        path = os.path.join(tempfile.mkdtemp(), modelformat.MODEL_FILE)
+        modelformat.write_model(network, path)
+        mapped_network = modelformat.open_model(path)
+        self.assertIsInstance(mapped_network, CSRFieldNetwork)
+        self.assert_same_network(network, mapped_network)
+        self.assert_same_fields(network, mapped_network)
+
+    def test_changes_stay_in_process(self):
+        network = random_network()
+        path = os.path.join(tempfile.mkdtemp(), modelformat.MODEL_FILE)
+        modelformat.write_model(network, path)
+        mapped_network = modelformat.open_model(path)
+        for n in [network, mapped_network]:
+            n.add_relation("1", "2", Relation.CONTENT_SIM, 0.125)
+            n.remove_field("7")
+        self.assert_same_network(network, mapped_network)
+        self.assert_same_network(random_network(), modelformat.open_model(path))
+
+    def test_convert_pickle_model(self):
+        network = random_network()
+        path = tempfile.mkdtemp() + "/"
+        fieldnetwork.serialize_network(network, path)
+        self.assertEqual(path + modelformat.MODEL_FILE, modelformat.convert_pickle_model(path))
+        mapped_network = fieldnetwork.deserialize_network(path, backend='mmap')
+        self.assert_same_network(network, mapped_network)
+        self.assert_same_fields(network, mapped_network)
+
+    def test_relations_loaded_on_first_use(self):
+        network = random_network()
+        path = os.path.join(tempfile.mkdtemp(), modelformat.MODEL_FILE)
+        modelformat.write_model(network, path)
+        mapped_network = modelformat.open_model(path)
+        relations = mapped_network._get_underlying_repr_graph().relations
+        self.assertFalse(any(relations.is_loaded(relation) for relation in relations))
+        self.assertEqual(network.get_fields_of_source("table3"), mapped_network.get_fields_of_source("table3"))
+        mapped_network.neighbors_id("3", Relation.PKFK)
+        self.assertEqual([Relation.PKFK], [relation for relation in relations if relations.is_loaded(relation)])
+
+        modelformat.warm_model(modelformat.ModelFile(path), mapped_network).join()
+        self.assertTrue(all(relations.is_loaded(relation) for relation in relations))
+        self.assert_same_network(network, mapped_network)
+
+    def test_bad_header(self):
+        path = os.path.join(tempfile.mkdtemp(), modelformat.MODEL_FILE)
+        modelformat.write_model(random_network(), path)
+        with open(path, 'r+b') as f:
+            f.seek(len(modelformat.MAGIC))
+            f.write(b'\xff')
+        with self.assertRaises(ValueError):
+            modelformat.open_model(path)
+        with open(path, 'r+b') as f:
+            f.write(b'NOTMODEL')
+        with self.assertRaises(ValueError):
+            modelformat.open_model(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
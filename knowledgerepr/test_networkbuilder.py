@@ -0,0 +1,266 @@
+import random
+import unittest
+
+import numpy as np
+from datasketch import MinHash, MinHashLSH
+
+from api.apiutils import Relation
+from knowledgerepr.fieldnetwork import FieldNetwork
+from knowledgerepr import networkbuilder
+
+
+def field_gen(names, table_size=4):
+    for i, name in enumerate(names):
+        table = "table" + str(i // table_size)
+        yield (str(i), "db", table, name, 100, 50, "T")
+
+
+def schema_sim_edges(network):
+    edges = dict()
+    for h1, h2 in network.enumerate_relation(Relation.SCHEMA_SIM, as_str=False):
+        edges[frozenset((h1.nid, h2.nid))] = h2.score
+    return edges
+
+
+def num_signatures(num_fields, seed=0):
+    rnd = random.Random(seed)
+    id_sig = []
+    for i in range(num_fields):
+        kind = rnd.random()
+        if kind < 0.15:  # single point
+            median = rnd.randint(0, 20)
+            sig = (median, 0, median, median)
+        elif kind < 0.6:  # integer-valued, candidate for inclusion dependencies
+            median = rnd.randint(0, 60)
+            iqr = rnd.randint(1, 30)
+            sig = (median, iqr, median - iqr - rnd.randint(0, 10), median + iqr + rnd.randint(0, 10))
+        else:
+            median = rnd.uniform(-20, 60)
+            iqr = rnd.choice([rnd.uniform(0.5, 30), 10.0])
+            sig = (median, iqr, median - iqr - rnd.uniform(0, 10), median + iqr + rnd.uniform(0, 10))
+        if rnd.random() < 0.05:
+            sig = sig[:3] + (float('inf'),)
+        id_sig.append((i, sig))
+    return id_sig
+
+
+def mh_signatures(num_fields, num_perm=512, seed=0):
+    rnd = np.random.RandomState(seed)
+    id_sig = []
+    bases = rnd.randint(0, 2 ** 32 - 1, size=(num_fields // 4, num_perm))
+    for i in range(num_fields):
+        # fields derived from a few bases, with a varying fraction of hash values changed
+        sig = bases[rnd.randint(len(bases))].copy()
+        changed = rnd.rand(num_perm) < rnd.choice([0.0, 0.01, 0.05, 0.3, 1.0])
+        sig[changed] = rnd.randint(0, 2 ** 32 - 1, size=changed.sum())
+        id_sig.append((i, sig.tolist()))
+    return id_sig
+
+
+def mh_lsh_edges(mh_signatures):
+    content_index = MinHashLSH(threshold=0.7, num_perm=512)
+    mh_objs = []
+    for nid, mh_sig in mh_signatures:
+        mh_obj = MinHash(num_perm=512)
+        mh_obj.hashvalues = np.asarray(mh_sig, dtype=int)
+        content_index.insert(nid, mh_obj)
+        mh_objs.append((nid, mh_obj))
+    edges = set()
+    for nid, mh_obj in mh_objs:
+        for r_nid in content_index.query(mh_obj):
+            if r_nid != nid:
+                edges.add(frozenset((nid, r_nid)))
+    return edges, mh_objs
+
+
+def relation_edges(network, relation):
+    edges = dict()
+    for h1, h2 in network.enumerate_relation(relation, as_str=False):
+        edges[frozenset((h1.nid, h2.nid))] = h2.score
+    return edges
+
+
+class TestNetworkBuilder(unittest.TestCase):
+
+    names = ["id", "user_id", "user id", "user name", "name", "first name", "last name", "first_name",
+             "address", "email address", "zip code", "zip", "city", "city name", "state", "state code",
+             "date", "start date", "end date", "year", "customer id", "customer name", "order id", "order",
+             "id", "name", "zip", "date", "user_id", "city", "customer id", "year", "id", "state", "name", "id"]
+
+    def build_network(self):
+        return self.build_network_with(self.names)
+
+    def build_network_with(self, names):
+        network = FieldNetwork()
+        network.init_meta_schema(field_gen(names))
+        return network
+
+    def test_schema_sim_batch_matches_engine(self):
+        network_engine = self.build_network()
+        networkbuilder.build_schema_sim_relation(network_engine, batch=False, rand_seed=7)
+        network_batch = self.build_network()
+        networkbuilder.build_schema_sim_relation(network_batch, batch=True, rand_seed=7)
+
+        edges_engine = schema_sim_edges(network_engine)
+        edges_batch = schema_sim_edges(network_batch)
+
+        self.assertTrue(len(edges_engine) > 0)
+        self.assertEqual(set(edges_engine.keys()), set(edges_batch.keys()))
+        for pair, score in edges_engine.items():
+            self.assertAlmostEqual(score, edges_batch[pair])
+
+    def test_schema_sim_batch_index_is_queryable(self):
+        network = self.build_network()
+        index = networkbuilder.build_schema_sim_relation(network, batch=True, rand_seed=7)
+        network_engine = self.build_network()
+        index_engine = networkbuilder.build_schema_sim_relation(network_engine, batch=False, rand_seed=7)
+
+        buckets = index.text_engine.storage.buckets['default']
+        buckets_engine = index_engine.text_engine.storage.buckets['default']
+        self.assertEqual(set(buckets.keys()), set(buckets_engine.keys()))
+        for key, content in buckets_engine.items():
+            self.assertEqual([data for _, data in content], [data for _, data in buckets[key]])
+
+    def test_num_overlap_distr_indexed_matches_quadratic(self):
+        id_sig = num_signatures(300)
+        names = ["num" + str(i) for i in range(len(id_sig))]
+        network = self.build_network_with(names)
+        networkbuilder.build_content_sim_relation_num_overlap_distr(network, id_sig)
+        network_indexed = self.build_network_with(names)
+        # a small max_pairs forces the sweep to evaluate candidates in several chunks
+        networkbuilder.build_content_sim_relation_num_overlap_distr_indexed(network_indexed, id_sig,
+                                                                           max_pairs=100)
+
+        for relation in [Relation.CONTENT_SIM, Relation.INCLUSION_DEPENDENCY]:
+            edges = relation_edges(network, relation)
+            edges_indexed = relation_edges(network_indexed, relation)
+            self.assertTrue(len(edges) > 0)
+            self.assertEqual(set(edges.keys()), set(edges_indexed.keys()))
+            for pair, score in edges.items():
+                self.assertAlmostEqual(score, edges_indexed[pair])
+
+    def test_content_sim_mh_text_matches_minhash_lsh(self):
+        id_sig = mh_signatures(200)
+        expected, _ = mh_lsh_edges(id_sig)
+        for processes in [1, 2]:
+            network = self.build_network_with(["text" + str(i) for i in range(len(id_sig))])
+            networkbuilder.build_content_sim_mh_text(network, id_sig, processes=processes, min_score=0)
+            edges = relation_edges(network, Relation.CONTENT_SIM)
+            self.assertTrue(len(expected) > 0)
+            self.assertEqual(expected, set(edges.keys()))
+
+    def test_lsh_minhash_index_query(self):
+        id_sig = mh_signatures(100, seed=1)
+        reference = MinHashLSH(threshold=0.7, num_perm=512)
+        index = networkbuilder.LSHMinHashIndex(threshold=0.7, num_perm=512)
+        _, mh_objs = mh_lsh_edges(id_sig)
+        for nid, mh_obj in mh_objs:
+            reference.insert(nid, mh_obj)
+        index.insert_many(mh_objs)
+        for nid in [3, 10, 42]:
+            reference.remove(nid)
+            index.remove(nid)
+        self.assertEqual(len(index), 97)
+        for nid, mh_obj in mh_objs:
+            self.assertEqual(set(reference.query(mh_obj)), set(index.query(mh_obj)))
+        with self.assertRaises(ValueError):
+            index.insert(5, mh_objs[5][1])
+
+    def test_lsh_minhash_index_estimate_similarity(self):
+        rnd = random.Random(3)
+        values = [str(v) for v in range(2000)]
+        sets = [set(rnd.sample(values, rnd.randint(50, 400))) for _ in range(10)]
+        sets += [set(sorted(s)[:len(s) // 2]) for s in sets[:5]]  # contained in another set
+        index = networkbuilder.LSHMinHashIndex(threshold=0.7, num_perm=512)
+        for i, values_i in enumerate(sets):
+            mh = MinHash(num_perm=512)
+            for v in values_i:
+                mh.update(v.encode('utf8'))
+            index.insert(str(i), mh)
+        rows_i, rows_j = np.triu_indices(len(sets), 1)
+        jaccard, containment = index.estimate_similarity(rows_i, rows_j, chunk_size=7)
+        for i, j, jac, cont in zip(rows_i, rows_j, jaccard, containment):
+            intersection = len(sets[i] & sets[j])
+            self.assertAlmostEqual(jac, intersection / len(sets[i] | sets[j]), delta=0.1)
+            self.assertAlmostEqual(cont, intersection / min(len(sets[i]), len(sets[j])), delta=0.1)
+
+    def test_content_sim_mh_text_min_score(self):
+        id_sig = mh_signatures(200)
+        names = ["text" + str(i) for i in range(len(id_sig))]
+        network = self.build_network_with(names)
+        networkbuilder.build_content_sim_mh_text(network, id_sig, processes=1, min_score=0)
+        network_verified = self.build_network_with(names)
+        networkbuilder.build_content_sim_mh_text(network_verified, id_sig, processes=1, min_score=0.9)
+
+        edges = relation_edges(network, Relation.CONTENT_SIM)
+        edges_verified = relation_edges(network_verified, Relation.CONTENT_SIM)
+        self.assertTrue(0 < len(edges_verified) < len(edges))
+        for pair, score in edges_verified.items():
+            self.assertEqual(score, edges[pair])
+        signatures = dict(id_sig)
+        for pair, score in edges.items():
+            sig1, sig2 = [np.asarray(signatures[nid]) for nid in pair]
+            self.assertTrue(score >= np.mean(sig1 == sig2))
+
+    def test_content_sim_mh_text_containment_score(self):
+        rnd = np.random.RandomState(5)
+        sig = rnd.randint(0, 2 ** 31, size=512)
+        containing = sig.copy()
+        containing[160:] += 2 ** 31  # only values above those of sig, which it contains
+        names = ["text0", "text1"]
+        network = self.build_network_with(names)
+        networkbuilder.build_content_sim_mh_text(network, [(0, sig.tolist()), (1, containing.tolist())],
+                                                 processes=1, min_score=0.9)
+        network_updated = self.build_network_with(names)
+        content_index = networkbuilder.build_content_sim_mh_text(network_updated, [(0, sig.tolist())],
+                                                                 processes=1, min_score=0.9)
+        networkbuilder.update_content_sim_mh_text(network_updated, content_index, [(1, containing.tolist())],
+                                                  min_score=0.9)
+        for n in [network, network_updated]:
+            # the Jaccard similarity is 160 / 512, the pair is kept on its containment of 1
+            self.assertEqual({frozenset((0, 1)): 1.0}, relation_edges(n, Relation.CONTENT_SIM))
+            self.assertEqual([1], [h.nid for h in n.neighbors_id(0, Relation.CONTENT_SIM, min_score=0.9)])
+
+    def pkfk_network(self, seed=0):
+        rnd = random.Random(seed)
+        network = FieldNetwork()
+        fields = []
+        for i in range(200):
+            unique = rnd.choice([0, 10, 70, 71, 90, 100])
+            fields.append((str(i), "db", "table" + str(i // 5), "f" + str(i), 100, unique, rnd.choice("NT")))
+        network.init_meta_schema(fields)
+        for _ in range(600):
+            i, j = rnd.randrange(200), rnd.randrange(200)
+            relation = rnd.choice([Relation.CONTENT_SIM, Relation.INCLUSION_DEPENDENCY, Relation.SCHEMA_SIM])
+            network.add_relation(str(i), str(j), relation, rnd.random())
+        return network
+
+    def test_pkfk_relation_matches_per_field(self):
+        network = self.pkfk_network()
+        networkbuilder.build_pkfk_relation(network)
+        network_per_field = self.pkfk_network()
+        networkbuilder.update_pkfk_relation(network_per_field, list(network_per_field.iterate_ids()))
+
+        edges = relation_edges(network, Relation.PKFK)
+        self.assertTrue(len(edges) > 0)
+        self.assertEqual(relation_edges(network_per_field, Relation.PKFK), edges)
+
+    def test_pkfk_relation_skips_self_loops(self):
+        network = self.build_network_with(["id", "id", "name"])
+        network.add_relation("0", "0", Relation.CONTENT_SIM, 1.0)
+        network.add_relation("0", "1", Relation.CONTENT_SIM, 1.0)
+        network.add_relation("1", "2", Relation.INCLUSION_DEPENDENCY, 1.0)
+        networkbuilder.build_pkfk_relation(network)
+        # cardinality is 0.5, no candidate keys
+        self.assertEqual(dict(), relation_edges(network, Relation.PKFK))
+
+        network = FieldNetwork()
+        network.init_meta_schema([("0", "db", "table", "id", 100, 90, "T"), ("1", "db", "table2", "id", 100, 20, "T")])
+        network.add_relation("0", "0", Relation.CONTENT_SIM, 1.0)
+        network.add_relation("0", "1", Relation.CONTENT_SIM, 1.0)
+        networkbuilder.build_pkfk_relation(network)
+        self.assertEqual({frozenset((0, 1)): 0.9}, relation_edges(network, Relation.PKFK))
+
+
+if __name__ == "__main__":
+    unittest.main()
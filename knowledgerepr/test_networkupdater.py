@@ -0,0 +1,95 @@
+import unittest
+
+import numpy as np
+
+from api.apiutils import Relation
+from knowledgerepr import networkbuilder
+from knowledgerepr import networkupdater
+from knowledgerepr.fieldnetwork import FieldNetwork
+from knowledgerepr.test_networkbuilder import mh_signatures, num_signatures, relation_edges
+
+
+class TestNetworkUpdater(unittest.TestCase):
+
+    names = ["id", "name", "city", "zip", "date", "year", "state", "email", "order id", "customer id"]
+
+    def setUp(self):
+        rnd = np.random.RandomState(0)
+        mh = dict(mh_signatures(60, seed=2))
+        num = dict(num_signatures(60, seed=4))
+        # 6 tables with 10 text and 10 numerical fields each
+        self.tables = dict()
+        for t in range(6):
+            table = []
+            for i in range(20):
+                nid = t * 20 + i
+                total = 100
+                unique = rnd.choice([10, 50, 80, 100])
+                if i < 10:
+                    table.append(((nid, "db", "table" + str(t), self.names[i], total, unique, "T"),
+                                  mh[t * 10 + i]))
+                else:
+                    table.append(((nid, "db", "table" + str(t), "num " + self.names[i - 10], total, unique, "N"),
+                                  num[t * 10 + i - 10]))
+            self.tables[t] = table
+
+    def profiles(self, tables):
+        fields = [field for t in tables for field, _ in self.tables[t]]
+        mh = [(field[0], sig) for t in tables for field, sig in self.tables[t] if field[6] == "T"]
+        num = [(field[0], sig) for t in tables for field, sig in self.tables[t] if field[6] == "N"]
+        return fields, mh, num
+
+    def build_model(self, tables):
+        fields, mh, num = self.profiles(tables)
+        network = FieldNetwork()
+        network.init_meta_schema(fields)
+        schema_sim_index = networkbuilder.build_schema_sim_relation(network, rand_seed=1)
+        content_sim_index = networkbuilder.build_content_sim_mh_text(network, mh, processes=1)
+        networkbuilder.build_content_sim_relation_num_overlap_distr_indexed(network, num)
+        networkbuilder.build_pkfk_relation(network)
+        return network, schema_sim_index, content_sim_index, dict(num)
+
+    def assert_same_relations(self, network, expected):
+        for relation in [Relation.CONTENT_SIM, Relation.INCLUSION_DEPENDENCY, Relation.PKFK]:
+            edges = relation_edges(network, relation)
+            expected_edges = relation_edges(expected, relation)
+            self.assertTrue(len(expected_edges) > 0)
+            self.assertEqual(set(expected_edges.keys()), set(edges.keys()))
+            for pair, score in expected_edges.items():
+                self.assertAlmostEqual(score, edges[pair])
+        self.assertEqual(sorted(expected.iterate_ids()), sorted(network.iterate_ids()))
+        for table in ["table" + str(t) for t in range(6)]:
+            self.assertEqual(sorted(expected.get_fields_of_source(table)), sorted(network.get_fields_of_source(table)))
+
+    def test_add_tables(self):
+        network, schema_sim_index, content_sim_index, num_sig_index = self.build_model([0, 1, 2, 3])
+        fields, mh, num = self.profiles([4, 5])
+        networkupdater.update_network(network, schema_sim_index, content_sim_index, num_sig_index,
+                                      fields=fields, mh_signatures=mh, id_sig=num)
+        expected, _, _, _ = self.build_model([0, 1, 2, 3, 4, 5])
+        self.assert_same_relations(network, expected)
+
+        # new fields are connected with existing fields of the same name
+        schema_sim = relation_edges(network, Relation.SCHEMA_SIM)
+        self.assertIn(frozenset((0, 80)), schema_sim)
+
+    def test_remove_and_change_tables(self):
+        network, schema_sim_index, content_sim_index, num_sig_index = self.build_model([0, 1, 2, 3, 4, 5])
+        removed = [field[0] for field, _ in self.tables[1]]
+        # table 5 changes: its fields get the signatures of table 2
+        changed = [(field, sig) for (field, _), (_, sig) in zip(self.tables[5], self.tables[2])]
+        self.tables[5] = changed
+        fields, mh, num = self.profiles([5])
+        networkupdater.update_network(network, schema_sim_index, content_sim_index, num_sig_index,
+                                      fields=fields, mh_signatures=mh, id_sig=num, removed=removed)
+        expected, _, _, _ = self.build_model([0, 2, 3, 4, 5])
+        self.assert_same_relations(network, expected)
+
+        schema_sim = relation_edges(network, Relation.SCHEMA_SIM)
+        self.assertFalse(any(nid in removed for pair in schema_sim for nid in pair))
+        self.assertEqual(0, len(network.get_fields_of_source("table1")))
+        self.assertFalse(any(key in removed for key in content_sim_index.query(content_sim_index.signatures[0])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import itertools
+import random
+import unittest
+
+import networkx as nx
+
+from api.apiutils import Relation
+from knowledgerepr import fieldnetwork
+from knowledgerepr import pathsearch
+from knowledgerepr.fieldnetwork import FieldNetwork
+
+
+def random_graph(num_nodes=60, num_edges=90, seed=0):
+    rnd = random.Random(seed)
+    G = nx.Graph()
+    G.add_nodes_from(str(i) for i in range(num_nodes))
+    for _ in range(num_edges):
+        G.add_edge(str(rnd.randrange(num_nodes)), str(rnd.randrange(num_nodes)))
+    return G
+
+
+def path_network(G):
+    network = FieldNetwork()
+    network.init_meta_schema((nid, "db", "table" + nid, "f" + nid, 100, 100, "N") for nid in G.nodes())
+    for src, tgt in G.edges():
+        network.add_relation(src, tgt, Relation.PKFK, 1.0)
+    return network
+
+
+class TestPathSearch(unittest.TestCase):
+
+    def assert_path(self, G, path, source, target):
+        self.assertEqual(source, path[0])
+        self.assertEqual(target, path[-1])
+        self.assertEqual(len(path), len(set(path)))
+        for u, v in zip(path, path[1:]):
+            self.assertTrue(G.has_edge(u, v))
+
+    def test_shortest_path(self):
+        G = random_graph()
+        for source, target in itertools.product(G.nodes()[:20], G.nodes()[20:40]):
+            path = pathsearch.shortest_path(G.neighbors, source, target, max_hops=4)
+            try:
+                length = nx.shortest_path_length(G, source, target)
+            except nx.NetworkXNoPath:
+                length = None
+            if length is None or length > 4:
+                self.assertIsNone(path)
+            else:
+                self.assert_path(G, path, source, target)
+                self.assertEqual(length, len(path) - 1)
+        self.assertEqual(["3"], pathsearch.shortest_path(G.neighbors, "3", "3", max_hops=0))
+
+    def test_k_shortest_paths(self):
+        G = random_graph(num_nodes=30, num_edges=60)
+        for source, target in itertools.product(G.nodes()[:5], G.nodes()[5:10]):
+            paths = pathsearch.k_shortest_paths(G.neighbors, source, target, max_hops=5, k=6)
+            expected = sorted(len(p) for p in nx.all_simple_paths(G, source, target, cutoff=5))[:6]
+            self.assertEqual(expected, [len(p) for p in paths])
+            self.assertEqual(len(paths), len(set(tuple(p) for p in paths)))
+            for path in paths:
+                self.assert_path(G, path, source, target)
+
+    def test_find_path_hit(self):
+        G = nx.Graph()
+        G.add_path([str(i) for i in range(6)])
+        G.add_edge("0", "9")
+        G.add_edge("9", "5")
+        for network in [path_network(G), fieldnetwork.to_csr_network(path_network(G))]:
+            source, target = network.get_hits_from_table("table0")[0], network.get_hits_from_table("table5")[0]
+            paths = network.find_path_hit(source, target, Relation.PKFK, max_hops=2).paths()
+            self.assertEqual([[0, 9, 5]], [[h.nid for h in path] for path in paths])
+            paths = network.find_path_hit(source, target, Relation.PKFK, max_hops=5, k=2).paths()
+            self.assertEqual(sorted([[0, 9, 5], list(range(6))]),
+                             sorted([h.nid for h in path] for path in paths))
+            self.assertEqual(0, network.find_path_hit(source, target, Relation.PKFK, max_hops=1).size())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import unittest
+
+from knowledgerepr import stagerunner
+
+
+def square_edges(n):
+    return [(str(i), str(i * i), os.getpid()) for i in range(n)]
+
+
+def allocate(mb):
+    data = bytearray(mb * 1024 * 1024)
+    return len(data)
+
+
+def failing_stage():
+    raise ValueError("broken stage")
+
+
+class TestStageRunner(unittest.TestCase):
+
+    def run_stages(self, parallel):
+        runner = stagerunner.StageRunner(parallel=parallel)
+        runner.submit('a', square_edges, 10)
+        runner.submit('b', square_edges, 5)
+        return runner.result('b'), runner.result('a')
+
+    def test_parallel_matches_inline(self):
+        (b, b_stats), (a, a_stats) = self.run_stages(parallel=True)
+        (b_inline, _), (a_inline, inline_stats) = self.run_stages(parallel=False)
+        self.assertEqual([e[:2] for e in a], [e[:2] for e in a_inline])
+        self.assertEqual([e[:2] for e in b], [e[:2] for e in b_inline])
+
+        self.assertNotEqual(os.getpid(), a[0][2])
+        self.assertNotEqual(a[0][2], b[0][2])
+        self.assertEqual(os.getpid(), a_inline[0][2])
+        self.assertEqual('worker', a_stats['process'])
+        self.assertEqual('main', inline_stats['process'])
+        for stats in [a_stats, b_stats, inline_stats]:
+            self.assertTrue(stats['wall_clock'] >= 0)
+            self.assertTrue(stats['peak_rss_mb'] > 0)
+
+    def test_peak_rss_per_stage(self):
+        runner = stagerunner.StageRunner(parallel=False)
+        runner.submit('big', allocate, 200)
+        runner.submit('small', square_edges, 10)
+        _, big_stats = runner.result('big')
+        _, small_stats = runner.result('small')
+        self.assertTrue(big_stats['peak_rss_mb'] >= 200)
+        self.assertTrue(stagerunner.process_peak_rss_mb() >= big_stats['peak_rss_mb'])
+        if small_stats['peak_rss_scope'] == 'stage':
+            self.assertTrue(big_stats['rss_delta_mb'] >= 190)
+            self.assertTrue(small_stats['peak_rss_mb'] < big_stats['peak_rss_mb'] - 150)
+
+    def test_failing_stage(self):
+        runner = stagerunner.StageRunner(parallel=True)
+        runner.submit('broken', failing_stage)
+        with self.assertRaises(RuntimeError) as cm:
+            runner.result('broken')
+        self.assertIn("broken stage", str(cm.exception))
+
+    def test_submit_twice(self):
+        runner = stagerunner.StageRunner(parallel=False)
+        runner.submit('a', square_edges, 1)
+        with self.assertRaises(ValueError):
+            runner.submit('a', square_edges, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
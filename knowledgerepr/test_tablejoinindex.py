@@ -0,0 +1,100 @@
+import itertools
+import random
+import tempfile
+import unittest
+
+from api.apiutils import Relation
+from knowledgerepr import fieldnetwork
+from knowledgerepr.fieldnetwork import FieldNetwork
+from knowledgerepr import tablejoinindex
+from knowledgerepr.tablejoinindex import TableJoinIndex
+from knowledgerepr.test_csrgraph import random_network, RELATIONS
+
+
+def chain_network():
+    # t0.a - t1.a, t1.b - t2.a, t0.b - t2.b
+    network = FieldNetwork()
+    network.init_meta_schema([(str(i), "db", "t" + str(i // 2), "f" + str(i), 100, 100, "N") for i in range(6)])
+    network.add_relation("0", "2", Relation.PKFK, 1.0)
+    network.add_relation("3", "4", Relation.PKFK, 0.5)
+    network.add_relation("1", "5", Relation.PKFK, 0.75)
+    return network
+
+
+class TestTableJoinIndex(unittest.TestCase):
+
+    def assert_up_to_date(self, network, relation):
+        index = TableJoinIndex(network._get_underlying_repr_id_to_field_info())
+        index.add_edges(network.iterate_relation_edges(relation))
+        self.assertEqual(index.joins, network.table_join_index(relation).joins)
+
+    def test_index(self):
+        index = chain_network().table_join_index(Relation.PKFK)
+        self.assertEqual({"t1", "t2"}, set(index.neighbors("t0").keys()))
+        self.assertEqual({(0, 2): 1.0}, index.join_keys("t0", "t1"))
+        self.assertEqual({(4, 3): 0.5}, index.join_keys("t2", "t1"))
+        self.assertEqual(dict(), index.join_keys("t1", "t1"))
+
+    def test_changes(self):
+        network = random_network()
+        csr_network = fieldnetwork.to_csr_network(network)
+        for n in [network, csr_network]:
+            for relation in RELATIONS:
+                n.table_join_index(relation)
+            rnd = random.Random(1)
+            n.remove_field("7")
+            for _ in range(100):
+                src, tgt, relation = str(rnd.randrange(8, 150)), str(rnd.randrange(8, 150)), rnd.choice(RELATIONS)
+                if rnd.random() < 0.5:
+                    n.add_relation(src, tgt, relation, 0.125)
+                else:
+                    n.remove_relation(src, tgt, relation)
+            n.add_relations(Relation.PKFK, [("8", "20", 0.5), ("9", "30", 0.25)])
+            for relation in RELATIONS:
+                self.assert_up_to_date(n, relation)
+
+    def test_find_path_table(self):
+        network = chain_network()
+        paths = network.find_path_table("t0", "t2", Relation.PKFK, None, max_hops=1).paths()
+        self.assertEqual([[1, 5]], [[h.nid for h in path] for path in paths])
+        paths = network.find_path_table("t0", "t2", Relation.PKFK, None, max_hops=2).paths()
+        self.assertEqual(sorted([[0, 2, 3, 4], [1, 5]]), sorted([h.nid for h in path] for path in paths))
+
+        network.remove_relation("1", "5", Relation.PKFK)
+        self.assertEqual(0, network.find_path_table("t0", "t2", Relation.PKFK, None, max_hops=1).size())
+
+    def test_reachability(self):
+        network = random_network(num_fields=200, num_edges=60, seed=3)
+        reachability = network.table_reachability(Relation.PKFK, max_hops=2)
+        tables = sorted(network._get_underlying_repr_table_to_ids().keys())
+        for table, other in itertools.combinations(tables, 2):
+            for max_hops in [1, 2]:
+                paths = network.find_path_table(table, other, Relation.PKFK, None, max_hops=max_hops).paths()
+                self.assertEqual(len(paths) > 0, reachability.reachable(table, other, max_hops))
+            paths = network.find_path_table(table, other, Relation.PKFK, None, max_hops=len(tables)).paths()
+            self.assertEqual(len(paths) > 0, reachability.connected(table, other))
+        self.assertTrue(reachability.connected_all(["table0"]))
+        self.assertIs(reachability, network.table_reachability(Relation.PKFK))
+
+        network.add_relation("0", "199", Relation.PKFK, 1.0)
+        self.assertIsNot(reachability, network.table_reachability(Relation.PKFK))
+        self.assertTrue(network.table_reachability(Relation.PKFK).reachable("table0", "table39", 1))
+
+    def test_persistence(self):
+        network = chain_network()
+        path = tempfile.mkdtemp() + "/"
+        fieldnetwork.serialize_network(network, path)
+        reachability = network.table_reachability(Relation.PKFK, max_hops=2)
+        self.assertEqual(3, tablejoinindex.precompute_paths(network, reachability, Relation.PKFK, 2))
+        tablejoinindex.serialize_table_reachability(reachability, path)
+
+        loaded = fieldnetwork.deserialize_network(path).table_reachability(Relation.PKFK)
+        self.assertEqual(reachability.distances, loaded.distances)
+        paths = loaded.get_paths("t0", "t2", 2)
+        self.assertEqual(sorted([[0, 2, 3, 4], [1, 5]]), sorted([h.nid for h in path] for path in paths))
+        self.assertIsNone(loaded.get_paths("t0", "t2", 1))
+        self.assertIsNone(tablejoinindex.deserialize_table_reachability(tempfile.mkdtemp()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+from api.apiutils import DRS, OP, Operation, Relation
+from knowledgerepr import fieldnetwork
+from knowledgerepr import traversal
+from knowledgerepr.test_csrgraph import random_network
+
+
+def fringe_traverse(network, hits, relation, max_hops):
+    """
+    The traversal that expands all the fields found so far on every hop
+    """
+    o_drs = DRS([], Operation(OP.NONE))
+    fringe = list(hits)
+    while max_hops > 0:
+        max_hops = max_hops - 1
+        for h in fringe:
+            o_drs = o_drs.union(network.neighbors_id(h, relation))
+        fringe = list(o_drs)
+    return o_drs
+
+
+def edges_of(drs):
+    return sorted(drs.get_provenance().prov_graph().edges(keys=True))
+
+
+class TestTraversal(unittest.TestCase):
+
+    def test_traverse(self):
+        adjacency = {0: [(1, 0.5), (2, 1.0)], 1: [(0, 0.5), (3, 0.25)], 2: [(0, 1.0)], 3: [(1, 0.25)]}
+        neighbors = adjacency.get
+        self.assertEqual([(0, [(1, 0.5), (2, 1.0)])], traversal.traverse(neighbors, [0], 1))
+        self.assertEqual([(0, [(1, 0.5), (2, 1.0)]), (1, [(0, 0.5), (3, 0.25)]), (2, [(0, 1.0)])],
+                         traversal.traverse(neighbors, [0], 2))
+        self.assertEqual(traversal.traverse(neighbors, [0], 3), traversal.traverse(neighbors, [0], 5))
+        self.assertEqual([(0, [(1, 0.5)])], traversal.traverse(neighbors, [0], 3, max_results=1))
+        self.assertEqual([], traversal.traverse(neighbors, [0], 0))
+
+    def test_same_as_fringe_traversal(self):
+        network = random_network(num_edges=300)
+        for n in [network, fieldnetwork.to_csr_network(network)]:
+            for relation in [Relation.PKFK, Relation.CONTENT_SIM]:
+                for max_hops in [1, 2, 3]:
+                    hits = n.get_hits_from_table("table3")
+                    expected = fringe_traverse(n, hits, relation, max_hops)
+                    o_drs = n.traverse(hits, relation, max_hops)
+                    self.assertEqual(sorted(expected.data), sorted(o_drs.data))
+                    self.assertEqual(edges_of(expected), edges_of(o_drs))
+
+    def test_max_results(self):
+        network = random_network(num_edges=400)
+        hits = network.get_hits_from_table("table0")
+        everything = set(network.traverse(hits, Relation.PKFK, 10).data)
+        for max_results in [1, 5, 20]:
+            o_drs = network.traverse(hits, Relation.PKFK, 10, max_results=max_results)
+            self.assertEqual(min(max_results, len(everything)), o_drs.size())
+            self.assertTrue(set(o_drs.data) <= everything)
+            reached = set(o_drs.data) | set(hits)
+            for src, tgt, _ in edges_of(o_drs):
+                self.assertIn(src, reached)
+                self.assertIn(tgt, reached)
+
+    def test_workers(self):
+        network = random_network(num_fields=1000, num_edges=3000)
+        hits = network.get_hits_from_table("table0")
+        for n in [network, fieldnetwork.to_csr_network(network)]:
+            expected = traversal.traverse(n._traversal_neighbors(Relation.PKFK), [h.nid for h in hits], 4)
+            neighbors = n._traversal_neighbors(Relation.PKFK)
+            for expander_type in [traversal.ThreadExpander, traversal.ProcessExpander]:
+                with expander_type(neighbors, 2) as expander:
+                    self.assertEqual(expected, traversal.traverse(neighbors, [h.nid for h in hits], 4,
+                                                                  expander=expander, chunk_size=8))
+            serial = n.traverse(hits, Relation.PKFK, 4)
+            parallel = n.traverse(hits, Relation.PKFK, 4, workers=2)
+            self.assertEqual(serial.data, parallel.data)
+            self.assertEqual(edges_of(serial), edges_of(parallel))
+
+
+if __name__ == "__main__":
+    unittest.main()
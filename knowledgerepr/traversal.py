@@ -0,0 +1,121 @@
+"""
+k-hop traversal over the adjacency of one relation. Each hop expands only the fields reached for the
+first time on the previous one, and the edges followed are returned as lists, so that the caller builds
+the output and its provenance once at the end. Large frontiers can be split into chunks expanded by a
+pool of threads or processes.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool
+import itertools
+
+
+def expand(neighbors, frontier):
+    """
+    :param neighbors: function of an id to an iterable of (id of neighbor, score)
+    :param frontier: list of ids
+    :return: list with the list of (id of neighbor, score) of each id of frontier
+    """
+    return [list(neighbors(u)) for u in frontier]
+
+
+def traverse(neighbors, sources, max_hops, max_results=None, expander=None, chunk_size=1024):
+    """
+    Breadth-first traversal from sources. An id is expanded at most once, on the hop after the one
+    where it is first reached
+    :param neighbors: function of an id to an iterable of (id of neighbor, score)
+    :param sources: ids where the traversal starts
+    :param max_hops: maximum number of hops from sources
+    :param max_results: if given, the traversal stops once this many ids are reached
+    :param expander: if given, a ThreadExpander or ProcessExpander that expands frontiers of more
+    than chunk_size ids in chunks
+    :param chunk_size: number of ids expanded by each task of the expander
+    :return: list of (id, list of (id of neighbor, score)) with each expanded id and the edges
+    followed from it, in the order they were expanded. The reached ids are the neighbors in these
+    edges. Sources are only reached when a hop leads back to them
+    """
+    frontier = list(dict.fromkeys(sources))
+    expanded = set(frontier)
+    reached = set()
+    expansions = []
+    for _ in range(max_hops):
+        if len(frontier) == 0 or (max_results is not None and len(reached) >= max_results):
+            break
+        if expander is not None and len(frontier) > chunk_size:
+            chunks = [frontier[i:i + chunk_size] for i in range(0, len(frontier), chunk_size)]
+            frontier_neighbors = itertools.chain.from_iterable(expander.map(chunks))
+        else:
+            frontier_neighbors = expand(neighbors, frontier)
+        next_frontier = []
+        for u, u_neighbors in zip(frontier, frontier_neighbors):
+            followed = []
+            for v, score in u_neighbors:
+                if v not in reached:
+                    if max_results is not None and len(reached) >= max_results:
+                        continue
+                    reached.add(v)
+                    if v not in expanded:
+                        expanded.add(v)
+                        next_frontier.append(v)
+                followed.append((v, score))
+            expansions.append((u, followed))
+        frontier = next_frontier
+    return expansions
+
+
+class ThreadExpander:
+    """
+    Expands chunks of a frontier in a pool of threads, which share the adjacency
+    """
+
+    def __init__(self, neighbors, workers=None):
+        self.neighbors = neighbors
+        self.executor = ThreadPoolExecutor(workers)
+
+    def map(self, chunks):
+        return list(self.executor.map(partial(expand, self.neighbors), chunks))
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+_worker_neighbors = None
+
+
+def _init_expand_worker(neighbors):
+    global _worker_neighbors
+    _worker_neighbors = neighbors
+
+
+def _expand_in_worker(frontier):
+    return expand(_worker_neighbors, frontier)
+
+
+class ProcessExpander:
+    """
+    Expands chunks of a frontier in a pool of processes. The workers get neighbors when they are
+    forked, so the adjacency is shared with them instead of pickled, which needs the fork start
+    method. Only the chunks and their neighbors are sent back and forth
+    """
+
+    def __init__(self, neighbors, workers=None):
+        self.pool = Pool(workers, initializer=_init_expand_worker, initargs=(neighbors,))
+
+    def map(self, chunks):
+        return self.pool.map(_expand_in_worker, chunks)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,10 +1,12 @@
 from IPython.terminal.embed import InteractiveShellEmbed
 from IPython.display import Markdown, display
+import os
 import sys
 import time
 
 from api.reporting import Report
 from knowledgerepr import fieldnetwork
+from knowledgerepr import modelformat
 from modelstore.elasticstore import StoreHandler
 from ddapi import API as oldAPI
 from algebra import API
@@ -18,11 +20,11 @@ def print_md(string):
 
 
 #@DeprecationWarning
-def __init_system(path_to_serialized_model, create_reporting=True):
+def __init_system(path_to_serialized_model, create_reporting=True, lazy_provenance=False):
     print_md('Loading: *' + str(path_to_serialized_model) + "*")
     sl = time.time()
     network = fieldnetwork.deserialize_network(path_to_serialized_model)
-    api = oldAPI(network)
+    api = oldAPI(network, lazy_provenance=lazy_provenance)
     if create_reporting:
         reporting = Report(network)
     api.init_store()
@@ -32,12 +34,27 @@ def __init_system(path_to_serialized_model, create_reporting=True):
     return api, reporting
 
 
-def init_system(path_to_serialized_model, create_reporting=False):
+def init_system(path_to_serialized_model, create_reporting=False, lazy=True, warm=False, lazy_provenance=False):
+    """
+    :param path_to_serialized_model: directory of the model
+    :param create_reporting: whether to compute the statistics of the model, which reads all of it
+    :param lazy: if the model has a model file (see modelformat), open it instead of deserializing
+    the whole network. Tables and fields are available right away, relations are loaded on first use
+    :param warm: with lazy, load the rest of the model in a background thread
+    :param lazy_provenance: whether the api builds the provenance graph of its results only when it
+    is read, see Algebra
+    :return: (api, reporting)
+    """
     print_md('Loading: *' + str(path_to_serialized_model) + "*")
     sl = time.time()
-    network = fieldnetwork.deserialize_network(path_to_serialized_model)
+    model_file = os.path.join(path_to_serialized_model, modelformat.MODEL_FILE)
+    if lazy and os.path.exists(model_file):
+        network = modelformat.open_model(model_file, warm=warm)
+        fieldnetwork.load_table_reachability(network, path_to_serialized_model)
+    else:
+        network = fieldnetwork.deserialize_network(path_to_serialized_model)
     store_client = StoreHandler()
-    api = API(network=network, store_client=store_client)
+    api = API(network=network, store_client=store_client, lazy_provenance=lazy_provenance)
     if create_reporting:
         reporting = Report(network)
     else:
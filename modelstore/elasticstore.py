@@ -6,6 +6,7 @@ from enum import Enum
 from collections import defaultdict
 
 from api.apiutils import Hit
+from api.apiutils import nid_key
 from api.annotation import MDHit, MDComment
 import config as c
 
@@ -65,8 +66,19 @@ class StoreHandler:
         Reads all fields, described as (id, source_name, field_name) from the store.
         :return: a list of all fields with the form (id, source_name, field_name)
         """
+        for batch in self.get_all_fields_batches():
+            for id_source_and_file_name in batch:
+                yield id_source_and_file_name
+
+    def get_all_fields_batches(self, batch_size=5000):
+        """
+        Reads all fields from the store, one scroll page at a time
+        :param batch_size: number of fields per page
+        :return: generator of lists of fields with the form
+        (id, db_name, source_name, field_name, total_values, unique_values, data_type), with int ids
+        """
         body = {"query": {"match_all": {}}}
-        res = client.search(index='profile', body=body, scroll="10m",
+        res = client.search(index='profile', body=body, scroll="10m", size=batch_size,
                             filter_path=['_scroll_id',
                                          'hits.hits._id',
                                          'hits.total',
@@ -81,12 +93,12 @@ class StoreHandler:
         remaining = res['hits']['total']
         while remaining > 0:
             hits = res['hits']['hits']
-            for h in hits:
-                id_source_and_file_name = (h['_id'], h['_source']['dbName'], h['_source']['sourceName'],
-                                           h['_source']['columnName'], h['_source']['totalValues'],
-                                           h['_source']['uniqueValues'], h['_source']['dataType'])
-                yield id_source_and_file_name
-                remaining -= 1
+            if len(hits) == 0:
+                break
+            yield [(nid_key(h['_id']), h['_source']['dbName'], h['_source']['sourceName'],
+                    h['_source']['columnName'], h['_source']['totalValues'],
+                    h['_source']['uniqueValues'], h['_source']['dataType']) for h in hits]
+            remaining -= len(hits)
             res = client.scroll(scroll="5m", scroll_id=scroll_id,
                                 filter_path=['_scroll_id',
                                              'hits.hits._id',
@@ -417,7 +429,7 @@ class StoreHandler:
         while remaining > 0:
             hits = res['hits']['hits']
             for h in hits:
-                data = (h['_id'], h['_source']['minhash'])
+                data = (nid_key(h['_id']), h['_source']['minhash'])
                 id_sig.append(data)
                 remaining -= 1
             res = client.scroll(scroll="5m", scroll_id=scroll_id,
@@ -452,7 +464,7 @@ class StoreHandler:
         while remaining > 0:
             hits = res['hits']['hits']
             for h in hits:
-                data = (h['_id'], (h['_source']['median'], h['_source']['iqr'],
+                data = (nid_key(h['_id']), (h['_source']['median'], h['_source']['iqr'],
                                    h['_source']['minValue'], h['_source']['maxValue']))
                 id_sig.append(data)
                 remaining -= 1
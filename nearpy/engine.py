@@ -101,6 +101,15 @@ class Engine(object):
                 self.storage.store_vector(lshash.hash_name, bucket_key,
                                           nv, data)
 
+    def delete_vector(self, data, v):
+        """
+        Deletes the vector stored with the given data from the buckets that
+        vector v hashes to.
+        """
+        for lshash in self.lshashes:
+            bucket_keys = lshash.hash_vector(v)
+            self.storage.delete_vector(lshash.hash_name, bucket_keys, data)
+
     def candidate_count(self, v):
         """
         Returns candidate count for nearest neighbour search for specified vector.
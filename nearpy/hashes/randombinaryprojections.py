@@ -36,7 +36,11 @@ class RandomBinaryProjections(LSHash):
     for storage.
     """
 
-    def __init__(self, hash_name, projection_count, rand_seed=None):
+    # Instances pickled before key_type existed keep using string keys
+    key_type = 'str'
+
+    def __init__(self, hash_name, projection_count, rand_seed=None,
+                 key_type='str'):
         """
         Creates projection_count random vectors, that are used for projections
         thus working as normals of random hyperplanes. Each random vector /
@@ -44,6 +48,10 @@ class RandomBinaryProjections(LSHash):
 
         So if you for example decide to use projection_count=10, the bucket
         keys will have 10 digits and will look like '1010110011'.
+
+        key_type selects the type of the bucket keys returned by hash_vector:
+        'str' (the digits above), 'int' or 'bytes' (the packed bits, with the
+        first projection as the most significant bit).
         """
         super(RandomBinaryProjections, self).__init__(hash_name)
         self.projection_count = projection_count
@@ -51,6 +59,7 @@ class RandomBinaryProjections(LSHash):
         self.normals = None
         self.rand = numpy.random.RandomState(rand_seed)
         self.normals_csr = None
+        self.key_type = key_type
 
     def reset(self, dim):
         """ Resets / Initializes the hash for the specified dimension. """
@@ -75,8 +84,45 @@ class RandomBinaryProjections(LSHash):
         else:
             # Project vector onto all hyperplane normals
             projection = numpy.dot(self.normals, v)
-        # Return binary key
-        return [''.join(['1' if x > 0.0 else '0' for x in projection])]
+        if self.key_type == 'str':
+            # Return binary key
+            return [''.join(['1' if x > 0.0 else '0' for x in projection])]
+        if scipy.sparse.issparse(projection):
+            projection = projection.toarray()
+        packed = pack_signs(numpy.reshape(projection, (1, -1)))
+        return self.bucket_keys(packed)
+
+    def hash_vectors(self, vectors):
+        """
+        Hashes all the rows of vectors, a (num_vectors, dim) dense or sparse
+        matrix, with a single matrix multiply. Returns the signs of the
+        projections packed into a (num_vectors, ceil(projection_count / 64))
+        uint64 array, first projection as the most significant bit.
+        """
+        if scipy.sparse.issparse(vectors):
+            # sparse.dot(dense) returns a dense array
+            projections = vectors.dot(self.normals.T)
+        else:
+            projections = numpy.dot(vectors, self.normals.T)
+        return pack_signs(numpy.asarray(projections))
+
+    def bucket_keys(self, packed, key_type=None):
+        """
+        Converts the rows of packed (as returned by hash_vectors) into bucket
+        keys of key_type ('str', 'int' or 'bytes'), by default self.key_type.
+        """
+        if key_type is None:
+            key_type = self.key_type
+        keys = []
+        for row in packed.astype('>u8'):
+            key = row.tobytes()
+            if key_type == 'int':
+                key = int.from_bytes(key, 'big')
+            elif key_type == 'str':
+                key = format(int.from_bytes(key, 'big'),
+                             '0%db' % self.projection_count)
+            keys.append(key)
+        return keys
 
     def get_config(self):
         """
@@ -87,7 +133,8 @@ class RandomBinaryProjections(LSHash):
             'hash_name': self.hash_name,
             'dim': self.dim,
             'projection_count': self.projection_count,
-            'normals': self.normals
+            'normals': self.normals,
+            'key_type': self.key_type
         }
 
     def apply_config(self, config):
@@ -98,3 +145,20 @@ class RandomBinaryProjections(LSHash):
         self.dim = config['dim']
         self.projection_count = config['projection_count']
         self.normals = config['normals']
+        self.key_type = config.get('key_type', 'str')
+
+
+def pack_signs(projections):
+    """
+    Packs the signs (> 0.0) of each row of projections, a
+    (num_vectors, projection_count) array, into a
+    (num_vectors, ceil(projection_count / 64)) uint64 array. The first
+    projection is the most significant bit of the first word.
+    """
+    num_vectors, projection_count = projections.shape
+    num_words = (projection_count + 63) // 64
+    # Pad on the left so the packed bits read as one big-endian integer
+    bits = numpy.zeros((num_vectors, num_words * 64), dtype=bool)
+    bits[:, num_words * 64 - projection_count:] = projections > 0.0
+    packed = numpy.packbits(bits, axis=1)
+    return packed.view('>u8').astype(numpy.uint64)
@@ -27,6 +27,7 @@ class Storage(object):
     def store_vector(self, hash_name, bucket_key, v, data):
         """
         Stores vector and JSON-serializable data in bucket with specified key.
+        Bucket keys can be strings, integers or bytes.
         """
         raise NotImplementedError
 
@@ -36,6 +37,13 @@ class Storage(object):
         """
         raise NotImplementedError
 
+    def delete_vector(self, hash_name, bucket_keys, data):
+        """
+        Deletes the vectors stored with the given data from the buckets with
+        the specified keys.
+        """
+        raise NotImplementedError
+
     def clean_buckets(self, hash_name):
         """
         Removes all buckets and their content.
@@ -58,6 +58,15 @@ class MemoryStorage(Storage):
                 return self.buckets[hash_name][bucket_key]
         return []
 
+    def delete_vector(self, hash_name, bucket_keys, data):
+        """
+        Deletes the vectors stored with the given data from the buckets with
+        the specified keys.
+        """
+        for bucket_key in bucket_keys:
+            bucket = self.get_bucket(hash_name, bucket_key)
+            bucket[:] = [(v, v_data) for v, v_data in bucket if v_data != data]
+
     def clean_buckets(self, hash_name):
         """
         Removes all buckets and their content for specified hash.
@@ -50,7 +50,7 @@ class RedisStorage(Storage):
         """
         Stores vector and JSON-serializable data in bucket with specified key.
         """
-        redis_key = 'nearpy_%s_%s' % (hash_name, bucket_key)
+        redis_key = self._redis_key(hash_name, bucket_key)
 
         val_dict = {}
 
@@ -90,7 +90,7 @@ class RedisStorage(Storage):
         """
         Returns bucket content as list of tuples (vector, data).
         """
-        redis_key = 'nearpy_%s_%s' % (hash_name, bucket_key)
+        redis_key = self._redis_key(hash_name, bucket_key)
         items = self.redis_object.lrange(redis_key, 0, -1)
         results = []
         for item_str in items:
@@ -131,6 +131,29 @@ class RedisStorage(Storage):
 
         return results
 
+    def delete_vector(self, hash_name, bucket_keys, data):
+        """
+        Deletes the vectors stored with the given data from the buckets with
+        the specified keys.
+        """
+        for bucket_key in bucket_keys:
+            redis_key = self._redis_key(hash_name, bucket_key)
+            items = self.redis_object.lrange(redis_key, 0, -1)
+            keep = [item for item in items if pickle.loads(item).get('data') != data]
+            if len(keep) != len(items):
+                self.redis_object.delete(redis_key)
+                if len(keep) > 0:
+                    self.redis_object.rpush(redis_key, *keep)
+
+    def _redis_key(self, hash_name, bucket_key):
+        """
+        Returns the redis key of the bucket. Bucket keys can be strings,
+        integers or bytes (stored as hex).
+        """
+        if isinstance(bucket_key, bytes):
+            bucket_key = bucket_key.hex()
+        return 'nearpy_%s_%s' % (hash_name, bucket_key)
+
     def clean_buckets(self, hash_name):
         """
         Removes all buckets and their content for specified hash.
@@ -60,6 +60,13 @@ class TestEngine(unittest.TestCase):
             self.assertEqual(y_data, x_data)
             self.assertAlmostEqual(y_distance, 0.0, delta=delta)
 
+    def test_delete_vector(self):
+        x = numpy.random.randn(1000)
+        self.engine.store_vector(x, 'x')
+        self.engine.store_vector(x, 'y')
+        self.engine.delete_vector('x', x)
+        self.assertEqual([y_data for _, y_data, _ in self.engine.neighbours(x)], ['y'])
+
     def test_retrieval_sparse(self):
         for k in range(100):
             self.engine.clean_all_buckets()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark comparing per-vector hashing (hash_vector, string keys) with
+batch hashing (hash_vectors, packed uint64 keys) in RandomBinaryProjections.
+
+Run with: python -m nearpy.tests.hashes_benchmark
+"""
+
+import time
+
+import numpy
+import scipy.sparse
+
+from nearpy.hashes import RandomBinaryProjections
+
+
+def time_per_vector(rbp, X):
+    st = time.time()
+    if scipy.sparse.issparse(X):
+        for i in range(X.shape[0]):
+            rbp.hash_vector(X[i].T)
+    else:
+        for i in range(X.shape[0]):
+            rbp.hash_vector(X[i])
+    return time.time() - st
+
+
+def time_batch(rbp, X):
+    st = time.time()
+    rbp.hash_vectors(X)
+    return time.time() - st
+
+
+def run_benchmark(num_vectors=2000, dim=1000, projection_counts=(30, 1000, 10000), sparse=False):
+    results = []
+    for projection_count in projection_counts:
+        rbp = RandomBinaryProjections('bench', projection_count, rand_seed=42)
+        rbp.reset(dim)
+        if sparse:
+            X = scipy.sparse.rand(num_vectors, dim, density=0.01, format='csr', random_state=42)
+        else:
+            X = numpy.random.RandomState(42).randn(num_vectors, dim)
+        per_vector = time_per_vector(rbp, X)
+        batch = time_batch(rbp, X)
+        results.append((projection_count, per_vector, batch))
+    return results
+
+
+def print_results(results):
+    print("projections\tper-vector (s)\tbatch (s)\tspeedup")
+    for projection_count, per_vector, batch in results:
+        print("{0}\t\t{1:.4f}\t\t{2:.4f}\t\t{3:.1f}x".format(projection_count, per_vector, batch,
+                                                           per_vector / batch))
+
+
+if __name__ == '__main__':
+    print("Dense input")
+    print_results(run_benchmark())
+    # Per-vector hashing of sparse vectors is much slower, keep this one small
+    print("Sparse input")
+    print_results(run_benchmark(num_vectors=200, projection_counts=(30, 1000), sparse=True))
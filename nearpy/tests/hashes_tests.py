@@ -63,6 +63,42 @@ class TestRandomBinaryProjections(unittest.TestCase):
         for k in range(100):
             self.assertEqual(first_hash, self.rbp.hash_vector(x)[0])
 
+    def test_hash_vectors_matches_hash_vector(self):
+        X = numpy.random.randn(50, 100)
+        packed = self.rbp.hash_vectors(X)
+        self.assertEqual(packed.shape, (50, 1))
+        self.assertEqual(packed.dtype, numpy.uint64)
+        keys = self.rbp.bucket_keys(packed)
+        for k in range(50):
+            self.assertEqual(keys[k], self.rbp.hash_vector(X[k])[0])
+
+    def test_hash_vectors_sparse(self):
+        X = scipy.sparse.rand(50, 100, density=0.1, format='csr')
+        keys = self.rbp.bucket_keys(self.rbp.hash_vectors(X))
+        for k in range(50):
+            self.assertEqual(keys[k], self.rbp.hash_vector(X[k].T)[0])
+
+    def test_hash_vectors_many_words(self):
+        rbp = RandomBinaryProjections('testHash', 130)
+        rbp.reset(100)
+        X = numpy.random.randn(20, 100)
+        packed = rbp.hash_vectors(X)
+        self.assertEqual(packed.shape, (20, 3))
+        keys = rbp.bucket_keys(packed)
+        for k in range(20):
+            self.assertEqual(keys[k], rbp.hash_vector(X[k])[0])
+
+    def test_hash_vector_key_types(self):
+        x = numpy.random.randn(100)
+        str_key = self.rbp.hash_vector(x)[0]
+        self.rbp.key_type = 'int'
+        int_key = self.rbp.hash_vector(x)[0]
+        self.assertEqual(int_key, int(str_key, 2))
+        self.rbp.key_type = 'bytes'
+        bytes_key = self.rbp.hash_vector(x)[0]
+        self.assertEqual(type(bytes_key), bytes)
+        self.assertEqual(int.from_bytes(bytes_key, 'big'), int_key)
+
 
 class TestRandomDiscretizedProjections(unittest.TestCase):
 
@@ -100,5 +100,32 @@ class TestStorage(unittest.TestCase):
         self.assertEqual(self.redis_storage.get_bucket('testHash',
                                                        bucket_key), [])
 
+    def test_storage_int_and_bytes_keys(self):
+        self.redis_storage.clean_all_buckets()
+        x = numpy.random.randn(100, 1)
+        for storage in [self.memory, self.redis_storage]:
+            for bucket_key in [23749283743928748, b'\x00\x01\xff']:
+                storage.store_vector('testHash', bucket_key, x, 'data')
+                X = storage.get_bucket('testHash', bucket_key)
+                self.assertEqual(len(X), 1)
+                self.assertEqual(X[0][1], 'data')
+            storage.clean_all_buckets()
+            self.assertEqual(storage.get_bucket('testHash', b'\x00\x01\xff'), [])
+
+    def test_delete_vector(self):
+        self.redis_storage.clean_all_buckets()
+        x = numpy.random.randn(100, 1)
+        for storage in [self.memory, self.redis_storage]:
+            for data in ['a', 'b', 'a', 'c']:
+                storage.store_vector('testHash', 'k1', x, data)
+            storage.store_vector('testHash', 'k2', x, 'a')
+            storage.delete_vector('testHash', ['k1'], 'a')
+            self.assertEqual([data for _, data in storage.get_bucket('testHash', 'k1')], ['b', 'c'])
+            self.assertEqual(len(storage.get_bucket('testHash', 'k2')), 1)
+            storage.delete_vector('testHash', ['k1', 'k2', 'k3'], 'b')
+            self.assertEqual([data for _, data in storage.get_bucket('testHash', 'k1')], ['c'])
+            storage.clean_all_buckets()
+
+
 if __name__ == '__main__':
     unittest.main()
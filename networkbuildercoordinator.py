@@ -1,101 +1,271 @@
 from modelstore.elasticstore import StoreHandler
 from knowledgerepr import fieldnetwork
 from knowledgerepr import networkbuilder
+from knowledgerepr import networkupdater
+from knowledgerepr import checkpoints
+from knowledgerepr import modelformat
+from knowledgerepr import stagerunner
+from knowledgerepr import tablejoinindex
 from knowledgerepr.fieldnetwork import FieldNetwork
+from api.apiutils import Relation
 from inputoutput import inputoutput as io
 
-import sys
+import argparse
+import json
 import time
 
 
-def main(output_path=None):
+def skeleton_network(skeleton):
+    id_info, table_ids = skeleton
+    return FieldNetwork(id_names=id_info, source_ids=table_ids)
+
+
+def build_schema_sim_stage(skeleton, schema_sim_batch):
+    network = skeleton_network(skeleton)
+    index = networkbuilder.build_schema_sim_relation(network, batch=schema_sim_batch)
+    return checkpoints.network_edges(network), index
+
+
+def build_content_sim_text_stage(skeleton, mh_signatures, content_sim_min_score):
+    network = skeleton_network(skeleton)
+    index = networkbuilder.build_content_sim_mh_text(network, mh_signatures, min_score=content_sim_min_score)
+    return checkpoints.network_edges(network), index
+
+
+def build_content_sim_num_stage(skeleton, id_sig):
+    network = skeleton_network(skeleton)
+    #networkbuilder.build_content_sim_relation_num(network, id_sig)
+    #networkbuilder.build_content_sim_relation_num_overlap_distr(network, id_sig)
+    networkbuilder.build_content_sim_relation_num_overlap_distr_indexed(network, id_sig)
+    return checkpoints.network_edges(network), None
+
+
+def main(output_path=None, schema_sim_batch=True, content_sim_min_score=0.7, resume=False, stages=None,
+         parallel=True, table_max_hops=2, precompute_table_paths=False):
+    """
+    Builds the model from the profiles in the store. Schema-sim, content-sim (text) and
+    content-sim (num) are independent, so each of them runs in its own worker process as soon
+    as its input is read from the store; PKFK runs once they are merged into the network.
+    Every stage writes a checkpoint with its output to output_path/checkpoints, and the time
+    and peak memory of every stage are written to output_path/build_summary.json. The peak memory of
+    a stage is measured from its start (see stagerunner.measure), the one of the total is the peak of
+    the main process
+    :param output_path: where to store the model
+    :param schema_sim_batch: whether to build schema-sim in batch, see build_schema_sim_relation
+    :param content_sim_min_score: min score of minhash content-sim pairs, see build_content_sim_mh_text
+    :param resume: reuse the checkpoints of stages whose inputs did not change
+    :param stages: if given, only these stages are rebuilt. The rest are loaded from their
+    checkpoints when they are valid
+    :param parallel: run the independent stages in worker processes
+    :param table_max_hops: max joins between tables of the table reachability index, see write_table_reachability
+    :param precompute_table_paths: whether to store the join paths between tables in that index
+    :return:
+    """
     start_all = time.time()
     network = FieldNetwork()
     store = StoreHandler()
+    runner = stagerunner.StageRunner(parallel=parallel)
+    summary = []
 
-    # Get all fields from store
-    fields_gen = store.get_all_fields()
+    path = "test/datagov/"
+    if output_path is not None:
+        path = output_path
+
+    if stages is not None:
+        rebuild = set(stages)
+    elif resume:
+        rebuild = set()
+    else:
+        rebuild = set(checkpoints.STAGES)
+
+    def report(stage, source, stats):
+        stats = dict(stage=stage, source=source, **stats)
+        line = "Stage {stage} ({source}): {wall_clock:.2f}s, peak rss {peak_rss_mb:.1f}MB"
+        if 'rss_delta_mb' in stats:
+            line += " (+{rss_delta_mb:.1f}MB)"
+        if stats['peak_rss_scope'] == 'process':
+            line += " (peak of the process so far)"
+        print(line.format(**stats))
+        summary.append(stats)
+
+    def load_stage(stage, key):
+        """
+        :return: the valid checkpoint of the stage, or None if the stage has to be built
+        """
+        if stage in rebuild:
+            return None
+        checkpoint, stats = stagerunner.measure(checkpoints.load_checkpoint, (path, stage, key))
+        if checkpoint is not None:
+            stats['process'] = 'main'
+            report(stage, 'checkpoint', stats)
+        return checkpoint
+
+    def start_stage(stage, key, build, *args):
+        """
+        Loads the stage from its checkpoint or submits it to the runner
+        :return: the checkpoint or None if the stage is running
+        """
+        checkpoint = load_stage(stage, key)
+        if checkpoint is None:
+            runner.submit(stage, build, *args)
+        return checkpoint
+
+    def finish_stage(stage, key, checkpoint):
+        """
+        Waits for the stage if it is running and adds its edges to the network
+        :return: the payload of the stage
+        """
+        if checkpoint is not None:
+            edges, payload = checkpoint['edges'], checkpoint['payload']
+        else:
+            (edges, payload), stats = runner.result(stage)
+            checkpoints.save_checkpoint(path, stage, key, edges, payload)
+            report(stage, 'built', stats)
+        checkpoints.add_edges(network, edges)
+        return payload
 
     # Network skeleton and hierarchical relations (table - field), etc
-    start_schema = time.time()
-    network.init_meta_schema(fields_gen)
-    end_schema = time.time()
-    print("Total skeleton: {0}".format(str(end_schema - start_schema)))
-    print("!!1 " + str(end_schema - start_schema))
+    # The store is the input of this stage, so it is always built. Fields are read in batches
+    # and kept in columnar form, which is also what the other stages get
+    def build_skeleton():
+        network.init_meta_schema_batches(store.get_all_fields_batches())
+        return network._get_underlying_repr_id_to_field_info(), network._get_underlying_repr_table_to_ids()
+
+    skeleton, stats = stagerunner.measure(build_skeleton, ())
+    skeleton_key = checkpoints.digest(skeleton)
+    checkpoints.save_checkpoint(path, 'skeleton', skeleton_key, [])
+    stats['process'] = 'main'
+    report('skeleton', 'built', stats)
 
     # Schema_sim relation
-    start_schema_sim = time.time()
-    schema_sim_index = networkbuilder.build_schema_sim_relation(network)
-    end_schema_sim = time.time()
-    print("Total schema-sim: {0}".format(str(end_schema_sim - start_schema_sim)))
-    print("!!2 " + str(end_schema_sim - start_schema_sim))
+    schema_sim_key = checkpoints.digest([], skeleton_key, schema_sim_batch)
+    schema_sim_checkpoint = start_stage('schema_sim', schema_sim_key, build_schema_sim_stage,
+                                        skeleton, schema_sim_batch)
 
     # Entity_sim relation
-    start_entity_sim = time.time()
     #fields, entities = store.get_all_fields_entities()
     #networkbuilder.build_entity_sim_relation(network, fields, entities)
-    end_entity_sim = time.time()
-    print("Total entity-sim: {0}".format(str(end_entity_sim - start_entity_sim)))
 
-    """
     # Content_sim text relation (random-projection based)
-    start_text_sig_sim = time.time()
-    st = time.time()
-    text_signatures = store.get_all_fields_text_signatures(network)
-    et = time.time()
-    print("Time to extract signatures from store: {0}".format(str(et - st)))
-    print("!!3 " + str(et - st))
-
-    networkbuilder.build_content_sim_relation_text_lsa(network, text_signatures)
-    end_text_sig_sim = time.time()
-    print("Total text-sig-sim: {0}".format(str(end_text_sig_sim - start_text_sig_sim)))
-    print("!!4 " + str(end_text_sig_sim - start_text_sig_sim))
-    """
+    #text_signatures = store.get_all_fields_text_signatures(network)
+    #networkbuilder.build_content_sim_relation_text_lsa(network, text_signatures)
 
     # Content_sim text relation (minhash-based)
-    start_text_sig_sim = time.time()
-    st = time.time()
     mh_signatures = store.get_all_mh_text_signatures()
-    et = time.time()
-    print("Time to extract minhash signatures from store: {0}".format(str(et - st)))
-    print("!!3 " + str(et - st))
-
-    content_sim_index = networkbuilder.build_content_sim_mh_text(network, mh_signatures)
-    end_text_sig_sim = time.time()
-    print("Total text-sig-sim (minhash): {0}".format(str(end_text_sig_sim - start_text_sig_sim)))
-    print("!!4 " + str(end_text_sig_sim - start_text_sig_sim))
+    content_sim_text_key = checkpoints.digest(mh_signatures, content_sim_min_score)
+    content_sim_text_checkpoint = start_stage('content_sim_text', content_sim_text_key,
+                                              build_content_sim_text_stage,
+                                              skeleton, mh_signatures, content_sim_min_score)
 
     # Content_sim num relation
-    start_num_sig_sim = time.time()
     id_sig = store.get_all_fields_num_signatures()
-    #networkbuilder.build_content_sim_relation_num(network, id_sig)
-    networkbuilder.build_content_sim_relation_num_overlap_distr(network, id_sig)
-    #networkbuilder.build_content_sim_relation_num_overlap_distr_indexed(network, id_sig)
-    end_num_sig_sim = time.time()
-    print("Total num-sig-sim: {0}".format(str(end_num_sig_sim - start_num_sig_sim)))
-    print("!!5 " + str(end_num_sig_sim - start_num_sig_sim))
-
-    # Primary Key / Foreign key relation
-    start_pkfk = time.time()
-    networkbuilder.build_pkfk_relation(network)
-    end_pkfk = time.time()
-    print("Total PKFK: {0}".format(str(end_pkfk - start_pkfk)))
-    print("!!6 " + str(end_pkfk - start_pkfk))
+    content_sim_num_key = checkpoints.digest(id_sig)
+    content_sim_num_checkpoint = start_stage('content_sim_num', content_sim_num_key, build_content_sim_num_stage,
+                                             skeleton, id_sig)
+
+    # Merge in a fixed order, so the network does not depend on which stage finishes first
+    schema_sim_index = finish_stage('schema_sim', schema_sim_key, schema_sim_checkpoint)
+    content_sim_index = finish_stage('content_sim_text', content_sim_text_key, content_sim_text_checkpoint)
+    finish_stage('content_sim_num', content_sim_num_key, content_sim_num_checkpoint)
+
+    # Primary Key / Foreign key relation, derived from the content-sim relations
+    def build_pkfk():
+        networkbuilder.build_pkfk_relation(network)
+        return checkpoints.network_edges(network, relations=[Relation.PKFK]), None
+
+    pkfk_key = checkpoints.digest([], skeleton_key, content_sim_text_key, content_sim_num_key)
+    pkfk_checkpoint = load_stage('pkfk', pkfk_key)
+    if pkfk_checkpoint is not None:
+        checkpoints.add_edges(network, pkfk_checkpoint['edges'])
+    else:
+        (edges, _), stats = stagerunner.measure(build_pkfk, ())
+        checkpoints.save_checkpoint(path, 'pkfk', pkfk_key, edges)
+        stats['process'] = 'main'
+        report('pkfk', 'built', stats)
 
-    end_all = time.time()
-    print("Total time: {0}".format(str(end_all - start_all)))
-    print("!!7 " + str(end_all - start_all))
+    report('total', 'built', {'wall_clock': time.time() - start_all,
+                              'peak_rss_mb': stagerunner.process_peak_rss_mb(), 'peak_rss_scope': 'process',
+                              'process': 'main'})
 
-    path = "test/datagov/"
-    if output_path is not None:
-        path = output_path
     fieldnetwork.serialize_network(network, path)
+    modelformat.write_model(network, path + "/" + modelformat.MODEL_FILE)
+    write_table_reachability(network, path, table_max_hops, precompute_table_paths)
 
     # Serialize indexes
     path_schsim = path + "/schema_sim_index.pkl"
     io.serialize_object(schema_sim_index, path_schsim)
     path_cntsim = path + "/content_sim_index.pkl"
     io.serialize_object(content_sim_index, path_cntsim)
+    path_numsig = path + "/num_sig_index.pkl"
+    io.serialize_object(dict(id_sig), path_numsig)
+
+    with open(path + "/build_summary.json", 'w') as f:
+        json.dump(summary, f, indent=2)
+    print("SUMMARY " + json.dumps(summary))
+
+    print("DONE!")
+
+
+def write_table_reachability(network, path, max_hops, precompute_paths):
+    """
+    Stores with the model the connected components of the PKFK table graph and the distances between
+    tables up to max_hops, so that DoD rejects tables that do not join without searching paths
+    :param network: the model
+    :param path: where the model is stored
+    :param max_hops: max joins between tables whose distance is stored
+    :param precompute_paths: whether to also store the join paths of every pair of tables at most
+    max_hops joins away
+    :return:
+    """
+    st = time.time()
+    reachability = network.table_reachability(Relation.PKFK, max_hops=max_hops)
+    if precompute_paths:
+        pairs = tablejoinindex.precompute_paths(network, reachability, Relation.PKFK, max_hops)
+        print("Join paths of {0} pairs of tables".format(str(pairs)))
+    tablejoinindex.serialize_table_reachability(reachability, path)
+    print("Table reachability: {0}".format(str(time.time() - st)))
+
+
+def update(output_path, content_sim_min_score=0.7, table_max_hops=2, precompute_table_paths=False):
+    """
+    Updates the model in output_path with the fields that were added to, changed in or removed from
+    the store since the model was built, without rebuilding it. See networkupdater.update_network
+    :param output_path: where the model is stored, it is overwritten with the updated model
+    :param content_sim_min_score: min score of minhash content-sim pairs, see build_content_sim_mh_text
+    :param table_max_hops: max joins between tables of the table reachability index, see write_table_reachability
+    :param precompute_table_paths: whether to store the join paths between tables in that index
+    :return:
+    """
+    start_all = time.time()
+    store = StoreHandler()
+    path = output_path
+
+    network = fieldnetwork.deserialize_network(path)
+    path_schsim = path + "/schema_sim_index.pkl"
+    schema_sim_index = io.deserialize_object(path_schsim)
+    path_cntsim = path + "/content_sim_index.pkl"
+    content_sim_index = io.deserialize_object(path_cntsim)
+    path_numsig = path + "/num_sig_index.pkl"
+    num_sig_index = io.deserialize_object(path_numsig)
+
+    fields = list(store.get_all_fields())
+    mh_signatures = store.get_all_mh_text_signatures()
+    id_sig = store.get_all_fields_num_signatures()
+    fields, mh_signatures, id_sig, removed = networkupdater.diff_profiles(network, content_sim_index,
+                                                                         num_sig_index, fields,
+                                                                         mh_signatures, id_sig)
+    print("Updating model: {0} new or changed fields, {1} removed fields".format(len(fields), len(removed)))
+    networkupdater.update_network(network, schema_sim_index, content_sim_index, num_sig_index,
+                                  fields=fields, mh_signatures=mh_signatures, id_sig=id_sig, removed=removed,
+                                  content_sim_min_score=content_sim_min_score)
+
+    fieldnetwork.serialize_network(network, path)
+    modelformat.write_model(network, path + "/" + modelformat.MODEL_FILE)
+    write_table_reachability(network, path, table_max_hops, precompute_table_paths)
+    io.serialize_object(schema_sim_index, path_schsim)
+    io.serialize_object(content_sim_index, path_cntsim)
+    io.serialize_object(num_sig_index, path_numsig)
+    print("Total update: {0}".format(str(time.time() - start_all)))
 
     print("DONE!")
 
@@ -158,16 +328,48 @@ if __name__ == "__main__":
     #test_content_sim_num()
     #exit()
 
-    path = None
-    if len(sys.argv) == 3:
-        path = sys.argv[2]
-
-    else:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--opath', help='Path where to store the model, must be writable by the process')
+    parser.add_argument('--schema_sim_mode', default='batch', choices=['batch', 'engine'],
+                        help='Build schema-sim over the whole TF-IDF matrix at once (batch) '
+                             'or one field at a time through the LSH engine (engine)')
+    parser.add_argument('--content_sim_min_score', type=float, default=0.7,
+                        help='Minimum estimated Jaccard or containment of minhash content-sim candidates')
+    parser.add_argument('--resume', action='store_true',
+                        help='Reuse the checkpoints in opath of stages whose inputs did not change')
+    parser.add_argument('--sequential', action='store_true',
+                        help='Run all stages in this process instead of in parallel worker processes')
+    parser.add_argument('--update', action='store_true',
+                        help='Update the model in opath with the fields added, changed or removed in the store '
+                             'since it was built, instead of building it again')
+    parser.add_argument('--table_max_hops', type=int, default=2,
+                        help='Max number of joins between tables whose distance is stored with the model')
+    parser.add_argument('--precompute_table_paths', action='store_true',
+                        help='Store the join paths of all pairs of tables at most --table_max_hops joins away')
+    parser.add_argument('--stages', type=lambda s: s.split(','),
+                        help='Comma separated stages to rebuild, the rest are loaded from their checkpoints. '
+                             'One of: ' + ','.join(checkpoints.STAGES))
+    args = parser.parse_args()
+
+    if args.opath is None:
         print("USAGE: ")
-        print("python networkbuildercoordinator.py --opath <path>")
+        print("python networkbuildercoordinator.py --opath <path> [--schema_sim_mode batch|engine] "
+              "[--content_sim_min_score <score>] [--resume] [--stages <stage,...>] [--sequential] [--update] "
+              "[--table_max_hops <hops>] [--precompute_table_paths]")
         print("where opath must be writable by the process")
         exit()
-    main(path)
+    if args.stages is not None:
+        unknown = [stage for stage in args.stages if stage not in checkpoints.STAGES]
+        if len(unknown) > 0:
+            parser.error("unknown stages: " + ','.join(unknown))
+    if args.update:
+        update(args.opath, content_sim_min_score=args.content_sim_min_score, table_max_hops=args.table_max_hops,
+               precompute_table_paths=args.precompute_table_paths)
+        exit()
+    main(args.opath, schema_sim_batch=(args.schema_sim_mode == 'batch'),
+         content_sim_min_score=args.content_sim_min_score, resume=args.resume, stages=args.stages,
+         parallel=not args.sequential, table_max_hops=args.table_max_hops,
+         precompute_table_paths=args.precompute_table_paths)
 
     #test_read_store()
 